@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from PIL import Image
+
+# needed for following usage:
+#  cd benchmark
+#  python bench_crop.py [-s DragonBaby] [-n 256]
+sys.path.insert(0, '../modules')
+
+from sample_generator import *
+from utils import *
+
+seq_home = '../dataset/OTB'
+
+
+def time_extractor(image, samples, batched, batch_size=256, repeat=3):
+    times = []
+    for _ in range(repeat):
+        tic = time.time()
+        extractor = RegionExtractor(image, samples, 107, 16, batch_size, batched=batched)
+        regions = np.concatenate([r.numpy() for r in extractor])
+        times.append(time.time() - tic)
+    return min(times), regions
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--seq', default='DragonBaby', help='input seq')
+    parser.add_argument('-n', '--n_samples', default=[256, 5000], type=int, nargs='+', help='samples per extraction')
+    parser.add_argument('-r', '--repeat', default=3, type=int)
+    args = parser.parse_args()
+
+    np.random.seed(123)
+
+    img_dir = os.path.join(seq_home, args.seq, 'img')
+    img_list = sorted(os.listdir(img_dir))
+    gt = np.loadtxt(os.path.join(seq_home, args.seq, 'groundtruth_rect.txt'), delimiter=',')
+    image = Image.open(os.path.join(img_dir, img_list[0])).convert('RGB')
+
+    for n in args.n_samples:
+        # same mix the tracker crops: candidates around the target, and negatives over the whole frame
+        samples = np.concatenate([
+            gen_samples(SampleGenerator('gaussian', image.size, 0.6, 1.05, valid=True), gt[0], n // 2),
+            gen_samples(SampleGenerator('whole', image.size, 0, 1.2, 1.1), gt[0], n - n // 2)])
+
+        legacy_time, legacy_regions = time_extractor(image, samples, False, repeat=args.repeat)
+        batched_time, batched_regions = time_extractor(image, samples, True, repeat=args.repeat)
+
+        diff = np.abs(legacy_regions - batched_regions)
+        print('%5d samples | crop_image: %.3f sec | crop_images: %.3f sec | speed-up x%.1f' %
+              (n, legacy_time, batched_time, legacy_time / batched_time))
+        print('              | pixel diff: mean %.3f, 99th percentile %.3f, max %.3f' %
+              (diff.mean(), np.percentile(diff, 99), diff.max()))
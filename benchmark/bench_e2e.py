@@ -0,0 +1,73 @@
+import os
+import sys
+import json
+import argparse
+import itertools
+import numpy as np
+
+import torch
+
+# needed for following usage:
+#  cd benchmark
+#  python bench_e2e.py [-n 300 1000] [-r 640x360 1280x720 1920x1080 3840x2160] [-tf 0.0625] [-v 4] [-oc 0] [-o e2e.json]
+# runs run_mdnet end to end over synthetic sequences (see synthetic.py) of every length x resolution,
+# and reports fps, per frame latency percentiles and accuracy
+sys.path.insert(0, '../modules')
+sys.path.insert(0, '../tracking')
+
+from synthetic import *
+import run_tracker as rt
+
+
+def run_sequence(tracker, img_list, gt, name):
+    np.random.seed(123)
+    torch.manual_seed(456)
+    rt.stage_timer.reset()
+    result = rt.run_mdnet(img_list, gt[0], gt=gt, seq_name=name, tracker=tracker)
+    num_images_tracked, spf_total, result_ious = result[2], result[3], result[5]
+    stages = rt.stage_timer.summary()
+    report = {'frames': num_images_tracked, 'fps': num_images_tracked / spf_total,
+              'accuracy': float(np.mean(result_ious)), 'stages': stages}
+    for q in [50, 95, 99]:
+        report['spf_p%d' % q] = stages['frame']['p%d' % q] / 1000
+    return report
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--n_frames', default=[300, 1000], type=int, nargs='+', help='sequence lengths')
+    parser.add_argument('-r', '--resolutions', default=['640x360', '1280x720', '1920x1080', '3840x2160'], nargs='+')
+    parser.add_argument('-tf', '--target_fraction', default=0.0625, type=float, help='target size / frame size')
+    parser.add_argument('-v', '--speed', default=4., type=float, help='target speed, pixels per frame')
+    parser.add_argument('-oc', '--occlusions', default=0, type=int, help='occlusions per sequence')
+    parser.add_argument('-d', '--data_dir', default='../dataset/synthetic')
+    parser.add_argument('-o', '--out', default='', help='json to save the reports to')
+    parser.add_argument('-dp', '--detailed_printing', action='store_true')
+    args = parser.parse_args()
+
+    # whole sequences, no display and no feature files
+    rt.fewer_images = False
+    rt.detailed_printing = args.detailed_printing
+    rt.load_features_from_file = False
+    rt.save_features_to_file = False
+    rt.init_after_loss = False
+    rt.gt_origin = None
+    tracker = rt.Tracker(rt.opts['model_path'], use_bbreg=rt.perform_refinement and rt.use_lin_reg)
+
+    reports = {}
+    for n_frames, resolution in itertools.product(args.n_frames, args.resolutions):
+        size = tuple(int(v) for v in resolution.split('x'))
+        target_size = tuple(int(round(v * args.target_fraction)) for v in size)
+        name = sequence_name(n_frames, size, target_size, args.speed, args.occlusions)
+        img_list, gt = make_sequence(os.path.join(args.data_dir, name), n_frames, size, target_size,
+                                     args.speed, args.occlusions)
+
+        report = run_sequence(tracker, img_list, gt, name)
+        reports[name] = report
+        print('%5d frames | %9s | %.2f fps | p50 %.3f p95 %.3f p99 %.3f sec | accuracy %.3f' %
+              (n_frames, resolution, report['fps'], report['spf_p50'], report['spf_p95'], report['spf_p99'],
+               report['accuracy']))
+
+    if args.out != '':
+        json.dump(reports, open(args.out, 'w'), indent=2)
@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+import resource
+import argparse
+import multiprocessing
+import numpy as np
+from PIL import Image
+
+import torch
+
+# needed for following usage:
+#  cd benchmark
+#  python bench_forward_samples.py [-s DragonBaby] [-n 500 5000] [-p 1 2] [-w 2]
+sys.path.insert(0, '../modules')
+sys.path.insert(0, '../tracking')
+
+from sample_generator import *
+from model import *
+from tracking_utils import *
+
+seq_home = '../dataset/OTB'
+
+
+def forward_samples_reference(model, image, samples, out_layer='conv3', is_cuda=None):
+    # forward_samples as it used to be: autograd enabled (fc params require grad) and torch.cat per batch
+    if is_cuda is None:
+        is_cuda = options.use_gpu()
+    model.eval()
+    extractor = RegionExtractor(image, samples, opts['img_size'], opts['padding'], opts['batch_test'],
+                                batched=opts['batched_crop'])
+    for i, regions in enumerate(extractor):
+        if is_cuda:
+            regions = regions.cuda()
+        feat = model(regions, out_layer=out_layer)
+        if i == 0:
+            feats = feat.data.clone()
+        else:
+            feats = torch.cat((feats, feat.data.clone()), 0)
+    return feats
+
+
+def rss_kb():
+    with open('/proc/self/statm') as fp:
+        return int(fp.read().split()[1]) * resource.getpagesize() // 1024
+
+
+def run_extraction(queue, forward, model, image, samples, out_layer):
+    # runs in a fresh child process, so its peak RSS belongs to this extraction only
+    start_rss = rss_kb()
+    tic = time.time()
+    feats = forward(model, image, samples, out_layer=out_layer)
+    elapsed = time.time() - tic
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((elapsed, max(peak_rss - start_rss, 0), tuple(feats.shape)))
+
+
+def measure(forward, model, image, samples, out_layer):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=run_extraction, args=(queue, forward, model, image, samples, out_layer))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--seq', default='DragonBaby', help='input seq')
+    parser.add_argument('-n', '--n_samples', default=[opts['n_pos_init'], opts['n_neg_init']], type=int, nargs='+')
+    parser.add_argument('-l', '--out_layer', default='conv3')
+    parser.add_argument('-p', '--prefetch', default=[1, 2], type=int, nargs='*', help='prefetch depths to compare')
+    parser.add_argument('-w', '--workers', default=opts['crop_workers'], type=int, help='cropping threads')
+    args = parser.parse_args()
+
+    multiprocessing.set_start_method('fork')
+    opts['crop_workers'] = args.workers
+    np.random.seed(123)
+
+    img_dir = os.path.join(seq_home, args.seq, 'img')
+    img_list = sorted(os.listdir(img_dir))
+    gt = np.loadtxt(os.path.join(seq_home, args.seq, 'groundtruth_rect.txt'), delimiter=',')
+    image = Image.open(os.path.join(img_dir, img_list[0])).convert('RGB')
+
+    # as during tracking, fc layers are learnable
+    model = MDNet()
+    model.set_learnable_params(opts['ft_layers'])
+
+    for n in args.n_samples:
+        samples = gen_samples(SampleGenerator('uniform', image.size, 1, 2, 1.1), gt[0], n)
+        variants = [('reference', forward_samples_reference, 0), ('forward_samples', forward_samples, 0)]
+        variants += [('prefetch %d' % depth, forward_samples, depth) for depth in args.prefetch]
+        for name, forward, depth in variants:
+            opts['prefetch_batches'] = depth
+            elapsed, peak_kb, shape = measure(forward, model, image, samples, args.out_layer)
+            print('%5d samples | %-15s | %.3f sec | peak RSS +%.1f MB | output %s' %
+                  (n, name, elapsed, peak_kb / 1024., shape))
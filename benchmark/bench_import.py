@@ -0,0 +1,96 @@
+import os
+import sys
+import json
+import argparse
+import platform
+import subprocess
+import numpy as np
+
+# needed for following usage:
+#  cd benchmark
+#  python bench_import.py [-m run_tracker] [-r 5] [-k 15]           # time the import, and its slowest modules
+#  python bench_import.py -s [-o import_baseline.json]               # ... and save it as the baseline
+#  python bench_import.py -c [-o import_baseline.json] [-t 0.2]      # ... and compare with the baseline
+# imports the module in fresh interpreters (python -X importtime, from its directory) and reports the
+# wall time of the import and the modules with the largest cumulative import times.
+# exits with status 1 if a module that must stay lazy (matplotlib, shapely, sklearn, ...) is imported, if the
+# import created a CUDA context (the gpu is probed on first use, see options.use_gpu()), or, comparing, if the
+# import got slower than the baseline by more than the threshold
+modules_dirs = {'run_tracker': '../tracking', 'tracker': '../tracking', 'multi_tracker': '../tracking',
+                'run_multi_tracker': '../tracking', 'train_mdnet': '../pretrain'}
+
+# imported only by the features that need them (display, quadrilateral IoU, bbox regression fit, .mat models)
+lazy_modules = ['matplotlib', 'cycler', 'shapely', 'sklearn', 'scipy.io']
+
+# the import statement, without loading anything heavy of its own (torch is checked after the timing)
+import_timer = 'import time; tic = time.perf_counter(); import %s; print("import_seconds", time.perf_counter() - tic); ' \
+               'import torch; print("cuda_initialized", torch.cuda.is_initialized())'
+
+
+def import_times(module, cwd):
+    # (wall seconds of the import, {module: (self us, cumulative us)}, whether it created a CUDA context) of one
+    # fresh interpreter
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', import_timer % module], cwd=cwd,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if result.returncode != 0:
+        raise RuntimeError('importing %s failed:\n%s' % (module, result.stderr[-2000:]))
+    seconds = float([line for line in result.stdout.splitlines() if line.startswith('import_seconds')][-1].split()[1])
+    cuda_initialized = [line for line in result.stdout.splitlines() if line.startswith('cuda_initialized')][-1].split()[1] == 'True'
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return seconds, modules, cuda_initialized
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-m', '--module', default='run_tracker', help='module to import (%s)' % ', '.join(modules_dirs))
+    parser.add_argument('-r', '--repeats', default=5, type=int)
+    parser.add_argument('-k', '--top', default=15, type=int, help='slowest modules to list')
+    parser.add_argument('-o', '--baseline', default='import_baseline.json', help='baseline json')
+    parser.add_argument('-s', '--save', action='store_true', help='save the timing as the baseline')
+    parser.add_argument('-c', '--compare', action='store_true', help='compare the timing with the baseline')
+    parser.add_argument('-t', '--threshold', default=0.2, type=float, help='slowdown over the baseline reported as regression')
+    args = parser.parse_args()
+
+    cwd = os.path.abspath(modules_dirs.get(args.module, '../tracking'))
+    runs = [import_times(args.module, cwd) for _ in range(args.repeats)]
+    seconds = [run[0] for run in runs]
+    median = float(np.median(seconds))
+    modules = runs[int(np.argsort(seconds)[len(seconds) // 2])][1]
+
+    print('import %s | median %.3f s | min %.3f s | %d modules' % (args.module, median, min(seconds), len(modules)))
+    for name, (self_us, cumulative_us) in sorted(modules.items(), key=lambda item: -item[1][1])[:args.top]:
+        print('  %-40s | cumulative %8.1f ms | self %8.1f ms' % (name, cumulative_us / 1000, self_us / 1000))
+
+    failed = False
+    eager = [name for name in lazy_modules if name in modules]
+    if len(eager) > 0:
+        print('imported at startup, but should be imported on use only: ' + ', '.join(eager))
+        failed = True
+    if any(run[2] for run in runs):
+        print('the import created a CUDA context (the gpu must be probed on first use only)')
+        failed = True
+
+    if args.compare:
+        baseline = json.load(open(args.baseline))
+        if args.module in baseline['results']:
+            ratio = median / baseline['results'][args.module]['median_s']
+            print('x%.2f of baseline' % ratio)
+            if ratio > 1 + args.threshold:
+                print('REGRESSION: import slower than the baseline by more than %.0f%%' % (args.threshold * 100))
+                failed = True
+
+    if args.save:
+        baseline = json.load(open(args.baseline)) if os.path.isfile(args.baseline) else \
+            {'python': platform.python_version(), 'machine': platform.processor() or platform.machine(), 'results': {}}
+        baseline['results'][args.module] = {'median_s': median, 'min_s': min(seconds), 'modules': len(modules)}
+        json.dump(baseline, open(args.baseline, 'w'), indent=2)
+        print('baseline saved to ' + args.baseline)
+
+    if failed:
+        sys.exit(1)
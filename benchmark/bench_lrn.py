@@ -0,0 +1,81 @@
+import sys
+import time
+import argparse
+import numpy as np
+
+import torch
+
+# needed for following usage:
+#  cd benchmark
+#  python bench_lrn.py [-b 256] [-r 5] [-nt 1]
+# checks that the LRN backends give the reference results (forward, and gradient of the input),
+# and times them at the conv1 and conv2 activation shapes of MDNet
+sys.path.insert(0, '../modules')
+sys.path.insert(0, '../tracking')
+
+from model import *
+
+# (channels, height, width) after the ReLU of conv1 and conv2, for 107x107 crops
+shapes = {'conv1': (96, 51, 51), 'conv2': (256, 11, 11)}
+
+
+def check(backend, x):
+    # max abs difference to the reference of the output and of the input gradient, and whether both are equal
+    reference = LRN('reference')
+    lrn = LRN(backend)
+    with torch.no_grad():
+        y_ref = reference(x)
+        y = lrn(x)
+    x_ref = x.clone().requires_grad_()
+    x_grad = x.clone().requires_grad_()
+    grad_out = torch.randn_like(x)
+    reference(x_ref).backward(grad_out)
+    y_grad = lrn(x_grad)
+    y_grad.backward(grad_out)
+    diff = max((y - y_ref).abs().max().item(), (y_grad - y_ref).abs().max().item())
+    grad_diff = (x_grad.grad - x_ref.grad).abs().max().item()
+    equal = torch.equal(y, y_ref) and torch.equal(y_grad.detach(), y_ref) and torch.equal(x_grad.grad, x_ref.grad)
+    return diff, grad_diff, equal
+
+
+def time_forward(backend, x, repeats):
+    lrn = LRN(backend)
+    times = []
+    with torch.no_grad():
+        lrn(x)
+        for _ in range(repeats):
+            tic = time.perf_counter()
+            lrn(x)
+            times.append(time.perf_counter() - tic)
+    return np.median(times) * 1000
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', '--batch', default=256, type=int)
+    parser.add_argument('-r', '--repeats', default=5, type=int)
+    parser.add_argument('-nt', '--num_threads', default=1, type=int, help='torch threads')
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.num_threads)
+    torch.manual_seed(456)
+
+    failed = False
+    for layer, shape in shapes.items():
+        # conv outputs after ReLU, with some large values so the normalization matters
+        x = torch.relu(torch.randn((args.batch,) + shape) * 30)
+        check_x = x[:8]
+        reference_ms = None
+        for backend in LRN.backends:
+            diff, grad_diff, equal = check(backend, check_x)
+            ms = time_forward(backend, x, args.repeats)
+            reference_ms = ms if backend == 'reference' else reference_ms
+            print('%s %s | %-9s | %9.2f ms | max diff %.2e, grad %.2e | %s' %
+                  (layer, (args.batch,) + shape, backend, ms, diff, grad_diff, 'bitwise equal' if equal else 'not equal'))
+            # fast must match the reference exactly, torch up to float rounding
+            if (backend == 'fast' and not equal) or diff > 1e-5 * x.abs().max().item():
+                failed = True
+    if failed:
+        print('LRN backends differ from the reference')
+        sys.exit(1)
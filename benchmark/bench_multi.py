@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from PIL import Image
+
+import torch
+
+# needed for following usage:
+#  cd benchmark
+#  python bench_multi.py [-s DragonBaby] [-t 1 2 4] [-n 10]
+sys.path.insert(0, '../modules')
+sys.path.insert(0, '../tracking')
+
+from tracker import *
+from multi_tracker import *
+
+seq_home = '../dataset/OTB'
+
+
+def target_bboxes(bbox, image_size, n):
+    # the given target, and n-1 boxes of its size at other places of the frame
+    bboxes = [bbox]
+    for _ in range(n - 1):
+        x = np.random.uniform(0, max(image_size[0] - bbox[2], 1))
+        y = np.random.uniform(0, max(image_size[1] - bbox[3], 1))
+        bboxes.append(np.array([x, y, bbox[2], bbox[3]]))
+    return np.array(bboxes)
+
+
+def time_trackers(img_list, bboxes):
+    # one Tracker per target, every frame is decoded once and given to all of them
+    trackers = [Tracker(opts['model_path']) for _ in bboxes]
+    image = Image.open(img_list[0]).convert('RGB')
+    tic = time.time()
+    for tracker, bbox in zip(trackers, bboxes):
+        tracker.init(image, bbox)
+    init_time = time.time() - tic
+    times = []
+    for img_path in img_list[1:]:
+        image = Image.open(img_path).convert('RGB')
+        tic = time.time()
+        for tracker in trackers:
+            tracker.update(image)
+        times.append(time.time() - tic)
+    return init_time, times
+
+
+def time_multi_tracker(img_list, bboxes):
+    tracker = MultiTracker(opts['model_path'])
+    image = Image.open(img_list[0]).convert('RGB')
+    tic = time.time()
+    tracker.init(image, bboxes)
+    init_time = time.time() - tic
+    times = []
+    for img_path in img_list[1:]:
+        image = Image.open(img_path).convert('RGB')
+        tic = time.time()
+        tracker.update(image)
+        times.append(time.time() - tic)
+    return init_time, times
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--seq', default='DragonBaby', help='input seq')
+    parser.add_argument('-t', '--n_targets', default=[1, 2, 4], type=int, nargs='+')
+    parser.add_argument('-n', '--n_frames', default=10, type=int, help='frames to track')
+    args = parser.parse_args()
+
+    np.random.seed(123)
+    torch.manual_seed(456)
+
+    img_dir = os.path.join(seq_home, args.seq, 'img')
+    img_list = [os.path.join(img_dir, x) for x in sorted(os.listdir(img_dir))][:args.n_frames + 1]
+    gt = np.loadtxt(os.path.join(seq_home, args.seq, 'groundtruth_rect.txt'), delimiter=',')
+    image_size = Image.open(img_list[0]).size
+
+    for n in args.n_targets:
+        bboxes = target_bboxes(gt[0], image_size, n)
+        for name, run in [('Tracker x %d' % n, time_trackers), ('MultiTracker', time_multi_tracker)]:
+            init_time, times = run(img_list, bboxes)
+            print('%d targets | %-13s | init %.3f sec | frame mean %.3f sec, max %.3f sec' %
+                  (n, name, init_time, np.mean(times), np.max(times)))
@@ -0,0 +1,106 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from PIL import Image
+
+import torch
+
+# needed for following usage:
+#  cd benchmark
+#  python bench_quantized.py [-s DragonBaby] [-n 0] [-c 10] [-r 3] [-nt 1]
+# times the float and int8 (see MDNet.quantize) forwards of MDNet and RegNet, and tracks the sequence
+# with both to report the speed versus accuracy (IoU with the ground truth) cost of int8 inference
+sys.path.insert(0, '../modules')
+sys.path.insert(0, '../tracking')
+
+from tracker import *
+from quantize_model import *
+import options
+
+seq_home = '../dataset/OTB'
+
+
+def time_forward(forward, x, repeats):
+    with torch.no_grad():
+        forward(x)
+        tic = time.perf_counter()
+        for _ in range(repeats):
+            forward(x)
+    return (time.perf_counter() - tic) / repeats * 1000
+
+
+def track(img_list, gt):
+    # mean IoU and fps of a Tracker over img_list (built with the current opts)
+    np.random.seed(123)
+    torch.manual_seed(456)
+    tracker = Tracker(opts['model_path'])
+    tracker.init(Image.open(img_list[0]).convert('RGB'), gt[0])
+    ious = [1.]
+    spf_total = 0
+    for i in range(1, len(img_list)):
+        image = Image.open(img_list[i]).convert('RGB')
+        tic = time.time()
+        bbox = tracker.update(image)
+        spf_total += time.time() - tic
+        ious.append(overlap_ratio(bbox, gt[i])[0])
+    return np.mean(ious), (len(img_list) - 1) / spf_total
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--seq', default='DragonBaby', help='input seq')
+    parser.add_argument('-n', '--n_frames', default=0, type=int, help='frames to track (0 - all)')
+    parser.add_argument('-c', '--calibration_frames', default=10, type=int)
+    parser.add_argument('-r', '--repeats', default=3, type=int)
+    parser.add_argument('-nt', '--num_threads', default=1, type=int, help='torch threads')
+    parser.add_argument('-q', '--quantized_path', default='/tmp/mdnet_int8.pth', help='where to save the calibrated model')
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.num_threads)
+    opts['use_gpu'] = False
+    np.random.seed(123)
+
+    img_dir = os.path.join(seq_home, args.seq, 'img')
+    img_list = [os.path.join(img_dir, x) for x in sorted(os.listdir(img_dir))]
+    gt = np.loadtxt(os.path.join(seq_home, args.seq, 'groundtruth_rect.txt'), delimiter=',')
+    img_list = img_list[:min(len(img_list), len(gt))]
+    if args.n_frames > 0:
+        img_list = img_list[:args.n_frames + 1]
+
+    # calibrated on frames spread over the sequence
+    frames = np.linspace(0, len(img_list) - 1, args.calibration_frames).astype(int)
+    regions = calibration_regions([img_list[i] for i in frames], gt[frames])
+    model = MDNet(opts['model_path']).eval()
+    quantized = MDNet().eval()
+    quantized.load_state_dict(model.state_dict())  # (the same fc6 too)
+    quantized.quantize(regions)
+    quantized.save_quantized(args.quantized_path)
+
+    # forwards at the batch size of scoring the candidates of a frame
+    crops = regions[:opts['batch_test']]
+    with torch.no_grad():
+        feats = model(crops, out_layer='conv3')
+    forwards = [('conv1-conv3', lambda x: model(x, out_layer='conv3'), lambda x: quantized(x, out_layer='conv3'), crops),
+                ('fc4-fc6', lambda x: model(x, in_layer='fc4'), lambda x: quantized(x, in_layer='fc4'), feats)]
+    regnet = RegNet().eval()
+    regnet_int8 = quantize_linears(regnet)
+    regnet_input = torch.cat((feats[:5], feats[:1].expand(5, -1), torch.rand(5, 4) * opts['img_size']), dim=1)
+    forwards.append(('RegNet', regnet, regnet_int8, regnet_input))
+    for name, float_forward, int8_forward, x in forwards:
+        float_ms = time_forward(float_forward, x, args.repeats)
+        int8_ms = time_forward(int8_forward, x, args.repeats)
+        with torch.no_grad():
+            y, y_int8 = float_forward(x), int8_forward(x)
+        print('%-12s | batch %3d | float %9.2f ms | int8 %9.2f ms | x%.2f | relative error %.4f' %
+              (name, len(x), float_ms, int8_ms, float_ms / int8_ms, ((y_int8 - y).norm() / y.norm()).item()))
+
+    # (the options module Tracker reads)
+    options.tracking_opts['quantized_model_path'] = args.quantized_path
+    for quantize in [False, True]:
+        options.tracking_opts['quantized'] = quantize
+        accuracy, fps = track(img_list, gt)
+        print('%s tracking | %d frames | %.3f fps | mean IoU %.3f' %
+              ('int8 ' if quantize else 'float', len(img_list) - 1, fps, accuracy))
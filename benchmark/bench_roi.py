@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from PIL import Image
+
+import torch
+
+# needed for following usage:
+#  cd benchmark
+#  python bench_roi.py [-s DragonBaby] [-n 30]
+sys.path.insert(0, '../modules')
+sys.path.insert(0, '../tracking')
+
+from sample_generator import *
+from model import *
+from FocalLoss import *
+from tracking_utils import *
+
+seq_home = '../dataset/OTB'
+
+
+def init_tracker(model, image, bbox, n_pos, n_neg):
+    # first frame training, as in run_mdnet
+    pos_examples = gen_samples(SampleGenerator('gaussian', image.size, 0.1, 1.2),
+                               bbox, n_pos, opts['overlap_pos_init'])
+    neg_examples = gen_samples(SampleGenerator('uniform', image.size, 1, 2, 1.1),
+                               bbox, n_neg, opts['overlap_neg_init'])
+    pos_feats = forward_samples(model, image, pos_examples)
+    neg_feats = forward_samples(model, image, neg_examples)
+
+    criterion = FocalLoss(class_num=2, alpha=torch.ones(2, 1) * 0.25, size_average=False)
+    optimizer = set_optimizer(model, opts['lr_init'])
+    train(model, criterion, optimizer, pos_feats, neg_feats, opts['maxiter_init'])
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--seq', default='DragonBaby', help='input seq')
+    parser.add_argument('-n', '--n_frames', default=0, type=int, help='frames to track (0 - all)')
+    parser.add_argument('-m', '--model_path', default=opts['model_path'])
+    parser.add_argument('--n_pos', default=100, type=int, help='positive samples for first frame training')
+    parser.add_argument('--n_neg', default=1000, type=int, help='negative samples for first frame training')
+    args = parser.parse_args()
+
+    np.random.seed(123)
+    torch.manual_seed(456)
+
+    img_dir = os.path.join(seq_home, args.seq, 'img')
+    img_list = [os.path.join(img_dir, x) for x in sorted(os.listdir(img_dir))]
+    gt = np.loadtxt(os.path.join(seq_home, args.seq, 'groundtruth_rect.txt'), delimiter=',')
+    num_images = min(len(img_list), len(gt))
+    if args.n_frames > 0:
+        num_images = min(num_images, args.n_frames + 1)
+
+    if os.path.isfile(args.model_path):
+        model = MDNet(args.model_path)
+    else:
+        print('no model in %s - using random conv weights, accuracy numbers are only indicative' % args.model_path)
+        model = MDNet()
+    if options.use_gpu():
+        model = model.cuda()
+    model.set_learnable_params(opts['ft_layers'])
+
+    image = Image.open(img_list[0]).convert('RGB')
+    init_tracker(model, image, gt[0], args.n_pos, args.n_neg)
+
+    # each mode tracks on its own (no online updates), and both score the same candidates
+    # of the crop-mode target, to compare the scores themselves
+    modes = {'crop': forward_samples, 'roi': forward_samples_roi}
+    target_bbox = {mode: gt[0].copy() for mode in modes}
+    times = {mode: [] for mode in modes}
+    ious = {mode: [] for mode in modes}
+    score_corr = []
+    sample_generator = SampleGenerator('gaussian', image.size, opts['trans_f'], opts['scale_f'], valid=True)
+
+    for i in range(1, num_images):
+        image = Image.open(img_list[i]).convert('RGB')
+        for mode, forward in modes.items():
+            samples = gen_samples(sample_generator, target_bbox[mode], opts['n_samples'])
+            tic = time.time()
+            sample_scores = forward(model, image, samples, out_layer='fc6')
+            times[mode].append(time.time() - tic)
+
+            top_scores, top_idx = sample_scores[:, 1].topk(5)
+            target_bbox[mode] = samples[top_idx.cpu().numpy()].mean(axis=0)
+            ious[mode].append(overlap_ratio(target_bbox[mode], gt[i])[0])
+
+            if mode == 'crop':
+                roi_scores = forward_samples_roi(model, image, samples, out_layer='fc6')
+                score_corr.append(np.corrcoef(sample_scores[:, 1].cpu().numpy(), roi_scores[:, 1].cpu().numpy())[0, 1])
+
+        print('  frame %d/%d | crop: IoU %.3f, %.3f sec | roi: IoU %.3f, %.3f sec' %
+              (i, num_images - 1, ious['crop'][-1], times['crop'][-1], ious['roi'][-1], times['roi'][-1]))
+
+    print('')
+    for mode in modes:
+        print('%-4s | scoring %.1f fps (mean %.4f sec/frame) | mean IoU %.3f' %
+              (mode, 1 / np.mean(times[mode]), np.mean(times[mode]), np.mean(ious[mode])))
+    print('score correlation (roi vs crop, same candidates): %.3f' % np.mean(score_corr))
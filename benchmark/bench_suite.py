@@ -0,0 +1,294 @@
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+import platform
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+
+import torch
+
+# needed for following usage:
+#  cd benchmark
+#  python bench_suite.py [-b name ...] [-r 5] [-nt 1]             # time the primitives
+#  python bench_suite.py -s [-o baseline.json]                     # ... and save them as the baseline
+#  python bench_suite.py -c [-o baseline.json] [-t 0.1]            # ... and compare with the baseline
+# times the hot primitives of the tracker on the first frames of a sequence, CPU only.
+# a random MDNet is used (the timings do not depend on the weights), so no model file is needed.
+# comparing exits with status 1 if a primitive got slower than the baseline by more than the threshold
+sys.path.insert(0, '../modules')
+sys.path.insert(0, '../tracking')
+
+from sample_generator import *
+from model import *
+from bbreg import *
+from FocalLoss import *
+from tracking_utils import *
+
+seq_home = '../dataset/OTB'
+
+# benchmark name -> function(setup) returning the callable to time
+benchmarks = OrderedDict()
+
+
+def benchmark(name):
+    def register(fn):
+        benchmarks[name] = fn
+        return fn
+    return register
+
+
+class Setup():
+    # inputs shared by the benchmarks: a frame, its target and samples of the sizes used while tracking
+    def __init__(self, seq):
+        img_dir = os.path.join(seq_home, seq, 'img')
+        img_list = sorted(os.listdir(img_dir))
+        gt = np.loadtxt(os.path.join(seq_home, seq, 'groundtruth_rect.txt'), delimiter=',')
+        self.image = Image.open(os.path.join(img_dir, img_list[0])).convert('RGB')
+        self.bbox = gt[0]
+
+        np.random.seed(123)
+        torch.manual_seed(456)
+        self.model = MDNet()
+        self.model.set_learnable_params(opts['ft_layers'])
+        self.criterion = FocalLoss(class_num=2, alpha=torch.ones(2, 1) * 0.25, size_average=False)
+
+        # candidates of a frame, and the pos/neg training samples of the first frame
+        self.samples = gen_samples(SampleGenerator('gaussian', self.image.size, opts['trans_f'], opts['scale_f'],
+                                                   valid=True), self.bbox, opts['n_samples'])
+        self.pos_examples = gen_samples(SampleGenerator('gaussian', self.image.size, 0.1, 1.2), self.bbox,
+                                        opts['n_pos_init'], opts['overlap_pos_init'])
+        self.neg_examples = gen_samples(SampleGenerator('uniform', self.image.size, 1, 2, 1.1), self.bbox,
+                                        opts['n_neg_init'], opts['overlap_neg_init'])
+        self.bbreg_examples = gen_samples(SampleGenerator('uniform', self.image.size, 0.3, 1.5, 1.1), self.bbox,
+                                          opts['n_bbreg'], opts['overlap_bbreg'], opts['scale_bbreg'])
+
+        self.regions = RegionExtractor(self.image, self.samples, opts['img_size'], opts['padding'],
+                                       opts['batch_test']).extract_regions(np.arange(opts['batch_test']))
+        self.regions = torch.from_numpy(self.regions)
+        with torch.no_grad():
+            self.conv1 = self.model.layers[0][:2](self.regions)
+            self.feats = self.model(self.regions, out_layer='conv3')
+        self.bbreg_feats = forward_samples(self.model, self.image, self.bbreg_examples)
+        self.pos_feats = forward_samples(self.model, self.image, self.pos_examples[:opts['batch_test']])
+        self.neg_feats = forward_samples(self.model, self.image, self.neg_examples[:4 * opts['batch_test']])
+
+
+@benchmark('crop_image')
+def bench_crop_image(setup):
+    image = np.asarray(setup.image)
+    return lambda: [crop_image(image, sample, opts['img_size'], opts['padding']) for sample in setup.samples]
+
+
+@benchmark('RegionExtractor')
+def bench_region_extractor(setup):
+    def run():
+        for _ in RegionExtractor(setup.image, setup.samples, opts['img_size'], opts['padding'], opts['batch_test']):
+            pass
+    return run
+
+
+@benchmark('LRN.forward')
+def bench_lrn(setup):
+    lrn = LRN()
+    return lambda: lrn(setup.conv1)
+
+
+@benchmark('MDNet.forward conv1')
+def bench_forward_conv1(setup):
+    setup.model.eval()
+
+    def run():
+        with torch.no_grad():
+            setup.model(setup.regions, out_layer='fc6')
+    return run
+
+
+@benchmark('MDNet.forward fc4')
+def bench_forward_fc4(setup):
+    setup.model.eval()
+
+    def run():
+        with torch.no_grad():
+            setup.model(setup.feats, in_layer='fc4', out_layer='fc6')
+    return run
+
+
+def compiled_model(setup):
+    # a copy of the model with the TorchScript inference forwards (MDNet.compile_inference)
+    model = copy.deepcopy(setup.model)
+    model.compile_inference('trace', opts['img_size'])
+    return model.eval()
+
+
+@benchmark('MDNet.forward conv1 compiled')
+def bench_forward_conv1_compiled(setup):
+    model = compiled_model(setup)
+
+    def run():
+        with torch.no_grad():
+            model(setup.regions, out_layer='fc6')
+    return run
+
+
+@benchmark('MDNet.forward fc4 compiled')
+def bench_forward_fc4_compiled(setup):
+    model = compiled_model(setup)
+
+    def run():
+        with torch.no_grad():
+            model(setup.feats, in_layer='fc4', out_layer='fc6')
+    return run
+
+
+def regnet_inputs(setup, n=64):
+    # n samples of the frame refined at once by RegNet: their features, the full frame features, the boxes
+    frame_feats = setup.feats[:1]
+    boxes = torch.from_numpy(setup.samples[:n]).float() * opts['img_size'] / max(setup.image.size)
+    return setup.feats[:n], frame_feats, boxes
+
+
+@benchmark('RegNet.forward')
+def bench_regnet(setup):
+    regnet = RegNet().eval()
+    sample_feats, frame_feats, boxes = regnet_inputs(setup)
+
+    def run():
+        with torch.no_grad():
+            regnet(torch.cat((sample_feats, frame_feats.expand(sample_feats.shape), boxes), dim=1))
+    return run
+
+
+@benchmark('RegNet.forward_split')
+def bench_regnet_split(setup):
+    regnet = RegNet().eval()
+    sample_feats, frame_feats, boxes = regnet_inputs(setup)
+
+    def run():
+        with torch.no_grad():
+            regnet.forward_split(sample_feats, frame_feats, boxes)
+    return run
+
+
+@benchmark('forward_samples')
+def bench_forward_samples(setup):
+    return lambda: forward_samples(setup.model, setup.image, setup.samples, out_layer='fc6')
+
+
+@benchmark('train')
+def bench_train(setup):
+    optimizer = set_optimizer(setup.model, opts['lr_update'])
+    return lambda: train(setup.model, setup.criterion, optimizer, setup.pos_feats, setup.neg_feats,
+                         opts['maxiter_update'])
+
+
+@benchmark('gen_samples')
+def bench_gen_samples(setup):
+    generator = SampleGenerator('uniform', setup.image.size, 1, 2, 1.1)
+    return lambda: gen_samples(generator, setup.bbox, opts['n_neg_init'], opts['overlap_neg_init'])
+
+
+@benchmark('gen_samples bbreg')
+def bench_gen_samples_bbreg(setup):
+    generator = SampleGenerator('uniform', setup.image.size, 0.3, 1.5, 1.1)
+    return lambda: gen_samples(generator, setup.bbox, opts['n_bbreg'], opts['overlap_bbreg'], opts['scale_bbreg'])
+
+
+@benchmark('gen_samples_batch')
+def bench_gen_samples_batch(setup):
+    # the pos samples of a pretraining batch of 8 frames, one call for all of them
+    generator = SampleGenerator('gaussian', setup.image.size, 0.1, 1.2, 1.1, True)
+    bboxes = np.tile(setup.bbox, (8, 1))
+    return lambda: gen_samples_batch(generator, bboxes, opts['n_pos_update'], opts['overlap_pos_update'])
+
+
+@benchmark('overlap_ratio')
+def bench_overlap_ratio(setup):
+    return lambda: overlap_ratio(setup.neg_examples, setup.bbox)
+
+
+@benchmark('BBRegressor.train')
+def bench_bbreg_train(setup):
+    def run():
+        BBRegressor(setup.image.size).train(setup.bbreg_feats, setup.bbreg_examples, setup.bbox)
+    return run
+
+
+@benchmark('BBRegressor.predict')
+def bench_bbreg_predict(setup):
+    bbreg = BBRegressor(setup.image.size)
+    bbreg.train(setup.bbreg_feats, setup.bbreg_examples, setup.bbox)
+    return lambda: bbreg.predict(setup.bbreg_feats[:5], setup.bbreg_examples[:5])
+
+
+def time_benchmark(run, repeats, warmup=1):
+    # median and min of repeats runs, in ms
+    for _ in range(warmup):
+        run()
+    times = []
+    for _ in range(repeats):
+        tic = time.perf_counter()
+        run()
+        times.append((time.perf_counter() - tic) * 1000)
+    return float(np.median(times)), float(np.min(times))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-sq', '--seq', default='DragonBaby', help='input seq')
+    parser.add_argument('-b', '--benchmarks', nargs='+', default=list(benchmarks.keys()), help='benchmarks to run')
+    parser.add_argument('-r', '--repeats', default=5, type=int)
+    parser.add_argument('-nt', '--num_threads', default=1, type=int, help='torch threads')
+    parser.add_argument('-o', '--baseline', default='baseline.json', help='baseline json')
+    parser.add_argument('-s', '--save', action='store_true', help='save the timings as the baseline')
+    parser.add_argument('-c', '--compare', action='store_true', help='compare the timings with the baseline')
+    parser.add_argument('-t', '--threshold', default=0.1, type=float, help='slowdown over the baseline reported as regression')
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.num_threads)
+    opts['use_gpu'] = False
+    setup = Setup(args.seq)
+
+    baseline = None
+    if args.compare:
+        baseline = json.load(open(args.baseline))
+        if baseline['num_threads'] != args.num_threads:
+            print('warning: baseline timed with %d threads' % baseline['num_threads'])
+
+    results = OrderedDict()
+    regressions = []
+    skipped = []
+    for name in args.benchmarks:
+        try:
+            median, best = time_benchmark(benchmarks[name](setup), args.repeats)
+        except ImportError as e:
+            # a dependency of the benchmark (e.g. of a reference implementation) is missing here
+            print('%-28s | skipped: %s' % (name, e))
+            skipped.append(name)
+            continue
+        results[name] = {'median_ms': median, 'min_ms': best}
+        line = '%-28s | median %10.3f ms | min %10.3f ms' % (name, median, best)
+        if baseline is not None and name in baseline['results']:
+            ratio = median / baseline['results'][name]['median_ms']
+            line += ' | x%.2f of baseline' % ratio
+            if ratio > 1 + args.threshold:
+                line += ' REGRESSION'
+                regressions.append(name)
+        print(line)
+
+    if args.save:
+        json.dump({'seq': args.seq, 'num_threads': args.num_threads, 'repeats': args.repeats,
+                   'torch': torch.__version__, 'machine': platform.processor() or platform.machine(),
+                   'results': results}, open(args.baseline, 'w'), indent=2)
+        print('baseline saved to ' + args.baseline)
+
+    if len(skipped) > 0:
+        print('%d skipped: %s' % (len(skipped), ', '.join(skipped)))
+
+    if len(regressions) > 0:
+        print('%d regressions over %.0f%%: %s' % (len(regressions), args.threshold * 100, ', '.join(regressions)))
+        sys.exit(1)
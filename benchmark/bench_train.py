@@ -0,0 +1,138 @@
+import os
+import sys
+import copy
+import time
+import argparse
+import numpy as np
+from PIL import Image
+
+import torch
+from torch.autograd import Variable
+
+# needed for following usage:
+#  cd benchmark
+#  python bench_train.py [-s DragonBaby] [-r 3]
+sys.path.insert(0, '../modules')
+sys.path.insert(0, '../tracking')
+
+from sample_generator import *
+from model import *
+from FocalLoss import *
+from tracking_utils import *
+
+seq_home = '../dataset/OTB'
+
+
+def train_reference(model, criterion, optimizer, pos_feats, neg_feats, maxiter, in_layer='fc4'):
+    # train as it used to be (loss_index 1): concatenated permutations, numpy target per
+    # iteration and hard negative mining in batch_test sized forwards
+    model.train()
+
+    batch_pos = opts['batch_pos']
+    batch_neg = opts['batch_neg']
+    batch_test = opts['batch_test']
+    batch_neg_cand = max(opts['batch_neg_cand'], batch_neg)
+
+    pos_idx = np.random.permutation(pos_feats.size(0))
+    neg_idx = np.random.permutation(neg_feats.size(0))
+    while len(pos_idx) < batch_pos * maxiter:
+        pos_idx = np.concatenate([pos_idx, np.random.permutation(pos_feats.size(0))])
+    while len(neg_idx) < batch_neg_cand * maxiter:
+        neg_idx = np.concatenate([neg_idx, np.random.permutation(neg_feats.size(0))])
+    pos_pointer = 0
+    neg_pointer = 0
+
+    for iter in range(maxiter):
+        pos_next = pos_pointer + batch_pos
+        pos_cur_idx = pos_feats.new(pos_idx[pos_pointer:pos_next]).long()
+        pos_pointer = pos_next
+
+        neg_next = neg_pointer + batch_neg_cand
+        neg_cur_idx = neg_feats.new(neg_idx[neg_pointer:neg_next]).long()
+        neg_pointer = neg_next
+
+        batch_pos_feats = Variable(pos_feats.index_select(0, pos_cur_idx))
+        batch_neg_feats = Variable(neg_feats.index_select(0, neg_cur_idx))
+
+        if batch_neg_cand > batch_neg:
+            model.eval()
+            for start in range(0, batch_neg_cand, batch_test):
+                end = min(start + batch_test, batch_neg_cand)
+                score = model(batch_neg_feats[start:end], in_layer=in_layer)
+                if start == 0:
+                    neg_cand_score = score.data[:, 1].clone()
+                else:
+                    neg_cand_score = torch.cat((neg_cand_score, score.data[:, 1].clone()), 0)
+
+            _, top_idx = neg_cand_score.topk(batch_neg)
+            batch_neg_feats = batch_neg_feats.index_select(0, Variable(top_idx))
+            model.train()
+
+        pos_score = model(batch_pos_feats, in_layer=in_layer)
+        neg_score = model(batch_neg_feats, in_layer=in_layer)
+        score = torch.cat((pos_score, neg_score), dim=0)
+
+        target = np.hstack((np.ones(pos_score.shape[0], dtype=int), np.zeros(neg_score.shape[0], dtype=int)))
+        target = Variable(torch.from_numpy(target))
+        if options.use_gpu():
+            target = target.cuda()
+
+        loss = criterion(score, target)
+        model.zero_grad()
+        loss.backward()
+        torch.nn.utils.clip_grad_norm_(model.parameters(), opts['grad_clip'])
+        optimizer.step()
+
+
+def accuracy(model, pos_feats, neg_feats):
+    model.eval()
+    with torch.no_grad():
+        pos_score = model(pos_feats, in_layer='fc4')
+        neg_score = model(neg_feats, in_layer='fc4')
+    correct = (pos_score[:, 1] > pos_score[:, 0]).sum() + (neg_score[:, 1] <= neg_score[:, 0]).sum()
+    return float(correct) / (len(pos_feats) + len(neg_feats))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--seq', default='DragonBaby', help='input seq')
+    parser.add_argument('-r', '--repeat', default=3, type=int)
+    args = parser.parse_args()
+
+    np.random.seed(123)
+    torch.manual_seed(456)
+
+    img_dir = os.path.join(seq_home, args.seq, 'img')
+    img_list = sorted(os.listdir(img_dir))
+    gt = np.loadtxt(os.path.join(seq_home, args.seq, 'groundtruth_rect.txt'), delimiter=',')
+    image = Image.open(os.path.join(img_dir, img_list[0])).convert('RGB')
+
+    model = MDNet()
+    if options.use_gpu():
+        model = model.cuda()
+    model.set_learnable_params(opts['ft_layers'])
+
+    # first frame training data, as in run_mdnet
+    pos_examples = gen_samples(SampleGenerator('gaussian', image.size, 0.1, 1.2),
+                               gt[0], opts['n_pos_init'], opts['overlap_pos_init'])
+    neg_examples = gen_samples(SampleGenerator('uniform', image.size, 1, 2, 1.1),
+                               gt[0], opts['n_neg_init'], opts['overlap_neg_init'])
+    pos_feats = forward_samples(model, image, pos_examples)
+    neg_feats = forward_samples(model, image, neg_examples)
+    criterion = FocalLoss(class_num=2, alpha=torch.ones(2, 1) * 0.25, size_average=False)
+
+    for name, maxiter, lr in [('init', opts['maxiter_init'], opts['lr_init']),
+                              ('update', opts['maxiter_update'], opts['lr_update'])]:
+        for trainer in [train_reference, train]:
+            times = []
+            accs = []
+            for _ in range(args.repeat):
+                trained = copy.deepcopy(model)
+                optimizer = set_optimizer(trained, lr)
+                tic = time.time()
+                trainer(trained, criterion, optimizer, pos_feats, neg_feats, maxiter)
+                times.append(time.time() - tic)
+                accs.append(accuracy(trained, pos_feats, neg_feats))
+            print('%-6s (%2d iter) | %-15s | %.3f sec (min %.3f) | train accuracy %.3f' %
+                  (name, maxiter, trainer.__name__, np.mean(times), min(times), np.mean(accs)))
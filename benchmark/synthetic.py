@@ -0,0 +1,108 @@
+import os
+import json
+import argparse
+import numpy as np
+from PIL import Image
+
+# needed for following usage:
+#  cd benchmark
+#  python synthetic.py [-n 1000] [-r 1920 1080] [-t 120 90] [-v 6] [-oc 3] [-o ../dataset/synthetic]
+# writes a synthetic sequence in the OTB layout (img/%04d.jpg and groundtruth_rect.txt):
+# a textured target moving over a textured background, with exact ground truth
+
+
+def texture(rng, width, height, scale):
+    # smooth color noise (random cells of scale pixels, bicubic upsampled) plus fine grain
+    cells = rng.randint(0, 256, (max(height // scale, 2), max(width // scale, 2), 3)).astype('uint8')
+    image = np.asarray(Image.fromarray(cells).resize((width, height), Image.BICUBIC), dtype='int16')
+    image = image + rng.randint(-12, 13, (height, width, 1))
+    return np.clip(image, 0, 255).astype('uint8')
+
+
+def trajectory(rng, n_frames, size, target_size, speed):
+    # target top left corners: constant speed, a random turn now and then, bouncing off the frame borders
+    max_xy = np.array(size, dtype='float64') - target_size
+    xy = rng.uniform(0, 1, 2) * max_xy
+    angle = rng.uniform(0, 2 * np.pi)
+    corners = np.zeros((n_frames, 2))
+    for i in range(n_frames):
+        corners[i] = xy
+        if rng.uniform() < 0.05:
+            angle += rng.normal(0, np.pi / 4)
+        step = speed * np.array([np.cos(angle), np.sin(angle)])
+        xy = xy + step
+        for d in range(2):
+            if xy[d] < 0 or xy[d] > max_xy[d]:
+                xy[d] = np.clip(xy[d], 0, max_xy[d])
+                angle = np.pi - angle if d == 0 else -angle
+    return np.round(corners)
+
+
+def make_sequence(path, n_frames=300, size=(1280, 720), target_size=(80, 60), speed=4., occlusions=0,
+                  occlusion_len=10, seed=0, quality=90):
+    # writes the sequence into path (skipped if path already holds a sequence made with the same settings)
+    # size, target_size - (width, height) in pixels
+    # speed - target motion in pixels per frame
+    # occlusions - number of occlusions, evenly spread over the sequence after the first frames,
+    #              each hiding the target behind a textured box for occlusion_len frames
+    # returns the image paths and the ground truth (n_frames x 4, x,y,w,h)
+    settings = {'n_frames': n_frames, 'size': list(size), 'target_size': list(target_size), 'speed': speed,
+                'occlusions': occlusions, 'occlusion_len': occlusion_len, 'seed': seed, 'quality': quality}
+    img_dir = os.path.join(path, 'img')
+    img_list = [os.path.join(img_dir, '%04d.jpg' % (i + 1)) for i in range(n_frames)]
+    gt_path = os.path.join(path, 'groundtruth_rect.txt')
+    settings_path = os.path.join(path, 'synthetic.json')
+    if os.path.isfile(settings_path) and json.load(open(settings_path)) == settings:
+        return img_list, np.loadtxt(gt_path, delimiter=',')
+
+    rng = np.random.RandomState(seed)
+    width, height = size
+    target_w, target_h = target_size
+    background = texture(rng, width, height, 32)
+    target = texture(rng, target_w, target_h, 8)
+    occluder = texture(rng, 2 * target_w, 2 * target_h, 16)
+
+    corners = trajectory(rng, n_frames, size, np.array(target_size), speed)
+    gt = np.concatenate((corners, np.tile([target_w, target_h], (n_frames, 1))), axis=1)
+    occluded = np.zeros(n_frames, dtype=bool)
+    for start in np.linspace(10, n_frames - occlusion_len, occlusions + 2)[1:-1].astype(int):
+        occluded[start:start + occlusion_len] = True
+
+    os.makedirs(img_dir, exist_ok=True)
+    for i in range(n_frames):
+        frame = background.copy()
+        x, y = int(corners[i, 0]), int(corners[i, 1])
+        frame[y:y + target_h, x:x + target_w] = target
+        if occluded[i]:
+            # the occluder sits still over the target's position at the start of the occlusion
+            if not occluded[i - 1]:
+                ox = int(np.clip(x - target_w // 2, 0, width - 2 * target_w))
+                oy = int(np.clip(y - target_h // 2, 0, height - 2 * target_h))
+            frame[oy:oy + 2 * target_h, ox:ox + 2 * target_w] = occluder
+        Image.fromarray(frame).save(img_list[i], quality=quality)
+
+    np.savetxt(gt_path, gt, fmt='%d', delimiter=',')
+    json.dump(settings, open(settings_path, 'w'))
+    return img_list, gt
+
+
+def sequence_name(n_frames, size, target_size, speed, occlusions):
+    return 'synthetic_%d_%dx%d_t%dx%d_v%g_o%d' % ((n_frames,) + tuple(size) + tuple(target_size) + (speed, occlusions))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--n_frames', default=300, type=int)
+    parser.add_argument('-r', '--resolution', default=[1280, 720], type=int, nargs=2, help='width height')
+    parser.add_argument('-t', '--target_size', default=[80, 60], type=int, nargs=2, help='width height')
+    parser.add_argument('-v', '--speed', default=4., type=float, help='pixels per frame')
+    parser.add_argument('-oc', '--occlusions', default=0, type=int)
+    parser.add_argument('-sd', '--seed', default=0, type=int)
+    parser.add_argument('-o', '--out_dir', default='../dataset/synthetic')
+    args = parser.parse_args()
+
+    name = sequence_name(args.n_frames, args.resolution, args.target_size, args.speed, args.occlusions)
+    make_sequence(os.path.join(args.out_dir, name), args.n_frames, args.resolution, args.target_size,
+                  args.speed, args.occlusions, seed=args.seed)
+    print('sequence written to ' + os.path.join(args.out_dir, name))
@@ -0,0 +1,151 @@
+import os
+import json
+import struct
+import hashlib
+import numpy as np
+from collections import OrderedDict
+
+import torch
+
+# flat weight file: the tensors of a checkpoint as raw arrays, to be memory mapped instead of deserialized
+#
+#   8 bytes  magic
+#   8 bytes  header length (little endian uint64)
+#   header   json: {'tensors': [[name, dtype, shape, offset], ...], 'meta': {...}}
+#   data     the arrays, C order, each at offset (from the start of the data, 64 bytes aligned)
+#
+# tensor names are '<group>/<key>' for the state dicts of a checkpoint (e.g. 'shared_layers/conv1.0.weight'),
+# meta keeps its json serializable values (e.g. translate_mode, best_prec)
+# the file is mapped copy on write: processes loading it share its pages (the page cache) until they write
+# to a tensor (e.g. online training of the fc layers), which then gets private pages
+magic = b'FLATW001'
+alignment = 64
+flat_extension = '.flat'
+
+
+class MappedStateDict(OrderedDict):
+    # state dict of tensors mapped from a flat file, load_state() uses them in place
+    pass
+
+
+def is_flat(path):
+    return os.path.splitext(path)[1] == flat_extension
+
+
+def save_flat(path, checkpoint):
+    # checkpoint - {group: state dict, or name: tensor, or name: json serializable value}
+    # returns the keys that were not saved (neither tensors nor json serializable, e.g. optimizer states)
+    tensors = []
+    meta = {}
+    dropped = []
+    for key, value in checkpoint.items():
+        if isinstance(value, dict) and len(value) > 0 and all(torch.is_tensor(v) for v in value.values()):
+            tensors += [(key + '/' + k, v) for k, v in value.items()]
+        elif torch.is_tensor(value):
+            tensors.append((key, value))
+        else:
+            try:
+                json.dumps(value)
+                meta[key] = value
+            except (TypeError, ValueError):
+                dropped.append(key)
+
+    arrays = []
+    entries = []
+    offset = 0
+    for name, tensor in tensors:
+        array = np.ascontiguousarray(tensor.detach().cpu().numpy())
+        entries.append([name, array.dtype.str, list(tensor.shape), offset])  # (0-d tensors come out of ascontiguousarray 1-d)
+        arrays.append((offset, array))
+        offset += -(-array.nbytes // alignment) * alignment
+    header = json.dumps({'tensors': entries, 'meta': meta}).encode('utf-8')
+    data_start = -(-(len(magic) + 8 + len(header)) // alignment) * alignment
+
+    # written aside and renamed, so that a reader never maps a partial file
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(magic)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for array_offset, array in arrays:
+            f.seek(data_start + array_offset)
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+    return dropped
+
+
+def load_flat(path):
+    # the checkpoint saved by save_flat, its tensors mapped from the file (no copy)
+    with open(path, 'rb') as f:
+        if f.read(len(magic)) != magic:
+            raise RuntimeError('not a flat weight file: %s' % path)
+        header_length = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_length).decode('utf-8'))
+    data_start = -(-(len(magic) + 8 + header_length) // alignment) * alignment
+    mapped = np.memmap(path, dtype=np.uint8, mode='c')
+
+    checkpoint = OrderedDict(header['meta'])
+    for name, dtype, shape, offset in header['tensors']:
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        start = data_start + offset
+        tensor = torch.from_numpy(mapped[start:start + nbytes].view(dtype).reshape(shape))
+        group, _, key = name.rpartition('/')
+        if group == '':
+            checkpoint[key] = tensor
+        else:
+            checkpoint.setdefault(group, MappedStateDict())[key] = tensor
+    return checkpoint
+
+
+def load_checkpoint(path):
+    # torch.load, or load_flat for flat files
+    if is_flat(path):
+        return load_flat(path)
+    return torch.load(path)
+
+
+def load_state(module, state_dict, strict=True):
+    # module.load_state_dict(state_dict), except that the tensors of a MappedStateDict become the
+    # parameters (and buffers) of module instead of being copied into them
+    if not isinstance(state_dict, MappedStateDict):
+        return module.load_state_dict(state_dict, strict=strict)
+    own = module.state_dict(keep_vars=True)
+    missing = [k for k in own if k not in state_dict]
+    unexpected = [k for k in state_dict if k not in own]
+    if strict and (len(missing) > 0 or len(unexpected) > 0):
+        raise RuntimeError('Error(s) in loading state_dict for %s: missing keys %s, unexpected keys %s' %
+                           (module.__class__.__name__, missing, unexpected))
+    for k, tensor in state_dict.items():
+        if k not in own:
+            continue
+        if own[k].shape != tensor.shape:
+            raise RuntimeError('size mismatch for %s: %s in the file, %s in the model' %
+                               (k, tuple(tensor.shape), tuple(own[k].shape)))
+        own[k].data = tensor
+
+
+def content_hash(path, chunk_size=1 << 22):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def cache_path(path):
+    # flat file caching the conversion of path, next to it and named by the hash of its content
+    # (a changed source gets a new cache file)
+    return '%s.%s%s' % (os.path.splitext(path)[0], content_hash(path)[:16], flat_extension)
+
+
+def build_uninitialized(build):
+    # build() with its parameters allocated but not initialized (on the meta device, then allocated empty),
+    # for parameters that are loaded or initialized right after (the default initialization of large
+    # Linear layers takes longer than mapping their weights)
+    if not hasattr(torch, 'get_default_device'):
+        return build()
+    with torch.device('meta'):
+        module = build()
+    return module.to_empty(device='cpu')
@@ -0,0 +1,99 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+class LowRankLinear(nn.Module):
+    # Linear layer with a rank r factorized weight: y = (x v^T) u^T + bias
+    # weight_u: out x r, weight_v: r x in, (in + out) x r parameters instead of in x out
+    # the parameters are direct members (as nn.Linear's), so MDNet.params names them fc4_weight_u, ...
+    def __init__(self, in_features, out_features, rank, bias=True):
+        super(LowRankLinear, self).__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.rank = rank
+        self.weight_u = nn.Parameter(torch.empty(out_features, rank))
+        self.weight_v = nn.Parameter(torch.empty(rank, in_features))
+        self.bias = nn.Parameter(torch.zeros(out_features)) if bias else None
+
+    def forward(self, x):
+        return F.linear(F.linear(x, self.weight_v), self.weight_u, self.bias)
+
+    def to_linears(self):
+        # the two factors as nn.Linear layers (in -> r without bias, r -> out)
+        first = nn.Linear(self.in_features, self.rank, bias=False)
+        second = nn.Linear(self.rank, self.out_features, bias=self.bias is not None)
+        with torch.no_grad():
+            first.weight.copy_(self.weight_v)
+            second.weight.copy_(self.weight_u)
+            if self.bias is not None:
+                second.bias.copy_(self.bias)
+        return first, second
+
+    def extra_repr(self):
+        return 'in_features=%d, out_features=%d, rank=%d' % (self.in_features, self.out_features, self.rank)
+
+
+def dense_weight(linear):
+    # out x in weight of a Linear or LowRankLinear
+    if isinstance(linear, LowRankLinear):
+        return linear.weight_u.matmul(linear.weight_v)
+    return linear.weight
+
+
+def svd_rank(singular_values, energy):
+    # smallest rank keeping the energy fraction (of the sum of squared singular values)
+    cumulative = torch.cumsum(singular_values ** 2, 0)
+    return int((cumulative < energy * cumulative[-1]).sum().item()) + 1
+
+
+def factorize_linear(linear, rank=None, energy=None):
+    # rank r LowRankLinear closest to linear (truncated SVD, the singular values split evenly between
+    # the factors), r given, or the smallest keeping the energy fraction
+    weight = linear.weight.detach().float()
+    U, S, Vh = torch.linalg.svd(weight, full_matrices=False)
+    if rank is None:
+        rank = svd_rank(S, energy)
+    rank = min(rank, len(S))
+    low_rank = LowRankLinear(linear.in_features, linear.out_features, rank, bias=linear.bias is not None)
+    root = S[:rank].sqrt()
+    with torch.no_grad():
+        low_rank.weight_u.copy_(U[:, :rank] * root)
+        low_rank.weight_v.copy_(root.unsqueeze(1) * Vh[:rank])
+        if linear.bias is not None:
+            low_rank.bias.copy_(linear.bias)
+    return low_rank.to(linear.weight.device)
+
+
+def factorize_layers(layers, names, rank=None, energy=None):
+    # replaces the Linear of every layers.<name> (an nn.Sequential) by its factorization, when that has
+    # fewer parameters. returns {name: rank} of the factorized layers
+    ranks = {}
+    for name in names:
+        sequential = getattr(layers, name)
+        for i, module in enumerate(sequential):
+            if type(module) != nn.Linear:
+                continue
+            low_rank = factorize_linear(module, rank, energy)
+            if low_rank.rank * (module.in_features + module.out_features) < module.in_features * module.out_features:
+                sequential[i] = low_rank
+                ranks[name] = low_rank.rank
+    return ranks
+
+
+def low_rank_like(layers, state_dict):
+    # replaces the Linear layers that are factorized in state_dict (a state dict of layers, e.g. saved by
+    # tracking/compress_model.py) by LowRankLinear ones of the same ranks, so that it can be loaded
+    for key, weight_u in state_dict.items():
+        if not key.endswith('.weight_u'):
+            continue
+        name, index = key.split('.')[:2]
+        sequential = getattr(layers, name)
+        weight_v = state_dict[key[:-len('weight_u')] + 'weight_v']
+        bias = (key[:-len('weight_u')] + 'bias') in state_dict
+        sequential[int(index)] = LowRankLinear(weight_v.size(1), weight_u.size(0), weight_u.size(1), bias=bias)
+    return layers
+
+
+def count_params(module):
+    return sum(p.numel() for p in module.parameters())
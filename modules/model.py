@@ -1,5 +1,4 @@
 import os
-import scipy.io
 import numpy as np
 from collections import OrderedDict
 
@@ -9,6 +8,9 @@ from torch.autograd import Variable
 import torch
 
 from options import *
+from lowrank import *
+from quantization import *
+from flat_weights import *
 
 
 def append_params(params, module, prefix):
@@ -29,10 +31,49 @@ def append_params(params, module, prefix):
 
 
 class LRN(nn.Module):
-    def __init__(self):
+    # local response normalization: x / (2 + 0.0001 * (sum of x^2 over the 5 nearest channels))^0.75
+    #
+    # backend - None uses LRN.default_backend (set it to switch every LRN of every model)
+    #   'fast' - sums 5 shifted channel slices of one padded x^2, in place when no gradient is needed
+    #   'reference' - the original, 5 shifted copies of x^2 concatenated and summed (~5x the activation memory)
+    #   'torch' - torch.nn.functional.local_response_norm with matching constants
+    # 'fast' adds the channels in the order of 'reference', so both give bitwise equal results,
+    # 'torch' differs by float rounding (it averages the window and rescales)
+    backends = ['fast', 'reference', 'torch']
+    default_backend = 'fast'
+
+    def __init__(self, backend=None):
         super(LRN, self).__init__()
+        self.backend = backend
 
     def forward(self, x):
+        backend = self.backend or LRN.default_backend
+        if backend == 'fast':
+            return self.forward_fast(x)
+        elif backend == 'reference':
+            return self.forward_reference(x)
+        elif backend == 'torch':
+            return F.local_response_norm(x, 5, alpha=5 * 0.0001, beta=0.75, k=2.)
+        raise ValueError('unknown LRN backend %s' % backend)
+
+    def forward_fast(self, x):
+        # x: N x C x H x W
+        # out[c] sums x^2 of channels c+2, c+1, c, c-1, c-2 (that order, as the reference tile sum)
+        C = x.size(1)
+        if torch.is_grad_enabled() and x.requires_grad:
+            x_sq = F.pad(x**2, (0, 0, 0, 0, 2, 2))
+            x_sumsq = x_sq[:, 4:C+4] + x_sq[:, 3:C+3] + x_sq[:, 2:C+2] + x_sq[:, 1:C+1] + x_sq[:, 0:C]
+            return x / ((2.+0.0001*x_sumsq)**0.75)
+        x_sq = x.new_zeros((x.size(0), C + 4) + x.shape[2:])
+        torch.mul(x, x, out=x_sq[:, 2:C+2])
+        x_sumsq = x_sq[:, 4:C+4] + x_sq[:, 3:C+3]
+        x_sumsq += x_sq[:, 2:C+2]
+        x_sumsq += x_sq[:, 1:C+1]
+        x_sumsq += x_sq[:, 0:C]
+        x_sumsq.mul_(0.0001).add_(2.).pow_(0.75)
+        return x / x_sumsq
+
+    def forward_reference(self, x):
         #
         # x: N x C x H x W
         pad = Variable(x.data.new(x.size(0), 1, 1, x.size(2), x.size(3)).zero_())
@@ -107,7 +148,8 @@ class RegNet(torch.nn.Module):
         #     ('fc3', nn.Sequential(nn.Linear(hidden_layer2_size, self.output_size)))
         # ]))
 
-        self.layers = nn.Sequential(OrderedDict([
+        # (the parameters are either loaded or initialized by init_weights below)
+        self.layers = build_uninitialized(lambda: nn.Sequential(OrderedDict([
             ('flatten',  FlattenLayer()),
             ('fc1', nn.Sequential(nn.Dropout(0.5),
                                   nn.Linear(input_layer_size, hidden_layer_size),
@@ -117,7 +159,7 @@ class RegNet(torch.nn.Module):
                                   nn.LeakyReLU())),
             ('fc3', nn.Sequential(nn.Dropout(0.5),
                                   nn.Linear(hidden_layer2_size, self.output_size)))
-        ]))
+        ])))
 
         # self.layers = nn.Sequential(OrderedDict([
         #     ('flatten',  FlattenLayer()),
@@ -139,7 +181,8 @@ class RegNet(torch.nn.Module):
             # nn.init.kaiming_normal_(self.model.fc2.weight)
             # nn.init.constant_(self.model.fc2.bias, 0.)
         else:
-            self.layers.load_state_dict(state['RegNet_layers'])
+            low_rank_like(self.layers, state['RegNet_layers'])  # factorized layers (tracking/compress_model.py)
+            load_state(self.layers, state['RegNet_layers'])  # (mapped in place from a flat file)
             if 'translate_mode' in state.keys():
                 self.translate_mode = state['translate_mode']  # override input
 
@@ -149,6 +192,37 @@ class RegNet(torch.nn.Module):
             input_bb = x.data[:,-4:].clone()
         for name, module in self.layers.named_children():
             x = module(x)
+        return self.constrain(x, input_bb if self.translate_mode else None)
+
+    def forward_split(self, sample_feats, frame_feats, bboxes, frame_index=None):
+        #
+        # forward(torch.cat((sample_feats, frame_feats[frame_index], bboxes), dim=1)) without making that input:
+        # fc1 is applied as three slices of its weight, the frame features slice once per frame
+        # sample_feats - N x 4608, bboxes - N x 4, frame_feats - F x 4608 features of F full frames
+        # frame_index - N frame of every sample (None: F == 1, the frame of all the samples)
+        # in training mode the dropout mask of the frame features is drawn per frame, not per sample
+        dropout, linear, activation = self.layers.fc1
+        if frame_index is None:
+            frame_index = torch.zeros(sample_feats.size(0), dtype=torch.long, device=sample_feats.device)
+        if not isinstance(linear, (nn.Linear, LowRankLinear)):
+            # e.g. int8 fc1 (quantize_linears), run on the concatenated input
+            return self(torch.cat((sample_feats, frame_feats[frame_index], bboxes), dim=1))
+
+        # fc1 (x) = W_sample x_sample + W_frame x_frame + W_bb x_bb + b, low rank: U (V_sample x_sample + ...) + b
+        weight = linear.weight_v if isinstance(linear, LowRankLinear) else linear.weight
+        d = sample_feats.size(1)
+        x = F.linear(dropout(sample_feats), weight[:, :d])
+        x += F.linear(dropout(frame_feats), weight[:, d:2*d])[frame_index]
+        x += F.linear(dropout(bboxes), weight[:, 2*d:])
+        if isinstance(linear, LowRankLinear):
+            x = F.linear(x, linear.weight_u, linear.bias)
+        else:
+            x += linear.bias
+        x = activation(x)
+        x = self.layers.fc3(self.layers.fc2(x))
+        return self.constrain(x, bboxes.detach().clone() if self.translate_mode else None)
+
+    def constrain(self, x, input_bb):
         # x = (x1, y1, width, height)
 
         if self.translate_mode and self.output_size==4:
@@ -187,11 +261,25 @@ class RegNet(torch.nn.Module):
 #####################################
 
 
+class CompiledRange(nn.Module):
+    # a range of MDNet layers, as one module to trace or compile
+    def __init__(self, layers, flatten=False):
+        super(CompiledRange, self).__init__()
+        self.layers = layers
+        self.flatten = flatten
+
+    def forward(self, x):
+        x = self.layers(x)
+        if self.flatten:
+            x = x.view(x.size(0), -1)
+        return x
+
+
 class MDNet(nn.Module):
     def __init__(self, model_path=None, K=1):
         super(MDNet, self).__init__()
         self.K = K
-        self.layers = nn.Sequential(OrderedDict([
+        layers = lambda: nn.Sequential(OrderedDict([
                 ('conv1', nn.Sequential(nn.Conv2d(3, 96, kernel_size=7, stride=2),
                                         nn.ReLU(),
                                         LRN(),
@@ -208,13 +296,18 @@ class MDNet(nn.Module):
                 ('fc5',   nn.Sequential(nn.Dropout(0.5),
                                         nn.Linear(512, 512),
                                         nn.ReLU()))]))
+        # (.pth / .flat models load every layer, their initialization would be overwritten)
+        if model_path is not None and os.path.splitext(model_path)[1] in ['.pth', flat_extension]:
+            self.layers = build_uninitialized(layers)
+        else:
+            self.layers = layers()
         
         self.branches = nn.ModuleList([nn.Sequential(nn.Dropout(0.5), 
                                                      nn.Linear(512, 2)) for _ in range(K)])
 
         # print('loading trained model')
         if model_path is not None:
-            if os.path.splitext(model_path)[1] == '.pth':
+            if os.path.splitext(model_path)[1] in ['.pth', flat_extension]:
                 self.load_model(model_path)
             elif os.path.splitext(model_path)[1] == '.mat':
                 self.load_mat_model(model_path)
@@ -222,6 +315,12 @@ class MDNet(nn.Module):
                 raise RuntimeError("Unkown model format: %s" % (model_path))
         self.build_param_dict()
 
+        # compiled inference forwards, see compile_inference()
+        self.compiled = None
+        # int8 conv1-conv3 and fc4-fc6 inference forwards, see quantize()
+        self.quantized_convs = None
+        self.quantized_head = None
+
     def build_param_dict(self):
         self.params = OrderedDict()
         for name, module in self.layers.named_children():
@@ -247,6 +346,20 @@ class MDNet(nn.Module):
         #
         # forward model from in_layer to out_layer
 
+        if self.quantized_convs is not None and k == 0 and not self.training and not torch.is_grad_enabled():
+            if in_layer == 'conv1':
+                x = self.quantized_convs(x)
+                if out_layer == 'conv3':
+                    return x
+                in_layer = 'fc4'
+            if in_layer == 'fc4' and out_layer == 'fc6' and not self.quantized_head.stale():
+                return self.quantized_head(x)
+
+        if self.compiled is not None and k == 0 and not self.training and not torch.is_grad_enabled():
+            compiled = self.compiled.get((in_layer, out_layer))
+            if compiled is not None:
+                return compiled(x)
+
         run = False
         for name, module in self.layers.named_children():
             if name == in_layer:
@@ -254,7 +367,7 @@ class MDNet(nn.Module):
             if run:
                 x = module(x)
                 if name == 'conv3':
-                    x = x.view(x.size(0),-1)
+                    x = x.flatten(1)  # (view(x.size(0),-1), which an empty batch can not take)
                 if name == out_layer:
                     return x
         
@@ -264,20 +377,111 @@ class MDNet(nn.Module):
         elif out_layer=='fc6_softmax':
             return F.softmax(x)
     
+    def forward_feature_map(self, x):
+        #
+        # forward conv1 to conv3 on an input of any size, keeping the spatial layout of conv3
+        # (forward() flattens conv3, which only makes sense for img_size inputs)
+        for name in ['conv1', 'conv2', 'conv3']:
+            x = getattr(self.layers, name)(x)
+        return x
+
+    def compile_inference(self, backend='trace', img_size=107):
+        #
+        # compiles the conv1->conv3 and fc4->fc6 (branch 0) ranges for inference. forward() uses them
+        # for eval mode calls without gradient, every other call runs the layers as before
+        # backend - 'trace': TorchScript trace, the conv part frozen (weights inlined as constants,
+        #                    frozen graph optimizations), the fc part not frozen so it keeps following
+        #                    the online trained parameters
+        #           'compile': torch.compile of both parts (dynamic batch size), 'trace' if not available
+        # the conv weights must not change afterwards (compile again after loading others)
+        if backend == 'compile' and not hasattr(torch, 'compile'):
+            backend = 'trace'
+        was_training = self.training
+        self.eval()
+        conv = CompiledRange(self.layers[:3], flatten=True).eval()
+        fc = CompiledRange(nn.Sequential(self.layers.fc4, self.layers.fc5, self.branches[0])).eval()
+        with torch.no_grad():
+            if backend == 'trace':
+                device = self.layers.conv1[0].weight.device
+                conv = torch.jit.freeze(torch.jit.trace(conv, torch.zeros(2, 3, img_size, img_size, device=device)))
+                fc = torch.jit.trace(fc, torch.zeros(2, 512 * 3 * 3, device=device))
+            elif backend == 'compile':
+                conv = torch.compile(conv, dynamic=True)
+                fc = torch.compile(fc, dynamic=True)
+            else:
+                raise ValueError('unknown compile backend %s' % backend)
+        self.train(was_training)
+        self.compiled = {('conv1', 'conv3'): conv, ('fc4', 'fc6'): fc, ('conv1', 'fc6'): lambda x: fc(conv(x))}
+
+    def quantize(self, calibration_regions=None, engine='x86'):
+        #
+        # int8 inference (CPU) for eval mode calls without gradient, every other call runs in float:
+        # conv1-conv3 - static post training quantization, calibrated on calibration_regions
+        #               (N x 3 x img_size x img_size crops, e.g. samples of a few frames).
+        #               None makes them uncalibrated, to load_quantized() calibrated ones after
+        # fc4-fc6 - dynamic quantization of the float fc layers, which keep training online. the int8 copies
+        #           are used while the float weights are unchanged, refresh_quantized() remakes them
+        if calibration_regions is None:
+            self.quantized_convs = quantized_convs_skeleton(self.layers, engine)
+        else:
+            self.quantized_convs = quantize_convs(self.layers, calibration_regions, engine)
+        self.quantized_convs.engine = engine
+        self.quantized_head = QuantizedHead([self.layers.fc4[1], self.layers.fc5[1], self.branches[0][1]])
+
+    def refresh_quantized(self):
+        # remakes the int8 fc layers if the float ones were trained since
+        if self.quantized_head is not None and self.quantized_head.stale():
+            self.quantized_head.refresh()
+
+    def save_quantized(self, path):
+        torch.save({'quantized_convs': self.quantized_convs.state_dict(),
+                    'engine': self.quantized_convs.engine}, path)
+
+    def load_quantized(self, path):
+        # the int8 conv layers saved by save_quantized() (e.g. by tracking/quantize_model.py)
+        states = torch.load(path)
+        self.quantize(engine=states['engine'])
+        self.quantized_convs.load_state_dict(states['quantized_convs'])
+
+    def __getstate__(self):
+        # copies (e.g. deepcopy) are neither compiled nor quantized, the compiled and int8 fc ranges
+        # are made from the parameters of this model
+        state = self.__dict__.copy()
+        state['compiled'] = None
+        state['quantized_convs'] = None
+        state['quantized_head'] = None
+        return state
+
     def load_model(self, model_path):
-        states = torch.load(model_path)
+        # .pth (torch.save) or .flat (tracking/convert_model.py, mapped instead of read)
+        states = load_checkpoint(model_path)
         shared_layers = states['shared_layers']
-        self.layers.load_state_dict(shared_layers)
+        low_rank_like(self.layers, shared_layers)  # factorized fc layers (tracking/compress_model.py)
+        load_state(self.layers, shared_layers)
     
     def load_mat_model(self, matfile):
+        # the conv weights of the .mat are converted once, to a flat file cached next to it (by content hash)
+        cached = cache_path(matfile)
+        if os.path.isfile(cached):
+            load_state(self.layers, load_flat(cached)['conv_layers'], strict=False)
+            return
+
+        import scipy.io  # (only for the imagenet .mat model of pretraining)
         mat = scipy.io.loadmat(matfile)
         mat_layers = list(mat['layers'])[0]
         
         # copy conv weights
+        conv_layers = OrderedDict()
         for i in range(3):
             weight, bias = mat_layers[i*4]['weights'].item()[0]
             self.layers[i][0].weight.data = torch.from_numpy(np.transpose(weight, (3,2,0,1)))
             self.layers[i][0].bias.data = torch.from_numpy(bias[:,0])
+            conv_layers['conv%d.0.weight' % (i+1)] = self.layers[i][0].weight.data
+            conv_layers['conv%d.0.bias' % (i+1)] = self.layers[i][0].bias.data
+        try:
+            save_flat(cached, {'conv_layers': conv_layers, 'source': os.path.basename(matfile)})
+        except OSError:
+            pass  # (read only models folder, converted again next time)
 
 
 class BinaryLoss(nn.Module):
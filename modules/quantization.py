@@ -0,0 +1,116 @@
+import copy
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import torch.ao.quantization as tq
+import torch.ao.nn.quantized.dynamic as nnqd
+
+from lowrank import *
+
+
+def quantize_linears(module):
+    # int8 copy of a module with its Linear layers dynamically quantized (weights int8, activations
+    # quantized per batch), for inference only (e.g. RegNet). factorized layers are quantized factor by factor
+    module = copy.deepcopy(module)
+    for parent in list(module.modules()):
+        for name, child in parent.named_children():
+            if isinstance(child, LowRankLinear):
+                setattr(parent, name, nn.Sequential(*child.to_linears()))
+    return tq.quantize_dynamic(module, {nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_linear(linear):
+    # dynamically quantized copy of one Linear (or LowRankLinear), per output channel int8 weights
+    if isinstance(linear, LowRankLinear):
+        return nn.Sequential(*[quantize_linear(factor) for factor in linear.to_linears()])
+    weight = linear.weight.detach().float().cpu()
+    observer = tq.default_per_channel_weight_observer()
+    observer(weight)
+    scales, zero_points = observer.calculate_qparams()
+    qlinear = nnqd.Linear(linear.in_features, linear.out_features, dtype=torch.qint8)
+    bias = linear.bias.detach().float().cpu() if linear.bias is not None else None
+    qlinear.set_weight_bias(torch.quantize_per_channel(weight, scales.double(), zero_points, 0, torch.qint8), bias)
+    return qlinear
+
+
+class QuantizedConvs(nn.Module):
+    # conv1-conv3 of MDNet with static int8 quantization (post training, calibrated on crops)
+    # conv+ReLU are fused and run in int8, LRN and max pooling stay in float between them
+    # input: N x 3 x img_size x img_size crops, output: N x 4608 conv3 features (as forward(out_layer='conv3'))
+    def __init__(self, layers):
+        super(QuantizedConvs, self).__init__()
+        self.convs = nn.ModuleList()
+        self.relus = nn.ModuleList()
+        self.quants = nn.ModuleList()
+        self.dequants = nn.ModuleList()
+        self.floats = nn.ModuleList()  # LRN + pooling after conv1 and conv2
+        for name in ['conv1', 'conv2', 'conv3']:
+            layer = copy.deepcopy(getattr(layers, name))
+            self.convs.append(layer[0])
+            self.relus.append(layer[1])
+            self.quants.append(tq.QuantStub())
+            self.dequants.append(tq.DeQuantStub())
+            self.floats.append(layer[2:])
+
+    def forward(self, x):
+        for k in range(3):
+            x = self.quants[k](x)
+            x = self.relus[k](self.convs[k](x))
+            x = self.floats[k](self.dequants[k](x))
+        # (int8 convs return channels last tensors)
+        return x.reshape(x.size(0), -1)
+
+    def prepare(self, engine='x86'):
+        # fuses conv+ReLU and inserts the observers of the calibration
+        self.eval()
+        for k in range(3):
+            fused = tq.fuse_modules(nn.Sequential(self.convs[k], self.relus[k]), [['0', '1']])
+            self.convs[k], self.relus[k] = fused[0], fused[1]
+        self.qconfig = tq.get_default_qconfig(engine)
+        for layers in self.floats:
+            layers.qconfig = None
+        torch.backends.quantized.engine = engine
+        tq.prepare(self, inplace=True)
+        return self
+
+    def convert(self):
+        tq.convert(self, inplace=True)
+        return self
+
+
+def quantize_convs(layers, calibration_regions, engine='x86', batch_size=256):
+    # static post training quantization of conv1-conv3, calibrated on calibration_regions (N x 3 x H x W)
+    convs = QuantizedConvs(layers).prepare(engine)
+    with torch.no_grad():
+        for start in range(0, len(calibration_regions), batch_size):
+            convs(calibration_regions[start:start + batch_size])
+    return convs.convert()
+
+
+def quantized_convs_skeleton(layers, engine='x86'):
+    # converted but uncalibrated QuantizedConvs, to load the state_dict of calibrated ones into
+    return QuantizedConvs(layers).prepare(engine).convert()
+
+
+class QuantizedHead():
+    # int8 (dynamic) fc4 -> fc6 of a model whose fc layers keep training in float
+    # the int8 copies are only used while the float weights are the ones they were made from,
+    # refresh() remakes them after the weights changed (e.g. once per frame, after the online updates)
+    def __init__(self, linears):
+        self.linears = linears  # float fc4, fc5, fc6 (Linear or LowRankLinear) layers of the model
+        self.refresh()
+
+    def versions(self):
+        return [p._version for linear in self.linears for p in linear.parameters()]
+
+    def stale(self):
+        return self.versions() != self.made_from
+
+    def refresh(self):
+        self.qlinears = [quantize_linear(linear) for linear in self.linears]
+        self.made_from = self.versions()
+
+    def __call__(self, x):
+        x = F.relu(self.qlinears[0](x))
+        x = F.relu(self.qlinears[1](x))
+        return self.qlinears[2](x)
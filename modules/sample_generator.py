@@ -1,80 +1,143 @@
+import warnings
 import numpy as np
 
 from utils import *
 
-def gen_samples(generator, bbox, n, overlap_range=None, scale_range=None, relentless=False):
-    
+def gen_samples(generator, bbox, n, overlap_range=None, scale_range=None):
+    # n boxes of generator around bbox, of overlap with bbox within overlap_range and of area ratio to bbox within
+    # scale_range (see gen_samples_batch)
+    return gen_samples_batch(generator, bbox, [n], overlap_range, scale_range)[0]
+
+
+def gen_samples_batch(generator, bboxes, ns, overlap_range=None, scale_range=None, max_draws=50):
+    # ns[b] boxes around each of bboxes (B x 4), drawn and checked for all of them at once
+    # returns the (sum ns) x 4 boxes, grouped by bbox in order, and the index of the bbox of each (segments)
+    #
+    # the generator draws within translation and scale bounds that hold for every box of the ranges, and the exact
+    # ranges are checked once per round over all of them. the first round is sized by the acceptance of the
+    # previous calls (of the generator, for these ranges), the next ones by the acceptance of each bbox still short
+    # no box is repeated. raises ValueError if no scale of the generator is within the ranges. a bbox still short
+    # after max_draws * ns[b] draws (e.g. mostly out of the image) gets fewer boxes, with a warning
+    bboxes = np.array(bboxes, dtype='float32').reshape(-1, 4)
+    ns = np.broadcast_to(np.asarray(ns, dtype=int), (len(bboxes),))
+
     if overlap_range is None and scale_range is None:
-        return generator(bbox, n)
-    
-    else:
-        samples = None
-        remain = n
-        factor = 2
-        while remain > 0 and ((factor < 16) or relentless):
-            samples_ = generator(bbox, remain*factor)
+        return generator.batch(bboxes, ns)
 
+    else:
+        min_overlap = None if overlap_range is None else overlap_range[0]
+        low, high = generator.scale_bounds(min_overlap, scale_range)
+        if low > high:
+            raise ValueError('no box of scales up to %g times the bbox is within overlap_range %s and scale_range %s' %
+                             (generator.scale_f, overlap_range, scale_range))
+
+        key = (None if overlap_range is None else tuple(overlap_range), None if scale_range is None else tuple(scale_range))
+        acceptance = np.full(len(bboxes), generator.acceptance.get(key, 1.))
+        budget = max_draws * ns + 64
+        drawn = np.zeros(len(bboxes), dtype=int)
+        samples = []
+        segments = []
+        remain = ns.copy()
+        while True:
+            n_draw = np.ceil(remain / np.maximum(acceptance, 1e-3) * 1.1).astype(int) + 1
+            n_draw = np.where(remain > 0, np.minimum(n_draw, budget - drawn), 0)
+            if not n_draw.any():
+                break
+            samples_, segments_ = generator.batch(bboxes, n_draw, min_overlap, scale_range)
+            drawn += n_draw
+
+            bbox = bboxes[segments_]
             idx = np.ones(len(samples_), dtype=bool)
             if overlap_range is not None:
                 r = overlap_ratio(samples_, bbox)
                 idx *= (r >= overlap_range[0]) * (r <= overlap_range[1])
             if scale_range is not None:
-                s = np.prod(samples_[:,2:], axis=1) / np.prod(bbox[2:])
+                s = np.prod(samples_[:,2:], axis=1) / np.prod(bbox[:,2:], axis=1)
                 idx *= (s >= scale_range[0]) * (s <= scale_range[1])
-            
-            samples_ = samples_[idx,:]
-            samples_ = samples_[:min(remain, len(samples_))]
-            if samples is None:
-                samples = samples_
-            else:
-                samples = np.concatenate([samples, samples_])
-            remain = n - len(samples)
-
-            if relentless and factor<8:
-                factor = factor*2
-        
-        return samples
+            if drawn.sum() == n_draw.sum():  # (the first round, of all the bboxes)
+                generator.acceptance[key] = idx.mean()
+            accepted = np.bincount(segments_[idx], minlength=len(bboxes))
+            acceptance = np.where(n_draw > 0, (accepted + 0.5) / (n_draw + 1), acceptance)
+
+            # the first remain[b] accepted boxes of each bbox (segments are sorted)
+            samples_, segments_ = samples_[idx], segments_[idx]
+            rank = np.arange(len(segments_)) - np.searchsorted(segments_, segments_)
+            keep = rank < remain[segments_]
+            samples.append(samples_[keep])
+            segments.append(segments_[keep])
+            remain -= np.bincount(segments[-1], minlength=len(bboxes))
+
+        if remain.any():
+            warnings.warn('gen_samples: bboxes got fewer boxes than asked for, too few boxes around them are within the '
+                          'ranges (e.g. bboxes mostly out of the image)')
+        samples = np.concatenate(samples + [np.zeros((0, 4), dtype='float32')])
+        segments = np.concatenate(segments + [np.zeros(0, dtype=int)])
+        # grouped by bbox (the rounds are appended)
+        order = np.argsort(segments, kind='stable')
+        return samples[order], segments[order]
+
+
+def split_samples(samples, segments, n_boxes):
+    # the boxes of gen_samples_batch, as a list of the boxes around each of its n_boxes bboxes
+    return np.split(samples, np.searchsorted(segments, np.arange(1, n_boxes)))
 
 
 class SampleGenerator():
-    def __init__(self, type, img_size, trans_f=1, scale_f=1, aspect_f=None, valid=False):
+    def __init__(self, type, img_size, trans_f=1, scale_f=1, aspect_f=None, valid=False, seed=None):
         self.type = type
         self.img_size = np.array(img_size) # (w, h)
         self.trans_f = trans_f
         self.scale_f = scale_f
         self.aspect_f = aspect_f
         self.valid = valid
-
-    def __call__(self, bb, n):
+        # own random stream, seeded from the global one by default (so np.random.seed still makes runs repeatable)
+        self.rng = np.random.default_rng(np.random.randint(2**31) if seed is None else seed)
+        # fraction of the drawn boxes within the ranges, per (overlap_range, scale_range) of gen_samples
+        self.acceptance = {}
+        # the point grids of 'whole', per size
+        self.grids = {}
+
+    def __call__(self, bb, n, min_overlap=None, scale_range=None):
         #
         # bb: target bbox (min_x,min_y,w,h)
-        bb = np.array(bb, dtype='float32')
+        # min_overlap, scale_range: bound the scales and translations drawn to those of boxes that can overlap bb
+        #     by min_overlap, of area ratio to bb within scale_range (necessary conditions, see gen_samples_batch)
+        return self.batch(bb, [n], min_overlap, scale_range)[0]
+
+    def batch(self, bbs, ns, min_overlap=None, scale_range=None):
+        # ns[b] boxes around each of bbs (B x (min_x,min_y,w,h)), all drawn at once
+        # returns the (sum ns) x 4 boxes, grouped by bb in order, and the index of the bb of each (segments)
+        bbs = np.array(bbs, dtype='float32').reshape(-1, 4)
+        ns = np.broadcast_to(np.asarray(ns, dtype=int), (len(bbs),))
+        segments = np.repeat(np.arange(len(bbs)), ns)
+        bb = bbs[segments]
+        n = len(bb)
 
         # (center_x, center_y, w, h)
-        sample = np.array([bb[0]+bb[2]/2, bb[1]+bb[3]/2, bb[2], bb[3]], dtype='float32')
-        samples = np.tile(sample[None,:],(n,1))
+        samples = np.concatenate([bb[:,:2] + bb[:,2:]/2, bb[:,2:]], axis=1)
+        mean_size = bb[:,2:].mean(axis=1, keepdims=True)
 
         # vary aspect ratio
         if self.aspect_f is not None:
-            ratio = np.random.rand(n,1)*2-1
+            ratio = self.rng.random((n,1))*2-1
             samples[:,2:] *= self.aspect_f ** np.concatenate([ratio, -ratio],axis=1)
 
         # sample generation
+        # scales scale_f ** u, u in [-1, 1], then translations of at most trans_f * mean size
         if self.type=='gaussian':
-            samples[:,:2] += self.trans_f * np.mean(bb[2:]) * np.clip(0.5*np.random.randn(n,2),-1,1)
-            samples[:,2:] *= self.scale_f ** np.clip(0.5*np.random.randn(n,1),-1,1)
+            samples[:,2:] *= self.scale_f ** self.clipped_gaussian(*self.scale_exponents(min_overlap, scale_range), (n,1))
+            samples[:,2:] = np.clip(samples[:,2:], 10, self.img_size-10)
+            samples[:,:2] += self.trans_f * mean_size * self.clipped_gaussian(*self.trans_bounds(bb, samples, min_overlap), (n,2))
 
         elif self.type=='uniform':
-            samples[:,:2] += self.trans_f * np.mean(bb[2:]) * (np.random.rand(n,2)*2-1)
-            samples[:,2:] *= self.scale_f ** (np.random.rand(n,1)*2-1)
-        
+            samples[:,2:] *= self.scale_f ** self.rng.uniform(*self.scale_exponents(min_overlap, scale_range), (n,1))
+            samples[:,2:] = np.clip(samples[:,2:], 10, self.img_size-10)
+            samples[:,:2] += self.trans_f * mean_size * self.rng.uniform(*self.trans_bounds(bb, samples, min_overlap), (n,2))
+
         elif self.type=='whole':
-            m = int(2*np.sqrt(n))
-            xy = np.dstack(np.meshgrid(np.linspace(0,1,m),np.linspace(0,1,m))).reshape(-1,2)
-            xy = np.random.permutation(xy)[:n]
-            samples[:,:2] = bb[2:]/2 + xy * (self.img_size-bb[2:]/2-1)
-            #samples[:,:2] = bb[2:]/2 + np.random.rand(n,2) * (self.img_size-bb[2:]/2-1)
-            samples[:,2:] *= self.scale_f ** (np.random.rand(n,1)*2-1)
+            samples[:,:2] = bb[:,2:]/2 + self.grid_positions(ns) * (self.img_size-bb[:,2:]/2-1)
+            #samples[:,:2] = bb[:,2:]/2 + np.random.rand(n,2) * (self.img_size-bb[:,2:]/2-1)
+            samples[:,2:] *= self.scale_f ** (self.rng.random((n,1))*2-1)
 
         # adjust bbox range
         samples[:,2:] = np.clip(samples[:,2:], 10, self.img_size-10)
@@ -86,11 +149,85 @@ class SampleGenerator():
         # (min_x, min_y, w, h)
         samples[:,:2] -= samples[:,2:]/2
 
-        return samples
+        return samples, segments
+
+    def grid_positions(self, ns):
+        # for each count n of ns, n distinct points of an m x m grid over [0, 1]^2, m = 2 sqrt(n)
+        # (the grids are kept per m, the generator has one img_size)
+        xy = np.empty((int(np.sum(ns)), 2), dtype='float32')
+        ends = np.cumsum(ns)
+        for n in np.unique(ns):
+            if n == 0:
+                continue
+            m = int(2*np.sqrt(n))
+            if m not in self.grids:
+                self.grids[m] = np.dstack(np.meshgrid(np.linspace(0,1,m),np.linspace(0,1,m))).reshape(-1,2)
+            boxes = np.flatnonzero(ns == n)
+            # a random permutation of the grid per box, its first n points
+            points = self.rng.permuted(np.tile(np.arange(m*m), (len(boxes), 1)), axis=1)[:, :n]
+            rows = (ends[boxes, None] - n + np.arange(n)).reshape(-1)
+            xy[rows] = self.grids[m][points.reshape(-1)]
+        return xy
+
+    def scale_bounds(self, min_overlap, scale_range):
+        # range of the scale exponent u: the area ratio scale_f ** 2u (the aspect ratio keeps the area) is within
+        # scale_range, and within [min_overlap, 1 / min_overlap] (the overlap is at most the smaller area over the larger)
+        # (low > high - no scale is within the ranges)
+        low, high = -1., 1.
+        if self.scale_f == 1:
+            # the area ratio is 1
+            if (min_overlap is not None and min_overlap > 1) or \
+                    (scale_range is not None and not scale_range[0] <= 1 <= scale_range[1]):
+                return high, low
+            return low, high
+        log_f = 2 * np.log(self.scale_f)
+        if min_overlap is not None and min_overlap > 0:
+            low, high = max(low, np.log(min_overlap) / log_f), min(high, -np.log(min_overlap) / log_f)
+        if scale_range is not None:
+            low = max(low, np.log(max(scale_range[0], 1e-12)) / log_f)
+            high = min(high, np.log(scale_range[1]) / log_f)
+        return low, high
+
+    def scale_exponents(self, min_overlap, scale_range):
+        # scale_bounds, or a single scale when none is within the ranges (all the boxes are then rejected)
+        low, high = self.scale_bounds(min_overlap, scale_range)
+        return low, max(low, high)
+
+    def trans_bounds(self, bb, samples, min_overlap):
+        # range of the translations (n x 2, in trans_f * mean size units) of samples around their bb (n x 4): the
+        # overlap of boxes is at most their intersection along an axis over the larger of their sizes along it, so
+        # overlapping bb by min_overlap needs |shift| <= (size + bb size) / 2 - min_overlap * max(size, bb size)
+        # the bound holds for the shift after the border clip of batch() only if no shift gets clipped: along an
+        # axis where the shifts can reach the border, a clipped draw from beyond the bound can be within it, the
+        # draws there are not bounded (so the accepted boxes are distributed as by plain rejection)
+        if min_overlap is None or min_overlap <= 0 or self.trans_f == 0:
+            return -1., 1.
+        reach = self.trans_f * bb[:,2:].mean(axis=1, keepdims=True)
+        shift = (samples[:,2:] + bb[:,2:]) / 2 - min_overlap * np.maximum(samples[:,2:], bb[:,2:])
+        high = np.clip(shift / reach, 0, 1)
+        if self.valid:
+            clip_low, clip_high = samples[:,2:]/2, self.img_size-samples[:,2:]/2-1
+        else:
+            clip_low, clip_high = 0, self.img_size
+        border = (samples[:,:2] - reach <= clip_low) | (samples[:,:2] + reach >= clip_high)
+        return np.where(border, -1, -high), np.where(border, 1, high)
+
+    def clipped_gaussian(self, low, high, size):
+        # clip(0.5 * randn, -1, 1) restricted to [low, high], by the inverse cdf (a bound at -1 or 1 keeps the clipped mass)
+        if np.all(np.asarray(low) <= -1) and np.all(np.asarray(high) >= 1):
+            return np.clip(0.5 * self.rng.standard_normal(size), -1, 1)
+        low = np.broadcast_to(np.asarray(low, dtype='float64'), size)
+        high = np.broadcast_to(np.asarray(high, dtype='float64'), size)
+        from scipy.special import ndtr, ndtri  # (scipy.special is slow to import, only the bounded draws use it)
+        cdf_low = ndtr(np.where(low <= -1, -np.inf, low / 0.5))
+        cdf_high = ndtr(np.where(high >= 1, np.inf, high / 0.5))
+        p = cdf_low + (cdf_high - cdf_low) * self.rng.random(low.shape)
+        p = np.clip(p, 1e-12, 1 - 1e-12)
+        return np.clip(0.5 * ndtri(p), np.maximum(low, -1), np.minimum(high, 1))
 
     def set_trans_f(self, trans_f):
         self.trans_f = trans_f
-    
+
     def get_trans_f(self):
         return self.trans_f
 
@@ -0,0 +1,102 @@
+import json
+import time
+import threading
+import numpy as np
+from contextlib import contextmanager
+
+
+class StageTimer():
+    # wall time of the tracking stages (decode, gen_samples, crop, forward, topk, bbreg, collect,
+    # short-update, long-update, display, ...), recorded as (stage, start, duration, thread, frame) events
+    #
+    # stages may nest (e.g. collect includes the crop and forward of its samples), a stage time is
+    # inclusive. events recorded before the first next_frame() of a run (e.g. init, see begin_run) are only
+    # in the trace.
+    # recording is a perf_counter pair and a list append, so it is always on (enabled=False to skip it)
+    def __init__(self):
+        self.enabled = True
+        self.reset()
+
+    def reset(self):
+        self.events = []
+        self.frame = None
+        self.n_frames = 0
+        self.origin = time.perf_counter()
+
+    def begin_run(self):
+        # events from here on belong to no frame (the init of a run) until the next next_frame()
+        # (frames keep counting on from those of the previous runs)
+        self.frame = None
+
+    def next_frame(self):
+        # events from here on belong to a new frame
+        self.frame = self.n_frames
+        self.n_frames += 1
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        frame = self.frame
+        tic = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.events.append((name, tic, time.perf_counter() - tic, threading.get_ident(), frame))
+
+    def add(self, name, duration):
+        # records a stage that ends now, for code that times itself (e.g. a whole frame)
+        if self.enabled:
+            self.events.append((name, time.perf_counter() - duration, duration, threading.get_ident(), self.frame))
+
+    def frame_times(self, name):
+        # total seconds of a stage per frame, over the frames that ran it
+        times = {}
+        for stage, _, duration, _, frame in self.events:
+            if stage == name and frame is not None:
+                times[frame] = times.get(frame, 0) + duration
+        return np.array(list(times.values()))
+
+    def stages(self):
+        names = []
+        for stage, _, _, _, frame in self.events:
+            if frame is not None and stage not in names:
+                names.append(stage)
+        return names
+
+    def summary(self, percentiles=(50, 95, 99)):
+        # {stage: {'frames': .., 'mean': .., 'p50': .., ...}} of the per frame times in ms
+        # (frames - the number of frames that ran the stage, e.g. the ones with an update)
+        summary = {}
+        for name in self.stages():
+            times = self.frame_times(name) * 1000
+            summary[name] = {'frames': len(times), 'mean': float(times.mean())}
+            for q, value in zip(percentiles, np.percentile(times, percentiles)):
+                summary[name]['p%d' % q] = float(value)
+        return summary
+
+    def histogram(self, name, bins=(0.1, 0.3, 1, 3, 10, 30, 100, 300, 1000, 3000, 10000)):
+        # counts of the per frame times of a stage (ms) in bins, about log spaced from 0.1 ms to 10 sec by default
+        bins = np.asarray(bins, dtype='float64')
+        times = self.frame_times(name) * 1000
+        return np.histogram(np.clip(times, bins[0], bins[-1]), bins)
+
+    def print_histograms(self):
+        for name in self.stages():
+            counts, bins = self.histogram(name)
+            print('      %-12s ' % name + ' '.join('%g-%gms:%d' % (bins[k], bins[k + 1], c)
+                                                  for k, c in enumerate(counts) if c > 0))
+
+    def save_chrome_trace(self, path):
+        # complete events in the chrome://tracing (and perfetto) json format
+        events = []
+        for name, start, duration, thread, frame in self.events:
+            events.append({'name': name, 'ph': 'X', 'pid': 0, 'tid': thread,
+                           'ts': (start - self.origin) * 1e6, 'dur': duration * 1e6,
+                           'args': {'frame': frame}})
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, open(path, 'w'))
+
+
+# the timer of the tracking stages, shared by the modules that record into it
+stage_timer = StageTimer()
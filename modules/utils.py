@@ -1,7 +1,10 @@
-from scipy.misc import imresize
 import numpy as np
 import pickle as pkl
 import torch
+import torch.nn.functional as F
+from PIL import Image
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 
 def torch_overlap_ratio(rect1, rect2):
@@ -79,15 +82,123 @@ def crop_image(img, bbox, img_size=107, padding=16, valid=False):
         max_y_val = min(img_h, max_y)
 
         cropped = 128 * np.ones((max_y - min_y, max_x - min_x, 3), dtype='uint8')
-        cropped[min_y_val - min_y:max_y_val - min_y, min_x_val - min_x:max_x_val - min_x, :] \
-            = img[min_y_val:max_y_val, min_x_val:max_x_val, :]
+        if min_x_val < max_x_val and min_y_val < max_y_val:  # else all out of the image, all gray
+            cropped[min_y_val - min_y:max_y_val - min_y, min_x_val - min_x:max_x_val - min_x, :] \
+                = img[min_y_val:max_y_val, min_x_val:max_x_val, :]
 
-    scaled = imresize(cropped, (img_size, img_size))
+    # the bilinear resize of PIL, which scipy.misc.imresize (removed from scipy) did
+    scaled = np.asarray(Image.fromarray(np.ascontiguousarray(cropped, dtype='uint8')).resize((img_size, img_size), Image.BILINEAR))
     return scaled
 
 
+def image_to_tensor(img):
+    '''
+    Convert an H x W x 3 uint8 image into the 1 x 3 x H x W float tensor
+    (shifted by -128) that crop_images samples from
+    '''
+    img = torch.from_numpy(np.ascontiguousarray(np.asarray(img).transpose(2, 0, 1)))
+    return (img.float() - 128.).unsqueeze(0)
+
+
+def crop_boxes(samples, img_size=107, padding=16, valid=False, img_shape=None):
+    '''
+    Integer crop windows (min_x, min_y, max_x, max_y) of N samples,
+    rounded exactly like crop_image does
+    - samples: 2d array of N x [x,y,w,h]
+    - img_shape: (img_h, img_w), only needed when valid=True
+    '''
+    samples = np.asarray(samples, dtype='float32').reshape(-1, 4)
+    w, h = samples[:, 2], samples[:, 3]
+
+    half_w, half_h = w / 2, h / 2
+    center_x, center_y = samples[:, 0] + half_w, samples[:, 1] + half_h
+
+    if padding > 0:
+        half_w = half_w + padding * w / img_size
+        half_h = half_h + padding * h / img_size
+
+    # int() in crop_image truncates towards zero
+    min_x = np.fix(center_x - half_w + 0.5)
+    min_y = np.fix(center_y - half_h + 0.5)
+    max_x = np.fix(center_x + half_w + 0.5)
+    max_y = np.fix(center_y + half_h + 0.5)
+
+    if valid:
+        img_h, img_w = img_shape[:2]
+        min_x = np.maximum(0, min_x)
+        min_y = np.maximum(0, min_y)
+        max_x = np.minimum(img_w, max_x)
+        max_y = np.minimum(img_h, max_y)
+
+    return np.stack((min_x, min_y, max_x, max_y), axis=1)
+
+
+def crop_windows(img, boxes, out_w, out_h, antialias=4):
+    '''
+    Resize N windows of an image to out_w x out_h in one pass
+    by bilinear grid sampling from a per-window affine grid.
+    Pixels outside the image are filled with 128, as in crop_image.
+    - img: output of image_to_tensor
+    - boxes: 2d array of N x [min_x,min_y,max_x,max_y] (see crop_boxes)
+    - antialias: max supersampling factor per axis when shrinking large windows
+    returns N x 3 x out_h x out_w float tensor, shifted by -128
+    '''
+    img_h, img_w = img.shape[2], img.shape[3]
+    n = len(boxes)
+    if n == 0:
+        return img.new_zeros((0, 3, out_h, out_w))
+
+    min_x, min_y = boxes[:, 0], boxes[:, 1]
+    crop_w = np.maximum(boxes[:, 2] - min_x, 1)
+    crop_h = np.maximum(boxes[:, 3] - min_y, 1)
+
+    # affine map from the output grid (normalized to [-1,1]) to the window in the image
+    theta = np.zeros((n, 2, 3), dtype='float32')
+    theta[:, 0, 0] = crop_w / img_w
+    theta[:, 0, 2] = (2 * min_x + crop_w) / img_w - 1
+    theta[:, 1, 1] = crop_h / img_h
+    theta[:, 1, 2] = (2 * min_y + crop_h) / img_h - 1
+    theta = torch.from_numpy(theta).to(img.device)
+
+    # supersample windows that are shrunk a lot, in place of the low-pass filter of imresize
+    factor = np.ones(n, dtype=int)
+    if antialias > 1:
+        factor = np.clip(np.round(np.maximum(crop_w / out_w, crop_h / out_h)), 1, antialias).astype(int)
+
+    regions = img.new_empty((n, 3, out_h, out_w))
+    for k in np.unique(factor):
+        idx = np.nonzero(factor == k)[0]
+        grid = F.affine_grid(theta[torch.from_numpy(idx)], (len(idx), 3, out_h * k, out_w * k), align_corners=False)
+
+        # stack the grids vertically so the image is sampled once, without repeating it per window
+        # zero padding of the shifted image is the 128 gray fill of crop_image
+        crops = F.grid_sample(img, grid.view(1, len(idx) * out_h * k, out_w * k, 2),
+                              mode='bilinear', padding_mode='zeros', align_corners=False)
+        crops = crops.view(3, len(idx), out_h * k, out_w * k).transpose(0, 1)
+        if k > 1:
+            crops = F.avg_pool2d(crops, int(k))
+        if len(idx) == n:
+            regions.copy_(crops)
+        else:
+            regions[torch.from_numpy(idx)] = crops
+    return regions
+
+
+def crop_images(img, samples, img_size=107, padding=16, valid=False, antialias=4):
+    '''
+    Batched version of crop_image: crop and resize all samples in one pass
+    - img: H x W x 3 uint8 array, or the output of image_to_tensor
+    - samples: 2d array of N x [x,y,w,h]
+    returns N x 3 x img_size x img_size float tensor, shifted by -128 (i.e. ready for the model)
+    '''
+    if not torch.is_tensor(img):
+        img = image_to_tensor(img)
+    boxes = crop_boxes(samples, img_size, padding, valid, img.shape[2:])
+    return crop_windows(img, boxes, img_size, img_size, antialias)
+
+
 class RegionExtractor():
-    def __init__(self, image, samples, crop_size, padding, batch_size, shuffle=False):
+    def __init__(self, image, samples, crop_size, padding, batch_size, shuffle=False, batched=True):
 
         self.image = np.asarray(image)
         self.samples = samples
@@ -96,6 +207,11 @@ class RegionExtractor():
         self.batch_size = batch_size
         self.shuffle = shuffle
 
+        # batched - crop the whole batch with crop_images, else crop_image per sample (reference path)
+        self.batched = batched
+        if batched:
+            self.image_tensor = image_to_tensor(self.image)
+
         self.index = np.arange(len(samples))
         self.pointer = 0
 
@@ -119,10 +235,46 @@ class RegionExtractor():
     next = __next__
 
     def extract_regions(self, index):
+        if self.batched:
+            return crop_images(self.image_tensor, self.samples[index], self.crop_size, self.padding).numpy()
+
         regions = np.zeros((len(index),self.crop_size,self.crop_size,3),dtype='uint8')
         for i, sample in enumerate(self.samples[index]):
             regions[i] = crop_image(self.image, sample, self.crop_size, self.padding)
 
-        regions = regions.transpose(0,3,1,2).astype('float32')
+        regions = np.ascontiguousarray(regions.transpose(0,3,1,2)).astype('float32')
         regions = regions - 128.
-        return regions
\ No newline at end of file
+        return regions
+
+
+crop_pools = {}
+
+
+def get_crop_pool(workers):
+    # thread pools are shared by all prefetchers, instead of being started per extraction
+    if workers not in crop_pools:
+        crop_pools[workers] = ThreadPoolExecutor(max_workers=workers)
+    return crop_pools[workers]
+
+
+class RegionPrefetcher():
+    # iterates over the batches of a RegionExtractor, cropping the next batches on background
+    # threads while the caller forwards the current one (PIL resizing and torch ops release the GIL)
+    # depth - batches cropped ahead of the consumer, 1 is double buffering
+    # workers - cropping threads
+    def __init__(self, extractor, depth=1, workers=1):
+        self.extractor = extractor
+        self.depth = depth
+        self.workers = workers
+
+    def __iter__(self):
+        extractor = self.extractor
+        pool = get_crop_pool(self.workers)
+        pending = deque()
+        for start in range(0, len(extractor.samples), extractor.batch_size):
+            index = extractor.index[start:start + extractor.batch_size]
+            pending.append(pool.submit(extractor.extract_regions, index))
+            if len(pending) > self.depth:
+                yield torch.from_numpy(pending.popleft().result())
+        while len(pending) > 0:
+            yield torch.from_numpy(pending.popleft().result())
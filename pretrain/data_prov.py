@@ -10,6 +10,11 @@ sys.path.insert(0,'../modules')
 from sample_generator import *
 from utils import *
 
+def frame_counts(total, n_frames):
+    # total samples split over n_frames, as evenly as possible (the remainder to the last frames)
+    return total // n_frames + (np.arange(n_frames) >= n_frames - total % n_frames)
+
+
 class FCDataset(data.Dataset):
     def __init__(self, img_dir, img_list, gt, opts):
 
@@ -95,19 +100,28 @@ class PosRegionDataset(data.Dataset):
                 if ('pos_regions' in saved_state.keys()) and ('pos_bbs_std_as_tensor' in saved_state.keys()):
                     # self.pos_regions_path = seq_regions_filename
                     self.pos_bbs_std_as_tensor = saved_state['pos_bbs_std_as_tensor']
+                    if len(self.pos_bbs_std_as_tensor) != self.gen_len * self.batch_pos:
+                        raise RuntimeError('%s: %d pre-generated samples, not %d per frame of %d frames' %
+                                           (seq_regions_filename, len(self.pos_bbs_std_as_tensor), self.batch_pos, self.gen_len))
                     if torch.cuda.is_available():
                         self.pos_bbs_std_as_tensor = self.pos_bbs_std_as_tensor.cuda()
                     return None
 
-            pos_regions = np.empty((0, 3, self.crop_size, self.crop_size))
-            pos_bbs = np.empty((0, 4))
-            for i, (img_path, bbox) in enumerate(zip(self.img_list, self.gt)):
+            # the samples of all the frames at once
+            pos_examples, pos_frames = gen_samples_batch(self.pos_generator, self.gt[:self.gen_len], self.batch_pos)
+            pos_regions = []
+            for i, img_path in enumerate(self.img_list[:self.gen_len]):
                 image = Image.open(img_path).convert('RGB')
                 image = np.asarray(image)
 
-                pos_examples = gen_samples(self.pos_generator, bbox, self.batch_pos)
-                pos_regions = np.concatenate((pos_regions, self.extract_regions(image, pos_examples,blackout=self.blackout)), axis=0)
-                pos_bbs = np.concatenate((pos_bbs, np.array(pos_examples, dtype='float32')), axis=0)
+                pos_regions.append(self.extract_regions(image, pos_examples[pos_frames == i],blackout=self.blackout))
+            pos_regions = np.concatenate(pos_regions)
+            pos_bbs = pos_examples
+            # train_mdnet indexes the samples of frame i at i * batch_pos
+            n_frame_samples = np.bincount(pos_frames, minlength=self.gen_len)
+            if np.any(n_frame_samples != self.batch_pos):
+                raise RuntimeError('%s: %d frames got other than %d pre-generated samples' %
+                                   (self.img_list[0], np.count_nonzero(n_frame_samples != self.batch_pos), self.batch_pos))
 
             pos_bbs_std = pos_bbs
             # assuming all frames in given sequence have the same size
@@ -148,37 +162,31 @@ class PosRegionDataset(data.Dataset):
         if self.pre_generate:
             return idx
         else:
-            pos_regions = np.empty((0, 3, self.crop_size, self.crop_size))
-            pos_bbs = np.empty((0,4))
             # image_path_list = []
             # gt_bbox_list = []
-            num_example_list = []
+            n_pos = frame_counts(self.batch_pos, len(idx))
 
+            # the samples of all the frames of the batch at once
             if self.generate_std:
-                for i, (img_path, image_std, bbox_std) in enumerate(zip(self.img_list[idx], self.image_std_as_numpy[idx], self.gt_std_as_numpy[idx])):
-                    # image_path_list.append(img_path)
-                    n_pos = (self.batch_pos - len(pos_regions)) // (self.batch_frames - i)
+                pos_examples, pos_frames = gen_samples_batch(self.pos_generator, self.gt_std_as_numpy[idx], n_pos)
+            else:
+                # pos_examples = gen_samples_batch(self.pos_generator, self.gt[idx], n_pos, overlap_range=self.overlap_pos)
+                # pos_examples = gen_samples_batch(self.pos_generator, self.gt[idx], n_pos)
+                pos_examples, pos_frames = gen_samples_batch(self.pos_generator, self.gt[idx], n_pos, overlap_range=[0.75,1])  # playing around
 
-                    # pos_examples = gen_samples(self.pos_generator, bbox, n_pos, overlap_range=self.overlap_pos)
-                    pos_examples_std = gen_samples(self.pos_generator, bbox_std, n_pos)
-                    pos_regions = np.concatenate((pos_regions, self.extract_regions(image_std, pos_examples_std,blackout=self.blackout)), axis=0)
-                    num_example_list.append(len(pos_examples_std))
-                    pos_bbs = np.concatenate((pos_bbs, np.array(pos_examples_std, dtype='float32')), axis=0)
+            pos_regions = []
+            if self.generate_std:
+                for i, image_std in enumerate(self.image_std_as_numpy[idx]):
+                    pos_regions.append(self.extract_regions(image_std, pos_examples[pos_frames == i],blackout=self.blackout))
 
             if not self.generate_std:
-                for i, (img_path, bbox) in enumerate(zip(self.img_list[idx], self.gt[idx])):
+                for i, img_path in enumerate(self.img_list[idx]):
                     # image_path_list.append(img_path)
 
                     image = Image.open(img_path).convert('RGB')
                     image = np.asarray(image)
 
-                    n_pos = (self.batch_pos - len(pos_regions)) // (self.batch_frames - i)
-
-                    # pos_examples = gen_samples(self.pos_generator, bbox, n_pos, overlap_range=self.overlap_pos)
-                    # pos_examples = gen_samples(self.pos_generator, bbox, n_pos)
-                    pos_examples = gen_samples(self.pos_generator, bbox, n_pos, overlap_range=[0.75,1], relentless=True)  # playing around
-                    pos_regions = np.concatenate((pos_regions, self.extract_regions(image, pos_examples,blackout=self.blackout)), axis=0)
-                    num_example_list.append(len(pos_examples))
+                    pos_regions.append(self.extract_regions(image, pos_examples[pos_frames == i],blackout=self.blackout))
 
                     # no need for these any more
                     # image = torch.from_numpy(image)
@@ -186,7 +194,10 @@ class PosRegionDataset(data.Dataset):
                     # bbox = torch.from_numpy(bbox).float()
                     # gt_bbox_list.append(bbox)
 
-                    pos_bbs = np.concatenate((pos_bbs, np.array(pos_examples, dtype='float32')), axis=0)
+            pos_regions = np.concatenate(pos_regions)
+            pos_bbs = pos_examples
+            # (a frame may get fewer samples than asked for, see gen_samples_batch)
+            num_example_list = np.bincount(pos_frames, minlength=len(idx)).tolist()
 
             pos_regions = torch.from_numpy(pos_regions).float()
 
@@ -257,22 +268,23 @@ class RegionDataset(data.Dataset):
             idx = np.concatenate((idx, self.index[:next_pointer]))
         self.pointer = next_pointer
 
-        pos_regions = np.empty((0, 3, self.crop_size, self.crop_size))
-        neg_regions = np.empty((0, 3, self.crop_size, self.crop_size))
-        for i, (img_path, bbox) in enumerate(zip(self.img_list[idx], self.gt[idx])):
+        # the samples of all the frames of the batch at once
+        n_pos = frame_counts(self.batch_pos, len(idx))
+        n_neg = frame_counts(self.batch_neg, len(idx))
+        pos_examples, pos_frames = gen_samples_batch(self.pos_generator, self.gt[idx], n_pos, overlap_range=self.overlap_pos)
+        neg_examples, neg_frames = gen_samples_batch(self.neg_generator, self.gt[idx], n_neg, overlap_range=self.overlap_neg)
+
+        pos_regions = []
+        neg_regions = []
+        for i, img_path in enumerate(self.img_list[idx]):
             image = Image.open(img_path).convert('RGB')
             image = np.asarray(image)
 
-            n_pos = (self.batch_pos - len(pos_regions)) // (self.batch_frames - i)
-            n_neg = (self.batch_neg - len(neg_regions)) // (self.batch_frames - i)
-            pos_examples = gen_samples(self.pos_generator, bbox, n_pos, overlap_range=self.overlap_pos)
-            neg_examples = gen_samples(self.neg_generator, bbox, n_neg, overlap_range=self.overlap_neg)
-            
-            pos_regions = np.concatenate((pos_regions, self.extract_regions(image, pos_examples)),axis=0)
-            neg_regions = np.concatenate((neg_regions, self.extract_regions(image, neg_examples)),axis=0)
+            pos_regions.append(self.extract_regions(image, pos_examples[pos_frames == i]))
+            neg_regions.append(self.extract_regions(image, neg_examples[neg_frames == i]))
 
-        pos_regions = torch.from_numpy(pos_regions).float()
-        neg_regions = torch.from_numpy(neg_regions).float()
+        pos_regions = torch.from_numpy(np.concatenate(pos_regions)).float()
+        neg_regions = torch.from_numpy(np.concatenate(neg_regions)).float()
         return pos_regions, neg_regions
     next = __next__
 
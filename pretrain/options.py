@@ -1,30 +1,35 @@
 from collections import OrderedDict
 
 import torch
-training_device = torch.device('cuda:0')
-total_mem = torch.cuda.get_device_properties(training_device).total_memory
 
 pretrain_opts = OrderedDict()
 
-if torch.cuda.is_available():
-    torch.cuda.empty_cache()
-    training_device = torch.device('cuda:0')
-    total_mem = torch.cuda.get_device_properties(training_device).total_memory
-    pretrain_opts['large_memory_gpu'] = True  # regnet won't backward() on every sample
-    if total_mem > 2500000000:  # 2.5 GB
-        pretrain_opts['use_gpu'] = True
-        # pretrain_opts['large_memory_gpu'] = True
-        # print('mdnet training using gpu')
-    else:
+pretrain_opts['use_gpu'] = None  # None - probed on first use (use_gpu()), True / False - forced
+pretrain_opts['large_memory_gpu'] = None  # regnet won't backward() on every sample. None - a gpu is available
+
+
+def use_gpu():
+    # probes the gpu on first call, not at import (the probe creates a CUDA context), the result is kept in
+    # pretrain_opts['use_gpu']
+    if pretrain_opts['use_gpu'] is None:
         pretrain_opts['use_gpu'] = False
-        # pretrain_opts['large_memory_gpu'] = False
-        # print('mdnet training using cpu')
-        training_device = 'cpu'
-else:
-    pretrain_opts['use_gpu'] = False
-    pretrain_opts['large_memory_gpu'] = False
-    # print('mdnet training using cpu')
-    training_device = 'cpu'
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+            total_mem = torch.cuda.get_device_properties(torch.device('cuda:0')).total_memory
+            if total_mem > 2500000000:  # 2.5 GB
+                pretrain_opts['use_gpu'] = True
+                # print('mdnet training using gpu')
+    return pretrain_opts['use_gpu']
+
+
+def large_memory_gpu():
+    if pretrain_opts['large_memory_gpu'] is None:
+        pretrain_opts['large_memory_gpu'] = torch.cuda.is_available()  # (no CUDA context)
+    return pretrain_opts['large_memory_gpu']
+
+
+def get_device():
+    return torch.device('cuda:0') if use_gpu() else 'cpu'
 
 
 pretrain_opts['use_summary'] = True
@@ -43,6 +48,7 @@ pretrain_opts['overlap_neg'] = [0, 0.5]
 
 pretrain_opts['img_size'] = 107
 pretrain_opts['padding'] = 16
+pretrain_opts['compiled_inference'] = False  # True - compiled MDNet inference forwards for the regnet feature extraction
 
 pretrain_opts['lr'] = 0.0001
 pretrain_opts['w_decay'] = 0.0005
@@ -44,8 +44,7 @@ sys.path.append("..")
 from tracking.tracking_utils import *
 from pathlib import Path, PureWindowsPath
 
-import options
-device = options.training_device
+import options  # (the device is probed on first use, by options.use_gpu() / options.get_device())
 opts = options.pretrain_opts
 from tracking.options import tracking_opts
 
@@ -168,6 +167,8 @@ def validate_regnet(md_model_path, validate_regnet_opts=validate_regnet_opts_def
     md_model = MDNet(md_model_path)
     if torch.cuda.is_available():
         md_model = md_model.cuda()
+    if opts['compiled_inference']:
+        md_model.compile_inference()
 
     # -------------
 
@@ -276,14 +277,11 @@ def validate_regnet(md_model_path, validate_regnet_opts=validate_regnet_opts_def
             feats_bbs = forward_regions(md_model, pos_regions, is_cuda=torch.cuda.is_available())
             # using forward_samples on pos_bbs called crop image with valid==False ...
 
-            for iterator, (num_examples, frame_path) in enumerate(zip(num_example_list, image_path_list)):
-                feats_frame = frame_features[k][frame_path]
-                if iterator == 0:
-                    expanded_feats_frames = feats_frame.repeat(num_examples, 1)
-                    expanded_gt_bbox_std_as_tensor = gt_bbox_std_as_tensor[iterator].repeat(num_examples,1)
-                else:
-                    expanded_feats_frames = torch.cat((expanded_feats_frames, feats_frame.repeat(num_examples, 1)))
-                    expanded_gt_bbox_std_as_tensor = torch.cat((expanded_gt_bbox_std_as_tensor, gt_bbox_std_as_tensor[iterator].repeat(num_examples, 1)))
+            # features of every frame once, and the frame of every example (RegNet.forward_split)
+            feats_frames = torch.cat([frame_features[k][frame_path] for frame_path in image_path_list])
+            example_frames = torch.repeat_interleave(torch.arange(len(num_example_list), device=feats_frames.device),
+                                                     torch.as_tensor(num_example_list, device=feats_frames.device))
+            expanded_gt_bbox_std_as_tensor = gt_bbox_std_as_tensor[example_frames.to(gt_bbox_std_as_tensor.device)]
 
             pos_bbs_std = pos_bbs
             # assuming all frames in given sequence have the same size
@@ -297,9 +295,7 @@ def validate_regnet(md_model_path, validate_regnet_opts=validate_regnet_opts_def
             else:
                 pos_bbs_std_as_tensor = torch.Tensor(pos_bbs_std)
 
-            net_input = torch.cat((feats_bbs, expanded_feats_frames, pos_bbs_std_as_tensor), dim=1)
-
-            bb_refined_std = regnet_model(net_input)
+            bb_refined_std = regnet_model.forward_split(feats_bbs, feats_frames, pos_bbs_std_as_tensor, example_frames)
             if translate_mode:
                 if quadrilateral:
                     pos_bbs_quadrilateral_std_as_tensor = pos_bbs_std_as_tensor.repeat(1, 2)
@@ -507,6 +503,8 @@ def train_regnet(md_model_path, train_regnet_opts=train_regnet_opts_defaults):
     md_model = MDNet(md_model_path)
     if torch.cuda.is_available():
         md_model = md_model.cuda()
+    if opts['compiled_inference']:
+        md_model.compile_inference()
 
     # -------------
 
@@ -702,14 +700,11 @@ def train_regnet(md_model_path, train_regnet_opts=train_regnet_opts_defaults):
                 feats_bbs = forward_regions(md_model, pos_regions, is_cuda=torch.cuda.is_available())
                 # using forward_samples on pos_bbs called crop image with valid==False ...
 
-            for iterator, (num_examples, frame_path) in enumerate(zip(num_example_list, image_path_list)):
-                feats_frame = frame_features[k][frame_path]
-                if iterator == 0:
-                    expanded_feats_frames = feats_frame.repeat(num_examples, 1)
-                    expanded_gt_bbox_std_as_tensor = gt_bbox_std_as_tensor[iterator].repeat(num_examples,1)
-                else:
-                    expanded_feats_frames = torch.cat((expanded_feats_frames, feats_frame.repeat(num_examples, 1)))
-                    expanded_gt_bbox_std_as_tensor = torch.cat((expanded_gt_bbox_std_as_tensor, gt_bbox_std_as_tensor[iterator].repeat(num_examples, 1)))
+            # features of every frame once, and the frame of every example (RegNet.forward_split)
+            feats_frames = torch.cat([frame_features[k][frame_path] for frame_path in image_path_list])
+            example_frames = torch.repeat_interleave(torch.arange(len(num_example_list), device=feats_frames.device),
+                                                     torch.as_tensor(num_example_list, device=feats_frames.device))
+            expanded_gt_bbox_std_as_tensor = gt_bbox_std_as_tensor[example_frames.to(gt_bbox_std_as_tensor.device)]
 
             if not pre_generate:
                 pos_bbs_std = pos_bbs
@@ -725,9 +720,7 @@ def train_regnet(md_model_path, train_regnet_opts=train_regnet_opts_defaults):
                 else:
                     pos_bbs_std_as_tensor = torch.Tensor(pos_bbs_std)
 
-            net_input = torch.cat((feats_bbs, expanded_feats_frames, pos_bbs_std_as_tensor), dim=1)
-
-            bb_refined_std = regnet_model(net_input)
+            bb_refined_std = regnet_model.forward_split(feats_bbs, feats_frames, pos_bbs_std_as_tensor, example_frames)
             if translate_mode:
                 if quadrilateral:
                     pos_bbs_quadrilateral_std_as_tensor = pos_bbs_std_as_tensor.repeat(1, 2)
@@ -780,7 +773,7 @@ def train_regnet(md_model_path, train_regnet_opts=train_regnet_opts_defaults):
 
 
             total_loss = loss
-            if pretrain_opts['large_memory_gpu'] or not torch.cuda.is_available():
+            if options.large_memory_gpu() or not torch.cuda.is_available():
                 total_loss.backward()
             else:
                 raise Exception('did not backward. indirect loss scenario not covered yet.')
@@ -794,7 +787,7 @@ def train_regnet(md_model_path, train_regnet_opts=train_regnet_opts_defaults):
 
             # displaying stats for current sequence
             # reminder: we only processed a batch of frames from current sequence, not all of it
-            if pretrain_opts['large_memory_gpu'] or not torch.cuda.is_available():
+            if options.large_memory_gpu() or not torch.cuda.is_available():
                 if total_loss.dim() == 0:
                     total_loss = total_loss.data
                 else:
@@ -949,7 +942,7 @@ def train_mdnet(data_path=data_path_default,img_home=img_home_default):
         seqnames.append(seqname)
 
     use_summary = opts['use_summary']
-    use_gpu = opts['use_gpu']
+    use_gpu = options.use_gpu()
     # prepare for tensorboardX
     if use_summary:
         summary = SummaryWriter(comment='CrossEntropyLoss')
@@ -958,7 +951,7 @@ def train_mdnet(data_path=data_path_default,img_home=img_home_default):
     # Init model #
     model = MDNet(opts['init_model_path'], K)
     if use_gpu:
-        model = model.to(device)
+        model = model.to(options.get_device())
     model.set_learnable_params(opts['ft_layers'])
 
     # Init criterion and optimizer #
@@ -0,0 +1,10 @@
+# needed for following usage:
+#  python -m pytest -q tests
+
+import os
+import sys
+
+# the modules are imported as the scripts import them, from their directories on the path
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ['modules', 'tracking']:
+    sys.path.insert(0, os.path.join(root, directory))
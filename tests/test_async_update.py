@@ -0,0 +1,77 @@
+import copy
+
+import numpy as np
+import torch
+
+from model import MDNet
+from FocalLoss import FocalLoss
+from tracking_utils import opts, set_optimizer, train
+from async_update import AsyncUpdater
+
+maxiter = 3
+
+
+def setup():
+    np.random.seed(0)
+    torch.manual_seed(0)
+    model = MDNet()
+    model.set_learnable_params(opts['ft_layers'])
+    criterion = FocalLoss(class_num=2, alpha=torch.ones(2, 1)*0.25, size_average=False)
+    return model, criterion
+
+
+def bank_feats(frame):
+    # fewer rows than train() draws, so the snapshots are the whole banks
+    generator = torch.Generator().manual_seed(frame)
+    return torch.relu(torch.randn(64, 4608, generator=generator)), torch.relu(torch.randn(200, 4608, generator=generator))
+
+
+def test_flush_reproduces_sync_training():
+    model, criterion = setup()
+    sync = copy.deepcopy(model)
+
+    np.random.seed(1)
+    updater = AsyncUpdater(model, criterion, lr=opts['lr_update'], maxiter=maxiter, layers=opts['ft_layers'])
+    # the updater rng, as seeded from the global one
+    np.random.seed(1)
+    rng = np.random.default_rng(np.random.randint(2**31))
+    optimizer = set_optimizer(sync, opts['lr_update'])
+    try:
+        # two updates, the momentum of the first carries over
+        for frame in [5, 9]:
+            pos_feats, neg_feats = bank_feats(frame)
+            torch.manual_seed(frame)  # (dropout)
+            updater.submit(frame, pos_feats, neg_feats)
+            assert updater.flush(frame + 1) == 1
+
+            torch.manual_seed(frame)
+            train(sync, criterion, optimizer, pos_feats, neg_feats, maxiter, rng=rng)
+
+            sync_params = dict(sync.named_parameters())
+            for name, p in model.named_parameters():
+                assert torch.equal(p, sync_params[name]), name
+    finally:
+        updater.close()
+    assert updater.staleness == [1, 1]
+
+
+def test_worker_keeps_off_the_global_rng():
+    model, criterion = setup()
+    updater = AsyncUpdater(model, criterion, lr=opts['lr_update'], maxiter=maxiter, layers=opts['ft_layers'])
+    try:
+        state = np.random.get_state()
+        updater.submit(1, *bank_feats(1))
+        updater.flush(2)
+        assert all(np.array_equal(a, b) for a, b in zip(state, np.random.get_state()))
+    finally:
+        updater.close()
+
+
+def test_swap_without_update():
+    model, criterion = setup()
+    updater = AsyncUpdater(model, criterion, lr=opts['lr_update'], maxiter=maxiter, layers=opts['ft_layers'])
+    try:
+        assert updater.swap(3) is None
+        assert updater.flush(3) is None
+    finally:
+        updater.close()
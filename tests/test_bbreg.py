@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+import torch
+
+from bbreg import BBRegressor
+
+# predictions (offsets) against sklearn's Ridge, and an updated factorization against a full refit
+tolerance = 2e-5
+
+
+def examples(n, d, seed):
+    # non-negative features (as conv3 after ReLU) and float64 offsets, a noisy linear function of them
+    generator = torch.Generator().manual_seed(seed)
+    X = torch.relu(torch.randn(n, d, generator=generator)) * 3
+    W = torch.randn(d, 4, generator=generator) * 0.01
+    Y = (X @ W).double() + torch.randn(n, 4, generator=generator, dtype=torch.float64) * 0.01
+    return X, Y
+
+
+def predictions(regressor, X):
+    return torch.addmm(regressor.b, X, regressor.W).double()
+
+
+@pytest.mark.parametrize('n, d', [(200, 500), (500, 100)], ids=['dual', 'primal'])
+def test_fit_matches_sklearn_ridge(n, d):
+    sklearn_linear_model = pytest.importorskip('sklearn.linear_model')
+    X, Y = examples(n, d, 0)
+    regressor = BBRegressor((640, 360))
+    regressor.fit(X, Y)
+    ridge = sklearn_linear_model.Ridge(alpha=regressor.alpha).fit(X.double().numpy(), Y.numpy())
+
+    X_test, _ = examples(50, d, 1)
+    expected = ridge.predict(X_test.double().numpy())
+    assert np.abs(predictions(regressor, X_test).numpy() - expected).max() < tolerance
+
+
+def test_update_equals_refit():
+    X, Y = examples(300, 500, 0)
+    X_new, Y_new = examples(40, 500, 1)
+    regressor = BBRegressor((640, 360))
+    regressor.n_train = len(X)
+    regressor.fit(X, Y)
+    # the offsets of the examples are given directly, instead of computed from their boxes
+    regressor.examples = lambda X, Y, gt: (X, Y)
+    regressor.update(X_new, Y_new, None)
+
+    refit = BBRegressor((640, 360))
+    refit.fit(torch.cat((X, X_new)), torch.cat((Y, Y_new)))
+    X_test, _ = examples(50, 500, 2)
+    assert (predictions(regressor, X_test) - predictions(refit, X_test)).abs().max().item() < tolerance
+
+
+def test_update_window_keeps_the_train_examples():
+    X, Y = examples(100, 300, 0)
+    regressor = BBRegressor((640, 360), max_update_samples=60)
+    regressor.n_train = len(X)
+    regressor.fit(X, Y)
+    regressor.examples = lambda X, Y, gt: (X, Y)
+    updates = [examples(25, 300, seed) for seed in range(1, 5)]
+    for X_new, Y_new in updates:
+        regressor.update(X_new, Y_new, None)
+
+    # the train examples, then the most recent updates, within max_update_samples
+    n_updates = len(regressor.X) - len(X)
+    assert 0 < n_updates <= regressor.max_update_samples
+    assert torch.equal(regressor.X[:len(X)], X)
+    kept = torch.cat([X_new for X_new, _ in updates])[-n_updates:]
+    assert torch.equal(regressor.X[len(X):], kept)
+
+    # and the factorization of the kept examples
+    refit = BBRegressor((640, 360))
+    refit.fit(regressor.X, regressor.Y)
+    X_test, _ = examples(50, 300, 9)
+    assert (predictions(regressor, X_test) - predictions(refit, X_test)).abs().max().item() < tolerance
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from utils import crop_image, crop_images
+
+# crop_images (bilinear grid sampling, supersampled when shrinking) vs crop_image (the PIL bilinear resize of
+# the reference path): in gray levels of 0..255, mean and 99th percentile of the absolute difference per crop
+mean_tolerance = 2.
+percentile_tolerance = 10.
+
+img_w, img_h = 640, 360
+
+boxes = {
+    'interior': [200, 100, 80, 120],
+    'interior small': [300, 150, 20, 30],
+    'interior large': [100, 50, 300, 250],
+    'border top left': [-20, -10, 90, 100],
+    'border bottom right': [img_w - 50, img_h - 60, 90, 100],
+    'out of frame': [img_w + 10, img_h + 10, 50, 50],
+    'out of frame left': [-200, 100, 100, 80],
+}
+
+
+@pytest.fixture(scope='module')
+def image():
+    # smooth random texture, as a natural image at the crop scales
+    rng = np.random.default_rng(0)
+    small = rng.integers(0, 256, (img_h // 8, img_w // 8, 3), dtype=np.uint8)
+    return np.asarray(Image.fromarray(small).resize((img_w, img_h), Image.BILINEAR))
+
+
+def reference(image, box, padding):
+    return crop_image(image, np.array(box, dtype='float32'), 107, padding).astype('float32').transpose(2, 0, 1) - 128.
+
+
+@pytest.mark.parametrize('padding', [16, 0])
+@pytest.mark.parametrize('name', list(boxes))
+def test_crop_images_matches_crop_image(image, name, padding):
+    batched = crop_images(image, np.array([boxes[name]], dtype='float32'), 107, padding)[0].numpy()
+    diff = np.abs(batched - reference(image, boxes[name], padding))
+    assert diff.mean() < mean_tolerance
+    assert np.percentile(diff, 99) < percentile_tolerance
+
+
+@pytest.mark.parametrize('padding', [16, 0])
+def test_out_of_frame_is_gray(image, padding):
+    # the 128 fill, exactly, in both paths
+    for name in ['out of frame', 'out of frame left']:
+        assert np.all(reference(image, boxes[name], padding) == 0)
+        assert np.all(crop_images(image, np.array([boxes[name]], dtype='float32'), 107, padding).numpy() == 0)
+
+
+def test_border_fill(image):
+    # the part of a border crop outside the image is the 128 fill in both paths
+    box = boxes['border top left']
+    batched = crop_images(image, np.array([box], dtype='float32'), 107, 16)[0].numpy()
+    ref = reference(image, box, 16)
+    # the first rows and columns of the crop are above / left of the image (away from its edge)
+    assert np.all(ref[:, :5, :] == 0) and np.all(ref[:, :, :5] == 0)
+    assert np.all(batched[:, :5, :] == 0) and np.all(batched[:, :, :5] == 0)
+
+
+def test_batch_of_boxes(image):
+    # a batch is cropped as its boxes one by one
+    samples = np.array(list(boxes.values()), dtype='float32')
+    batched = crop_images(image, samples, 107, 16).numpy()
+    for i, box in enumerate(samples):
+        assert np.array_equal(batched[i], crop_images(image, box[None], 107, 16)[0].numpy())
@@ -0,0 +1,44 @@
+import numpy as np
+import torch
+
+from feature_bank import FeatureBank
+
+
+def sorted_rows(x):
+    # rows in a canonical order, all() is not chronological once the bank wrapped around
+    return x[np.lexsort(x.numpy().T[::-1])]
+
+
+def test_frames_match_concatenated_lists():
+    # against the original lists of the last n_frames per frame tensors, over several wrap-arounds,
+    # with frames of fewer samples than n_per_frame (and one of more, kept up to n_per_frame)
+    n_frames, n_per_frame, window = 5, 4, 3
+    bank = FeatureBank(n_frames, n_per_frame, window=window, with_ious=True)
+    generator = torch.Generator().manual_seed(0)
+    feats_all, ious_all = [], []
+    for frame, n in enumerate([4, 4, 2, 4, 1, 4, 4, 3, 6, 4, 4, 4, 2, 4]):
+        feats = torch.randn(n, 8, generator=generator)
+        ious = np.random.RandomState(frame).rand(n)
+        bank.append(feats, ious)
+        feats_all = (feats_all + [feats[:n_per_frame]])[-n_frames:]
+        ious_all = (ious_all + [ious[:n_per_frame]])[-n_frames:]
+
+        assert len(bank) == len(feats_all)
+        for n_last in range(1, window + 1):
+            feats, ious = bank.last(n_last)
+            assert torch.equal(feats, torch.cat(feats_all[-n_last:]))
+            assert np.array_equal(ious, np.concatenate(ious_all[-n_last:]))
+        feats, ious = bank.all()
+        assert torch.equal(sorted_rows(feats), sorted_rows(torch.cat(feats_all)))
+        assert np.array_equal(np.sort(ious), np.sort(np.concatenate(ious_all)))
+
+
+def test_full_frames_are_views():
+    bank = FeatureBank(4, 3, window=2)
+    for frame in range(6):
+        bank.append(torch.full((3, 2), float(frame)))
+    feats, ious = bank.last(2)
+    assert ious is None
+    assert feats.data_ptr() >= bank.feats.data_ptr()
+    assert feats.data_ptr() < bank.feats.data_ptr() + bank.feats.numel() * bank.feats.element_size()
+    assert feats[:, 0].tolist() == [4, 4, 4, 5, 5, 5]
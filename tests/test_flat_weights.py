@@ -0,0 +1,168 @@
+import os
+
+import numpy as np
+import pytest
+import torch
+import torch.nn as nn
+
+from flat_weights import save_flat, load_flat, load_state, load_checkpoint, cache_path, MappedStateDict
+from model import MDNet, RegNet
+
+
+def assert_same_state(loaded, state):
+    assert list(loaded.keys()) == list(state.keys())
+    for k, v in state.items():
+        assert loaded[k].dtype == v.dtype and loaded[k].shape == v.shape, k
+        assert torch.equal(loaded[k], v), k
+
+
+def test_round_trip_mdnet(tmp_path):
+    torch.manual_seed(0)
+    model = MDNet()
+    state = model.layers.state_dict()
+    path = str(tmp_path / 'mdnet.flat')
+    # (the optimizer state is neither a state dict of tensors nor json)
+    dropped = save_flat(path, {'shared_layers': state, 'epoch': 3, 'optimizer': object()})
+    assert dropped == ['optimizer']
+
+    checkpoint = load_flat(path)
+    assert checkpoint['epoch'] == 3 and 'optimizer' not in checkpoint
+    assert isinstance(checkpoint['shared_layers'], MappedStateDict)
+    assert_same_state(checkpoint['shared_layers'], state)
+
+    loaded = MDNet(path)
+    assert_same_state(loaded.layers.state_dict(), state)
+
+
+def test_round_trip_regnet(tmp_path):
+    torch.manual_seed(0)
+    regnet = RegNet()
+    state = {'RegNet_layers': regnet.layers.state_dict(), 'translate_mode': False, 'best_prec': 0.75,
+             'frames': torch.arange(5, dtype=torch.int64)}
+    path = str(tmp_path / 'regnet.flat')
+    assert save_flat(path, state) == []
+
+    checkpoint = load_checkpoint(path)
+    assert checkpoint['translate_mode'] is False and checkpoint['best_prec'] == 0.75
+    assert checkpoint['frames'].dtype == torch.int64 and torch.equal(checkpoint['frames'], state['frames'])
+    assert_same_state(checkpoint['RegNet_layers'], state['RegNet_layers'])
+
+    loaded = RegNet(state=checkpoint).eval()
+    assert not loaded.translate_mode
+    regnet.translate_mode = False
+    x = torch.cat((torch.relu(torch.randn(3, 2 * 4608)), torch.rand(3, 4) * 107), 1)
+    with torch.no_grad():
+        assert torch.equal(loaded(x), regnet.eval()(x))
+
+
+def test_dtypes_and_shapes(tmp_path):
+    # tensors of any dtype and shape, each aligned in the file
+    state = {'half': torch.randn(3, 5).half(), 'double': torch.randn(7).double(), 'int8': torch.arange(-4, 9, dtype=torch.int8),
+             'bool': torch.tensor([True, False, True]), 'scalar': torch.tensor(2.5), 'empty': torch.zeros(0, 4)}
+    path = str(tmp_path / 'dtypes.flat')
+    save_flat(path, {'state': state})
+    assert_same_state(load_flat(path)['state'], state)
+
+
+def test_writes_stay_private(tmp_path):
+    # the file is mapped copy on write, training a loaded parameter does not change the file
+    torch.manual_seed(0)
+    state = MDNet().layers.state_dict()
+    path = str(tmp_path / 'mdnet.flat')
+    save_flat(path, {'shared_layers': state})
+    with open(path, 'rb') as f:
+        content = f.read()
+
+    loaded = MDNet()
+    mapped = load_flat(path)['shared_layers']
+    load_state(loaded.layers, mapped)
+    # the parameters are the mapped tensors, not copies
+    assert loaded.layers.fc4[1].weight.data_ptr() == mapped['fc4.1.weight'].data_ptr()
+    with torch.no_grad():
+        loaded.layers.fc4[1].weight.add_(1)
+        loaded.layers.conv1[0].bias.zero_()
+    assert torch.equal(mapped['fc4.1.weight'], state['fc4.1.weight'] + 1)
+    with open(path, 'rb') as f:
+        assert f.read() == content
+    # and other loads of the file do not see the writes
+    assert_same_state(load_flat(path)['shared_layers'], state)
+    assert_same_state(MDNet(path).layers.state_dict(), state)
+
+
+def mapped_state(tmp_path, state):
+    path = str(tmp_path / 'state.flat')
+    save_flat(path, {'layers': state})
+    return load_flat(path)['layers']
+
+
+def test_strict_errors(tmp_path):
+    module = nn.Sequential(nn.Linear(4, 3), nn.Linear(3, 2))
+    state = module.state_dict()
+
+    missing = mapped_state(tmp_path, {k: v for k, v in state.items() if k != '1.bias'})
+    with pytest.raises(RuntimeError, match=r"missing keys \['1.bias'\]"):
+        load_state(module, missing)
+    unexpected = mapped_state(tmp_path, dict(state, **{'2.weight': torch.zeros(1)}))
+    with pytest.raises(RuntimeError, match=r"unexpected keys \['2.weight'\]"):
+        load_state(module, unexpected)
+    mismatch = mapped_state(tmp_path, dict(state, **{'0.weight': torch.zeros(3, 5)}))
+    with pytest.raises(RuntimeError, match=r'size mismatch for 0.weight: \(3, 5\) in the file, \(3, 4\) in the model'):
+        load_state(module, mismatch)
+    # a size mismatch fails even if not strict
+    with pytest.raises(RuntimeError, match='size mismatch'):
+        load_state(module, mismatch, strict=False)
+
+    # not strict - the keys of both are loaded, the others left as they are
+    bias = module[1].bias.detach().clone()
+    partial = mapped_state(tmp_path, {'0.weight': torch.ones(3, 4), '2.weight': torch.zeros(1)})
+    load_state(module, partial, strict=False)
+    assert torch.equal(module[0].weight, torch.ones(3, 4)) and torch.equal(module[1].bias, bias)
+
+
+def save_mat(path, seed):
+    # the conv layers of a MatConvNet imagenet-vgg-m.mat (conv, relu, norm, pool per layer)
+    import scipy.io
+    rng = np.random.RandomState(seed)
+    shapes = [(7, 7, 3, 96), (5, 5, 96, 256), (3, 3, 256, 512)]
+    layers = np.empty((1, 12), dtype=object)
+    for i in range(12):
+        weights = np.empty((1, 2), dtype=object)
+        weights[0, 0] = np.zeros((1, 1), dtype='float32')
+        weights[0, 1] = np.zeros((1, 1), dtype='float32')
+        if i % 4 == 0:
+            shape = shapes[i // 4]
+            weights[0, 0] = rng.randn(*shape).astype('float32')
+            weights[0, 1] = rng.randn(shape[3], 1).astype('float32')
+        layers[0, i] = {'weights': weights}
+    scipy.io.savemat(path, {'layers': layers})
+    return layers
+
+
+def conv_weight(layers, i):
+    return torch.from_numpy(np.transpose(layers[0, i * 4]['weights'][0, 0], (3, 2, 0, 1)))
+
+
+def test_mat_cache_by_content(tmp_path, monkeypatch):
+    scipy_io = pytest.importorskip('scipy.io')
+    path = str(tmp_path / 'imagenet-vgg-m.mat')
+    layers = save_mat(path, 0)
+    cached = cache_path(path)
+    assert cache_path(path) == cached  # (same content, same key)
+
+    model = MDNet(path)
+    assert os.path.isfile(cached)
+    for i in range(3):
+        assert torch.equal(getattr(model.layers, 'conv%d' % (i + 1))[0].weight, conv_weight(layers, i))
+    # loaded again from the cache, the .mat is not read
+    with monkeypatch.context() as patch:
+        patch.setattr(scipy_io, 'loadmat', lambda *args, **kwargs: pytest.fail('.mat read again'))
+        assert torch.equal(MDNet(path).layers.conv3[0].weight, conv_weight(layers, 2))
+
+    # a changed .mat gets a new key, its weights are not taken from the old cache
+    layers = save_mat(path, 1)
+    assert cache_path(path) != cached
+    model = MDNet(path)
+    assert os.path.isfile(cached)
+    assert os.path.isfile(cache_path(path))
+    for i in range(3):
+        assert torch.equal(getattr(model.layers, 'conv%d' % (i + 1))[0].weight, conv_weight(layers, i))
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+import torch
+
+from model import MDNet
+from tracking_utils import forward_samples, forward_samples_all, forward_samples_layers
+from bbreg import BBRegressor
+
+image = np.random.RandomState(0).randint(0, 256, (120, 160, 3)).astype('uint8')
+
+
+@pytest.fixture(scope='module')
+def model():
+    torch.manual_seed(0)
+    return MDNet()
+
+
+@pytest.mark.parametrize('layer, size', [('conv3', 4608), ('fc4', 512), ('fc5', 512), ('fc6', 2)])
+def test_no_samples(model, layer, size):
+    feats = forward_samples(model, image, np.zeros((0, 4), dtype='float32'), out_layer=layer, is_cuda=False)
+    assert feats.shape == (0, size)
+
+
+def test_no_samples_all_layers(model):
+    feats, scores = forward_samples_all(model, image, np.zeros((0, 4), dtype='float32'), is_cuda=False)
+    assert feats.shape == (0, 4608) and scores.shape == (0, 2)
+
+
+def test_layers_of_one_pass(model):
+    samples = np.array([[20, 30, 50, 40], [60, 10, 70, 80], [0, 0, 30, 30]], dtype='float32')
+    feats, scores = forward_samples_layers(model, image, samples, ['conv3', 'fc6'], is_cuda=False)
+    assert torch.allclose(feats, forward_samples(model, image, samples, out_layer='conv3', is_cuda=False))
+    assert torch.allclose(scores, forward_samples(model, image, samples, out_layer='fc6', is_cuda=False), atol=1e-6)
+
+
+def test_bbreg_update_without_samples(model):
+    bbox = np.array([40, 30, 60, 50], dtype='float32')
+    samples = bbox + np.random.RandomState(1).uniform(-3, 3, (40, 4)).astype('float32')
+    regressor = BBRegressor((160, 120))
+    regressor.train(forward_samples(model, image, samples, is_cuda=False), samples, bbox)
+    W, b = regressor.W.clone(), regressor.b.clone()
+
+    empty = np.zeros((0, 4), dtype='float32')
+    regressor.update(forward_samples(model, image, empty, is_cuda=False), empty, bbox)
+    assert torch.equal(regressor.W, W) and torch.equal(regressor.b, b)
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from frame_source import FrameSource, FrameSlice, load_frame
+
+n_frames = 12
+
+
+@pytest.fixture(scope='module')
+def img_list(tmp_path_factory):
+    # small lossless frames, each one different
+    directory = tmp_path_factory.mktemp('frames')
+    img_list = []
+    for i in range(n_frames):
+        path = str(directory / ('%04d.png' % i))
+        image = np.random.RandomState(i).randint(0, 256, (24, 32, 3)).astype('uint8')
+        Image.fromarray(image).save(path)
+        img_list.append(path)
+    return img_list
+
+
+def decoded(img_list, indices):
+    return [np.asarray(load_frame(img_list[i])[0]) for i in indices]
+
+
+def same(frames, expected):
+    return len(frames) == len(expected) and all(np.array_equal(np.asarray(a), b) for a, b in zip(frames, expected))
+
+
+@pytest.mark.parametrize('depth, workers', [(0, 1), (1, 1), (4, 1), (4, 3), (20, 2)])
+def test_in_order_as_synchronous_decode(img_list, depth, workers):
+    frames = FrameSource(img_list, depth, workers)
+    try:
+        assert len(frames) == n_frames
+        assert same([frames[i] for i in range(n_frames)], decoded(img_list, range(n_frames)))
+        # nothing is left decoding after the last frame
+        assert len(frames.pending) == 0
+        assert len(frames.decode_times) == len(frames.wait_times) == len(frames.queue_depths) == n_frames
+    finally:
+        frames.close()
+
+
+def test_slices(img_list):
+    frames = FrameSource(img_list, 3, 2)
+    try:
+        # a run, then a re-init a few frames ahead (as after a tracking loss), from a slice of a slice
+        assert same([frames[i] for i in range(4)], decoded(img_list, range(4)))
+        rest = frames[6:]
+        assert isinstance(rest, FrameSlice) and rest.source is frames and len(rest) == n_frames - 6
+        assert same([rest[i] for i in range(3)], decoded(img_list, range(6, 9)))
+        assert all(j > 8 for j in frames.pending)
+        window = rest[2:5]
+        assert len(window) == 3
+        assert same([window[i] for i in range(len(window))], decoded(img_list, range(8, 11)))
+        assert same([frames[-1]], decoded(img_list, [n_frames - 1]))
+        # a jump back is decoded again
+        assert same([frames[1]], decoded(img_list, [1]))
+        with pytest.raises(IndexError):
+            frames[n_frames]
+    finally:
+        frames.close()
+
+
+def test_close_early(img_list):
+    frames = FrameSource(img_list, 4, 2)
+    assert same([frames[0], frames[1]], decoded(img_list, [0, 1]))
+    frames.close()
+    assert frames.pool is None and frames.pending == {}
+    frames.close()
+    # after close, frames are decoded on the caller thread
+    assert same([frames[i] for i in range(2, 5)], decoded(img_list, range(2, 5)))
@@ -0,0 +1,118 @@
+import pytest
+import torch
+import torch.nn as nn
+
+from lowrank import LowRankLinear, factorize_linear, factorize_layers, svd_rank, dense_weight
+from model import MDNet, RegNet
+
+
+def linear_with_singular_values(singular_values, in_features, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    out_features = len(singular_values)
+    U = torch.linalg.qr(torch.randn(out_features, out_features, generator=generator))[0]
+    V = torch.linalg.qr(torch.randn(in_features, out_features, generator=generator))[0]
+    linear = nn.Linear(in_features, out_features)
+    with torch.no_grad():
+        linear.weight.copy_(U @ torch.diag(torch.tensor(singular_values)) @ V.t())
+    return linear
+
+
+def test_full_rank_reproduces_linear():
+    torch.manual_seed(0)
+    linear = nn.Linear(64, 48)
+    x = torch.randn(20, 64)
+    for rank in [48, 100]:  # (at most the full rank)
+        low_rank = factorize_linear(linear, rank=rank)
+        assert low_rank.rank == 48
+        with torch.no_grad():
+            assert torch.allclose(low_rank(x), linear(x), atol=1e-5)
+        assert torch.allclose(dense_weight(low_rank), linear.weight, atol=1e-5)
+        # the factors as two Linear layers
+        first, second = low_rank.to_linears()
+        with torch.no_grad():
+            assert torch.allclose(second(first(x)), low_rank(x), atol=1e-5)
+
+
+@pytest.mark.parametrize('energy, rank', [(0.5, 1), (0.75, 1), (0.9, 2), (0.95, 3), (0.99, 4), (1.0, 4)])
+def test_energy_rank(energy, rank):
+    # squared singular values 16, 4, 1, 0.25: cumulative fractions 0.753, 0.941, 0.988, 1
+    linear = linear_with_singular_values([4., 2., 1., 0.5], 10)
+    assert svd_rank(torch.tensor([4., 2., 1., 0.5]), energy) == rank
+    low_rank = factorize_linear(linear, energy=energy)
+    assert low_rank.rank == rank
+    # the truncated SVD, its error is the dropped singular values
+    error = torch.linalg.matrix_norm(dense_weight(low_rank) - linear.weight, ord=2).item()
+    assert error == pytest.approx([4., 2., 1., 0.5, 0.][rank], abs=1e-4)
+
+
+def test_factorize_layers_only_smaller():
+    torch.manual_seed(0)
+    model = MDNet()
+    ranks = factorize_layers(model.layers, ['fc4', 'fc5'], rank=300)
+    # fc4 (4608 x 512) is smaller at rank 300, fc5 (512 x 512) is not
+    assert ranks == {'fc4': 300}
+    assert isinstance(model.layers.fc4[1], LowRankLinear) and type(model.layers.fc5[1]) == nn.Linear
+
+
+def factorized_mdnet(ranks=(64, 32)):
+    torch.manual_seed(0)
+    model = MDNet().eval()
+    factorize_layers(model.layers, ['fc4'], rank=ranks[0])
+    factorize_layers(model.layers, ['fc5'], rank=ranks[1])
+    model.build_param_dict()
+    return model
+
+
+def test_mdnet_loads_factorized(tmp_path):
+    model = factorized_mdnet()
+    path = str(tmp_path / 'mdnet_r64.pth')
+    torch.save({'shared_layers': model.layers.state_dict()}, path)
+
+    loaded = MDNet(path).eval()
+    assert loaded.layers.fc4[1].rank == 64 and loaded.layers.fc5[1].rank == 32
+    assert 'fc4_weight_u' in loaded.params and 'fc5_weight_v' in loaded.params
+    x = torch.relu(torch.randn(8, 4608))
+    with torch.no_grad():
+        assert torch.equal(loaded(x, in_layer='fc4', out_layer='fc5'), model(x, in_layer='fc4', out_layer='fc5'))
+
+
+def test_regnet_loads_factorized():
+    torch.manual_seed(0)
+    regnet = RegNet().eval()
+    # (a random factorization, the SVD of the 9220 x 4000 fc1 is not needed here)
+    regnet.layers.fc1[1] = LowRankLinear(9220, 4000, 16)
+    nn.init.normal_(regnet.layers.fc1[1].weight_u, std=0.01)
+    nn.init.normal_(regnet.layers.fc1[1].weight_v, std=0.01)
+    factorize_layers(regnet.layers, ['fc3'], rank=2)
+    state = {'RegNet_layers': regnet.layers.state_dict(), 'translate_mode': True}
+
+    loaded = RegNet(state=state).eval()
+    assert loaded.layers.fc1[1].rank == 16 and loaded.layers.fc3[1].rank == 2
+    x = torch.cat((torch.relu(torch.randn(5, 2 * 4608)), torch.rand(5, 4) * 107), 1)
+    with torch.no_grad():
+        assert torch.equal(loaded(x), regnet(x))
+
+
+def test_tracker_shared_factorized_layers_and_reset():
+    from tracker import Tracker
+    model = factorized_mdnet()
+    shared_layers = {k: v.clone() for k, v in model.layers.state_dict().items()}
+    tracker = Tracker(shared_layers=shared_layers, use_bbreg=False)
+
+    assert isinstance(tracker.model.layers.fc4[1], LowRankLinear)
+    params = dict(tracker.model.layers.state_dict())
+    for k, v in shared_layers.items():
+        assert torch.equal(params[k], v), k
+    # the conv weights are used in place, the fc weights are copies
+    assert params['conv1.0.weight'].data_ptr() == shared_layers['conv1.0.weight'].data_ptr()
+    assert params['fc4.1.weight_u'].data_ptr() != shared_layers['fc4.1.weight_u'].data_ptr()
+
+    # online training changes the factors, reset() restores the offline ones
+    with torch.no_grad():
+        for k, p in tracker.model.params.items():
+            if k.startswith('fc'):
+                p.add_(1)
+    tracker.reset()
+    params = dict(tracker.model.layers.state_dict())
+    for k, v in shared_layers.items():
+        assert torch.equal(params[k], v), k
@@ -0,0 +1,48 @@
+import pytest
+import torch
+
+from model import LRN
+
+# (channels, height, width) after the ReLU of conv1 and conv2, for 107x107 crops
+shapes = {'conv1': (96, 51, 51), 'conv2': (256, 11, 11)}
+
+# torch (F.local_response_norm) sums the window in another order: relative to the largest input
+relative_tolerance = 1e-5
+
+
+def forward_backward(backend, x, grad_out):
+    # output and input gradient of LRN(backend) at x
+    x = x.clone().requires_grad_()
+    y = LRN(backend)(x)
+    y.backward(grad_out)
+    return y.detach(), x.grad
+
+
+@pytest.fixture(params=list(shapes), scope='module')
+def inputs(request):
+    torch.manual_seed(456)
+    # conv outputs after ReLU, with some large values so the normalization matters
+    x = torch.relu(torch.randn((4,) + shapes[request.param]) * 30)
+    return x, torch.randn_like(x)
+
+
+@pytest.fixture(scope='module')
+def results(inputs):
+    x, grad_out = inputs
+    return {backend: forward_backward(backend, x, grad_out) for backend in ['reference', 'fast', 'torch']}
+
+
+def test_fast_is_bitwise_reference(results):
+    y, grad = results['fast']
+    y_ref, grad_ref = results['reference']
+    assert torch.equal(y, y_ref)
+    assert torch.equal(grad, grad_ref)
+
+
+@pytest.mark.parametrize('other', ['reference', 'fast'])
+def test_torch_within_tolerance(inputs, results, other):
+    x, grad_out = inputs
+    y, grad = results['torch']
+    y_other, grad_other = results[other]
+    assert (y - y_other).abs().max().item() <= relative_tolerance * x.abs().max().item()
+    assert (grad - grad_other).abs().max().item() <= relative_tolerance * grad_other.abs().max().item()
@@ -0,0 +1,79 @@
+import numpy as np
+import torch
+
+from model import MDNet
+from FocalLoss import FocalLoss
+from tracking_utils import opts, set_optimizer, train
+from multi_tracker import TargetHeads, HeadsOptimizer, train_heads
+
+maxiter = 4
+
+
+def criterion():
+    return FocalLoss(class_num=2, alpha=torch.ones(2, 1)*0.25, size_average=False)
+
+
+def feats(seed, n_pos=100, n_neg=300):
+    generator = torch.Generator().manual_seed(seed)
+    return torch.relu(torch.randn(n_pos, 4608, generator=generator)), torch.relu(torch.randn(n_neg, 4608, generator=generator))
+
+
+def head_weights(heads, t):
+    # (weight, bias) of fc4-fc6 of target t, in the nn.Linear layout
+    return [w for name in heads.names for w in (getattr(heads, name + '_weight')[t].t(), getattr(heads, name + '_bias')[t])]
+
+
+def test_one_target_as_tracker():
+    # train_heads of one target against train() of the model (SGD with momentum and weight decay, fc6 lr_mult)
+    torch.manual_seed(0)
+    model = MDNet()
+    model.set_learnable_params(opts['ft_layers'])
+    heads = TargetHeads(model, 1)
+    with torch.no_grad():
+        model.branches[0][1].weight.copy_(heads.fc6_weight[0].t())
+        model.branches[0][1].bias.copy_(heads.fc6_bias[0])
+    optimizer = set_optimizer(model, opts['lr_update'])
+    heads_optimizer = HeadsOptimizer(heads, opts['lr_update'])
+
+    # two calls, the momentum carries over
+    for call in range(2):
+        pos_feats, neg_feats = feats(call)
+        np.random.seed(call)
+        torch.manual_seed(call)  # (the same dropout masks)
+        train(model, criterion(), optimizer, pos_feats, neg_feats, maxiter)
+        np.random.seed(call)
+        torch.manual_seed(call)
+        train_heads(heads, criterion(), heads_optimizer, [0], [pos_feats], [neg_feats], maxiter)
+
+        linears = [model.layers.fc4[1], model.layers.fc5[1], model.branches[0][1]]
+        expected = [w for linear in linears for w in (linear.weight, linear.bias)]
+        for w, w_expected in zip(head_weights(heads, 0), expected):
+            assert torch.allclose(w, w_expected, rtol=1e-4, atol=1e-6)
+
+
+def test_targets_independent():
+    # the result of a target does not depend on the features of the others, targets left out are not changed
+    torch.manual_seed(0)
+    model = MDNet()
+    results = []
+    for other_seed in [1, 2]:
+        torch.manual_seed(3)
+        heads = TargetHeads(model, 4)
+        heads_optimizer = HeadsOptimizer(heads, opts['lr_update'])
+        initial = [[w.clone() for w in head_weights(heads, t)] for t in range(4)]
+        targets = [0, 1, 3]
+        pos_feats, neg_feats = zip(feats(0), feats(other_seed), feats(5))
+        np.random.seed(0)
+        torch.manual_seed(0)
+        train_heads(heads, criterion(), heads_optimizer, targets, list(pos_feats), list(neg_feats), maxiter)
+
+        for w, w_initial in zip(head_weights(heads, 2), initial[2]):
+            assert torch.equal(w, w_initial)
+        for name, buffer in heads_optimizer.buffers.items():
+            assert torch.all(buffer[2] == 0)
+        results.append([head_weights(heads, t) for t in range(4)])
+
+    for t in [0, 3]:
+        for w_1, w_2 in zip(results[0][t], results[1][t]):
+            assert torch.allclose(w_1, w_2, rtol=1e-5, atol=1e-7)
+    assert not torch.allclose(results[0][1][0], results[1][1][0])
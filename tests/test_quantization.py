@@ -0,0 +1,87 @@
+import pytest
+import torch
+import torch.nn as nn
+
+from model import MDNet, RegNet
+from tracking_utils import opts, set_optimizer
+
+if 'x86' not in torch.backends.quantized.supported_engines:
+    pytest.skip('no x86 quantized engine', allow_module_level=True)
+
+
+@pytest.fixture
+def model():
+    torch.manual_seed(0)
+    model = MDNet()
+    model.quantize()  # (uncalibrated convs, only the fc head is used here)
+    model.set_learnable_params(opts['ft_layers'])
+    model.eval()
+    return model
+
+
+def head(model, feats):
+    with torch.no_grad():
+        return model(feats, in_layer='fc4', out_layer='fc6')
+
+
+def float_scores(model, feats):
+    # fc4 -> fc6 by the float layers
+    with torch.no_grad():
+        return model.branches[0](model.layers.fc5(model.layers.fc4(feats)))
+
+
+def test_stale_after_training_step(model):
+    feats = torch.relu(torch.randn(50, 4608))
+    assert not model.quantized_head.stale()
+    qlinears = model.quantized_head.qlinears
+    scores = head(model, feats)
+    assert torch.allclose(scores, float_scores(model, feats), atol=0.05)
+
+    # an online update (in place, as the optimizer does)
+    optimizer = set_optimizer(model, 0.01)
+    model.train()
+    model(feats, in_layer='fc4')[:, 1].mean().backward()
+    optimizer.step()
+    model.eval()
+    assert model.quantized_head.stale()
+    # the int8 copies of the old weights are not used, the float layers that keep training are
+    updated = head(model, feats)
+    assert torch.equal(updated, float_scores(model, feats))
+    assert not torch.allclose(updated, scores, atol=0.05)
+
+    model.refresh_quantized()
+    assert not model.quantized_head.stale()
+    assert all(a is not b for a, b in zip(model.quantized_head.qlinears, qlinears))
+    refreshed = head(model, feats)
+    assert not torch.equal(refreshed, updated)
+    assert torch.allclose(refreshed, updated, atol=0.05)
+
+
+def test_stale_after_reset_copy(model):
+    # e.g. Tracker.reset() copying the offline weights back
+    with torch.no_grad():
+        model.layers.fc4[1].weight.copy_(model.layers.fc4[1].weight * 0.5)
+    assert model.quantized_head.stale()
+    model.refresh_quantized()
+    assert not model.quantized_head.stale()
+
+
+def test_regnet_built_once(monkeypatch):
+    import run_tracker as rt
+    torch.manual_seed(0)
+    state = {'RegNet_layers': RegNet().layers.state_dict(), 'translate_mode': True}
+    monkeypatch.setattr(rt, 'regnet_state', state)
+    monkeypatch.setattr(rt, 'regnet_models', {})
+    monkeypatch.setitem(rt.opts, 'use_gpu', False)
+    monkeypatch.setitem(rt.opts, 'quantized', True)
+
+    model, translate_mode = rt.load_regnet()
+    assert translate_mode
+    assert not isinstance(model.layers.fc1[1], nn.Linear)  # (int8)
+    # every run (e.g. a re-init after a tracking loss) gets the same model
+    assert rt.load_regnet()[0] is model
+
+    monkeypatch.setitem(rt.opts, 'quantized', False)
+    float_model = rt.load_regnet()[0]
+    assert isinstance(float_model.layers.fc1[1], nn.Linear)
+    assert rt.load_regnet()[0] is float_model
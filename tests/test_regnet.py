@@ -0,0 +1,91 @@
+from collections import OrderedDict
+
+import pytest
+import torch
+import torch.nn as nn
+
+from lowrank import LowRankLinear
+from model import RegNet
+
+n_samples = 30
+n_frames = 4
+
+
+@pytest.fixture(scope='module')
+def regnets():
+    # random weights, eval mode, with a plain and a factorized fc1 (the other layers shared)
+    torch.manual_seed(0)
+    plain = RegNet().eval()
+    factorized = RegNet().eval()
+    low_rank = LowRankLinear(9220, 4000, 32)
+    nn.init.normal_(low_rank.weight_u, std=0.02)
+    nn.init.normal_(low_rank.weight_v, std=0.02)
+    nn.init.normal_(low_rank.bias, std=0.02)
+    factorized.layers = nn.Sequential(OrderedDict(plain.layers.named_children()))
+    factorized.layers.fc1 = nn.Sequential(plain.layers.fc1[0], low_rank, plain.layers.fc1[2]).eval()
+    return {'linear': plain, 'low rank': factorized}
+
+
+def regnet_of(regnets, key):
+    fc1, translate_mode = key
+    regnet = regnets[fc1]
+    regnet.translate_mode = translate_mode
+    return regnet
+
+
+def inputs(seed):
+    generator = torch.Generator().manual_seed(seed)
+    sample_feats = torch.relu(torch.randn(n_samples, 4608, generator=generator))
+    frame_feats = torch.relu(torch.randn(n_frames, 4608, generator=generator))
+    bboxes = torch.rand(n_samples, 4, generator=generator) * 80 + torch.tensor([0., 0., 10., 10.])
+    return sample_feats, frame_feats, bboxes
+
+
+def forward(regnet, sample_feats, frame_feats, bboxes, frame_index):
+    with torch.no_grad():
+        return regnet(torch.cat((sample_feats, frame_feats[frame_index], bboxes), dim=1))
+
+
+def forward_split(regnet, sample_feats, frame_feats, bboxes, frame_index=None):
+    with torch.no_grad():
+        return regnet.forward_split(sample_feats, frame_feats, bboxes, frame_index)
+
+
+params = [(fc1, translate_mode) for fc1 in ['linear', 'low rank'] for translate_mode in [True, False]]
+
+
+@pytest.mark.parametrize('key', params, ids=['%s-translate_mode=%s' % key for key in params])
+def test_as_concatenated_input(regnets, key):
+    regnet = regnet_of(regnets, key)
+    sample_feats, frame_feats, bboxes = inputs(0)
+    frame_index = torch.randint(n_frames, (n_samples,), generator=torch.Generator().manual_seed(1))
+    expected = forward(regnet, sample_feats, frame_feats, bboxes, frame_index)
+    split = forward_split(regnet, sample_feats, frame_feats, bboxes, frame_index)
+    assert torch.allclose(split, expected, rtol=1e-4, atol=1e-4)
+    # the inputs are not modified (e.g. by the translate mode)
+    assert torch.equal(bboxes, inputs(0)[2])
+
+
+@pytest.mark.parametrize('key', params, ids=['%s-translate_mode=%s' % key for key in params])
+def test_one_frame_broadcast(regnets, key):
+    regnet = regnet_of(regnets, key)
+    sample_feats, frame_feats, bboxes = inputs(2)
+    frame_feats = frame_feats[:1]
+    expected = forward(regnet, sample_feats, frame_feats, bboxes, torch.zeros(n_samples, dtype=torch.long))
+    assert torch.allclose(forward_split(regnet, sample_feats, frame_feats, bboxes), expected, rtol=1e-4, atol=1e-4)
+
+
+@pytest.mark.parametrize('key', params, ids=['%s-translate_mode=%s' % key for key in params])
+def test_frame_without_examples(regnets, key):
+    # frame 2 has no samples (e.g. a pretraining batch frame that got none), the others are unaffected
+    regnet = regnet_of(regnets, key)
+    sample_feats, frame_feats, bboxes = inputs(3)
+    frame_index = torch.tensor([0, 1, 3] * (n_samples // 3))
+    expected = forward(regnet, sample_feats, frame_feats, bboxes, frame_index)
+    split = forward_split(regnet, sample_feats, frame_feats, bboxes, frame_index)
+    assert split.shape == (n_samples, 4)
+    assert torch.allclose(split, expected, rtol=1e-4, atol=1e-4)
+
+    # no samples at all
+    empty = forward_split(regnet, sample_feats[:0], frame_feats, bboxes[:0], frame_index[:0])
+    assert empty.shape == (0, 4)
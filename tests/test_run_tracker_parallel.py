@@ -0,0 +1,51 @@
+import itertools
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+from run_tracker_parallel import schedule, run_jobs, seed_job
+
+# (args, model_index, loss_index, sequence, init_after_loss), as the jobs of the grid
+jobs = [(None, 0, loss_index, sequence, init_after_loss) for loss_index, sequence, init_after_loss in
+        itertools.product([1, 2], ['short', 'long', 'medium'], [False, True])]
+lengths = {'short': 10, 'long': 300, 'medium': 50}
+
+
+def draw(job):
+    # a job of the pool: the draws of its seeded rngs
+    seed = seed_job(job)
+    return job[2:], seed, np.random.rand(), torch.rand(1).item()
+
+
+def test_longest_first():
+    order = schedule(jobs, lengths)
+    assert [jobs[j][3] for j in order] == ['long'] * 4 + ['medium'] * 4 + ['short'] * 4
+    # jobs of the same sequence keep their order
+    assert order[:4] == [j for j in range(len(jobs)) if jobs[j][3] == 'long']
+
+    # one worker runs them in the order they are submitted
+    started = []
+    with ThreadPoolExecutor(1) as pool:
+        run_jobs(pool, lambda job: started.append(job[2:]), jobs, lengths)
+    assert started == [jobs[j][2:] for j in order]
+
+
+def test_results_in_input_order_with_per_job_seeds():
+    reported = []
+    results = {}
+    for workers in [1, 3]:
+        with ProcessPoolExecutor(workers, mp_context=mp.get_context('fork')) as pool:
+            results[workers] = run_jobs(pool, draw, jobs, lengths, lambda n, result: reported.append(n))
+    assert reported == list(range(len(jobs))) * 2
+
+    for job, result in zip(jobs, results[3]):
+        assert result[0] == job[2:]
+    # the draws of a job depend on the job only, not on the worker or the jobs it ran before
+    assert results[1] == results[3]
+    for _, seed, value, torch_value in results[3]:
+        np.random.seed(seed)
+        torch.manual_seed(seed)
+        assert np.random.rand() == value and torch.rand(1).item() == torch_value
+    assert len(set(result[1] for result in results[3])) == len(jobs)
@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+
+from sample_generator import SampleGenerator, gen_samples, gen_samples_batch, split_samples
+from utils import overlap_ratio
+
+img_size = (640, 360)
+bbox = np.array([200, 150, 80, 120], dtype='float32')
+
+# (generator, n, overlap_range, scale_range) of the tracker and the data providers
+settings = {
+    'pos init': (('gaussian', img_size, 0.1, 1.2), 500, [0.7, 1], None),
+    'neg init': (('uniform', img_size, 1, 2, 1.1), 2500, [0, 0.5], None),
+    'neg whole': (('whole', img_size, 0, 1.2, 1.1), 2500, [0, 0.5], None),
+    'bbreg': (('uniform', img_size, 0.3, 1.5, 1.1), 1000, [0.6, 1], [1, 2]),
+    'pos pretrain': (('gaussian', img_size, 0.6, 1.05, None, True), 50, [0.75, 1], None),
+    'neg update': (('uniform', img_size, 1.5, 1.2), 200, [0, 0.3], None),
+}
+
+
+def scale_ratio(samples, bbox):
+    return np.prod(samples[:, 2:], axis=1) / np.prod(bbox[2:])
+
+
+@pytest.mark.parametrize('name', list(settings))
+def test_within_ranges(name):
+    args, n, overlap_range, scale_range = settings[name]
+    samples = gen_samples(SampleGenerator(*args, seed=0), bbox, n, overlap_range, scale_range)
+    assert samples.shape == (n, 4)
+    r = overlap_ratio(samples, bbox)
+    assert np.all(r >= overlap_range[0]) and np.all(r <= overlap_range[1])
+    if scale_range is not None:
+        s = scale_ratio(samples, bbox)
+        assert np.all(s >= scale_range[0]) and np.all(s <= scale_range[1])
+    # no box is repeated to make up the count
+    assert len(np.unique(samples, axis=0)) == n
+
+
+def test_unconstrained():
+    samples = gen_samples(SampleGenerator('gaussian', img_size, 0.6, 1.05, valid=True, seed=0), bbox, 256)
+    assert samples.shape == (256, 4)
+
+
+def center_shift(samples, bbox):
+    return np.abs(samples[:, :2] + samples[:, 2:] / 2 - (bbox[:2] + bbox[2:] / 2)).sum(axis=1)
+
+
+# (settings, bbox): inside the image, and touching its edges (where batch() clips the shifted boxes)
+distributions = {
+    'bbreg': ('bbreg', bbox),
+    'bbreg at the edge': ('bbreg', np.array([-30, 0, 80, 120], dtype='float32')),
+    'pos pretrain at the edge': ('pos pretrain', np.array([0, 240, 80, 120], dtype='float32')),
+}
+
+
+@pytest.mark.parametrize('name', list(distributions))
+def test_bounded_draws_keep_the_distribution(name):
+    # the bounds only cut draws that would be rejected: the accepted boxes are distributed as those of a plain
+    # rejection of unconstrained draws (means and spreads of the overlap, scale and shift, within sampling error)
+    setting, bb = distributions[name]
+    args, n, overlap_range, scale_range = settings[setting]
+    bounded = gen_samples(SampleGenerator(*args, seed=0), bb, 4000, overlap_range, scale_range)
+    drawn = SampleGenerator(*args, seed=1)(bb, 40000)
+    r = overlap_ratio(drawn, bb)
+    accept = (r >= overlap_range[0]) & (r <= overlap_range[1])
+    if scale_range is not None:
+        s = scale_ratio(drawn, bb)
+        accept &= (s >= scale_range[0]) & (s <= scale_range[1])
+    rejected = drawn[accept]
+    for statistic in [overlap_ratio, scale_ratio, center_shift]:
+        a, b = statistic(bounded, bb), statistic(rejected, bb)
+        assert abs(a.mean() - b.mean()) < 0.01 * b.mean() + 3 * b.std() / np.sqrt(len(b)), statistic.__name__
+        assert abs(a.std() - b.std()) < 0.1 * b.std(), statistic.__name__
+
+
+def test_clipped_gaussian_bounds():
+    generator = SampleGenerator('gaussian', img_size, seed=0)
+    x = generator.clipped_gaussian(-0.2, 0.3, (10000, 1))
+    assert x.min() >= -0.2 and x.max() <= 0.3
+    # unbounded, as clip(0.5 * randn, -1, 1): about 4.6% at the clip values
+    x = generator.clipped_gaussian(-1, 1, (100000, 1))
+    assert abs(np.mean(np.abs(x) == 1) - 0.0455) < 0.005
+
+
+def test_empty_scale_range_raises():
+    with pytest.raises(ValueError):
+        gen_samples(SampleGenerator('gaussian', img_size, 0.1, 1.2, seed=0), bbox, 10, [0.7, 1], [3, 4])
+
+
+def test_out_of_image_bbox_warns():
+    # a bbox mostly out of the image: no box around it reaches the overlap, it gets fewer (here none), not duplicates
+    generator = SampleGenerator('gaussian', img_size, 0.1, 1.005, seed=0)
+    with pytest.warns(UserWarning):
+        samples = gen_samples(generator, np.array([600, 340, 200, 200]), 32, [0.75, 1])
+    assert len(samples) < 32
+    assert len(np.unique(samples, axis=0)) == len(samples)
+
+
+def test_seeded_from_global_rng():
+    args, n, overlap_range, _ = settings['pos init']
+    runs = []
+    for _ in range(2):
+        np.random.seed(123)
+        runs.append(gen_samples(SampleGenerator(*args), bbox, n, overlap_range))
+    assert np.array_equal(runs[0], runs[1])
+
+
+@pytest.mark.parametrize('name', ['pos pretrain', 'neg whole'])
+def test_batch_grouped_by_bbox(name):
+    args, _, overlap_range, scale_range = settings[name]
+    bboxes = np.array([bbox, [400, 100, 60, 40], [50, 200, 150, 100]], dtype='float32')
+    ns = [11, 0, 23]
+    samples, segments = gen_samples_batch(SampleGenerator(*args, seed=0), bboxes, ns, overlap_range, scale_range)
+    assert np.all(np.diff(segments) >= 0)
+    assert np.bincount(segments, minlength=len(bboxes)).tolist() == ns
+    for b, samples_b in enumerate(split_samples(samples, segments, len(bboxes))):
+        assert len(samples_b) == ns[b]
+        if len(samples_b):
+            r = overlap_ratio(samples_b, bboxes[b])
+            assert np.all(r >= overlap_range[0]) and np.all(r <= overlap_range[1])
+
+
+def test_whole_grid_points_distinct():
+    generator = SampleGenerator('whole', img_size, 0, 1.2, 1.1, seed=0)
+    n = 50
+    xy = generator.grid_positions([n, n, 7])
+    m = int(2*np.sqrt(n))
+    assert set(generator.grids) == {m, int(2*np.sqrt(7))}
+    for points in (xy[:n], xy[n:2*n]):
+        assert len(np.unique(points, axis=0)) == n
+        assert np.all(np.isin(points, generator.grids[m].astype(xy.dtype)))
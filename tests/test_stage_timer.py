@@ -0,0 +1,57 @@
+import json
+
+from stage_timer import StageTimer
+
+
+def track(timer, n_frames):
+    # the stages of a run_mdnet: the init (with stages also recorded inside the frames), then the frames
+    timer.begin_run()
+    with timer.stage('init'):
+        with timer.stage('gen_samples'):
+            pass
+        with timer.stage('train'):
+            pass
+    for _ in range(n_frames):
+        timer.next_frame()
+        with timer.stage('gen_samples'):
+            pass
+        timer.add('frame', 0.01)
+
+
+def test_init_of_consecutive_runs_in_no_frame():
+    timer = StageTimer()
+    # e.g. a re-init after a tracking loss, then another averaging iteration
+    for n_frames in [3, 2, 4]:
+        track(timer, n_frames)
+
+    frames = {}
+    for name, _, _, _, frame in timer.events:
+        frames.setdefault(name, []).append(frame)
+    assert frames['init'] == [None] * 3 and frames['train'] == [None] * 3
+    # the frames of the runs follow each other
+    assert frames['frame'] == list(range(9))
+    assert [frame for frame in frames['gen_samples'] if frame is not None] == list(range(9))
+
+    summary = timer.summary()
+    assert set(summary) == {'gen_samples', 'frame'}
+    assert summary['gen_samples']['frames'] == 9
+    assert abs(summary['frame']['p99'] - 10) < 1e-6
+
+
+def test_chrome_trace_keeps_init(tmp_path):
+    timer = StageTimer()
+    track(timer, 2)
+    path = str(tmp_path / 'trace.json')
+    timer.save_chrome_trace(path)
+    events = json.load(open(path))['traceEvents']
+    assert [event['args']['frame'] for event in events if event['name'] == 'init'] == [None]
+    assert len(events) == len(timer.events)
+
+
+def test_reset():
+    timer = StageTimer()
+    track(timer, 3)
+    timer.reset()
+    assert timer.events == [] and timer.frame is None
+    track(timer, 1)
+    assert [frame for name, _, _, _, frame in timer.events if name == 'frame'] == [0]
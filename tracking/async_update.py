@@ -0,0 +1,128 @@
+import copy
+import threading
+import numpy as np
+
+import torch
+
+from tracking_utils import *
+
+
+class AsyncUpdater():
+    # runs the online (short/long term) updates of the fc layers in a background thread
+    #
+    # the worker trains a shadow copy of the model on a snapshot of the feature banks, while the
+    # main loop keeps scoring with the current weights. finished weights are copied into the model
+    # by swap(), which the main loop calls at a frame boundary, so a frame never sees a half update.
+    # a job submitted while another one waits replaces it (only the newest snapshot is trained on).
+    # the shadow keeps its own optimizer, so momentum carries over between updates as before.
+    # the worker draws the training batches from its own rng (seeded from the global one here), so the
+    # main thread draws of np.random do not depend on the thread timing. flush() trains and swaps at once
+    # (e.g. to reproduce the synchronous updates)
+    def __init__(self, model, criterion, lr=opts['lr_update'], maxiter=opts['maxiter_update'],
+                 layers=opts['ft_layers'], loss_index=1):
+        self.model = model
+        self.criterion = criterion
+        self.maxiter = maxiter
+        self.loss_index = loss_index
+
+        self.shadow = copy.deepcopy(model)
+        self.shadow.set_learnable_params(layers)
+        self.optimizer = set_optimizer(self.shadow, lr)
+        self.rng = np.random.default_rng(np.random.randint(2**31))
+        # names of the trained params, the same in the model and its shadow
+        self.params = [name for name, p in self.shadow.named_parameters() if p.requires_grad]
+
+        self.lock = threading.Condition()
+        self.pending = None  # (frame, pos, neg, pos_ious, neg_ious) waiting for the worker
+        self.ready = None  # (frame, {name: weights}) waiting for swap()
+        self.busy = False
+        self.closed = False
+
+        self.staleness = []
+        self.coalesced = 0
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def snapshot(self, feats, ious, n_used):
+        # train() draws at most n_used rows, so a random subset of that size (the bank rows are
+        # overwritten by the following frames) is enough and gives the same batches distribution
+        if n_used < len(feats):
+            index = np.random.permutation(len(feats))[:n_used]
+            feats = feats[torch.from_numpy(index).to(feats.device)]
+            if ious is not None:
+                ious = ious[index]
+        else:
+            feats = feats.clone()
+            if ious is not None:
+                ious = ious.copy()
+        return feats, ious
+
+    def submit(self, frame, pos_data, neg_data, pos_ious=None, neg_ious=None):
+        pos_data, pos_ious = self.snapshot(pos_data, pos_ious, opts['batch_pos'] * self.maxiter)
+        neg_data, neg_ious = self.snapshot(neg_data, neg_ious,
+                                           max(opts['batch_neg_cand'], opts['batch_neg']) * self.maxiter)
+        with self.lock:
+            if self.pending is not None:
+                self.coalesced += 1
+            self.pending = (frame, pos_data, neg_data, pos_ious, neg_ious)
+            self.lock.notify()
+
+    def run(self):
+        while True:
+            with self.lock:
+                while self.pending is None and not self.closed:
+                    self.lock.wait()
+                if self.closed:
+                    return
+                frame, pos_data, neg_data, pos_ious, neg_ious = self.pending
+                self.pending = None
+                self.busy = True
+
+            # (on the worker thread, off the per frame time of the main loop)
+            with stage_timer.stage('async-update'):
+                if self.loss_index == 2:
+                    train(self.shadow, self.criterion, self.optimizer, pos_data, neg_data, self.maxiter,
+                          pos_ious=pos_ious, neg_ious=neg_ious, loss_index=self.loss_index, rng=self.rng)
+                else:
+                    train(self.shadow, self.criterion, self.optimizer, pos_data, neg_data, self.maxiter,
+                          loss_index=self.loss_index, rng=self.rng)
+
+            params = dict(self.shadow.named_parameters())
+            weights = {name: params[name].detach().clone() for name in self.params}
+            with self.lock:
+                self.ready = (frame, weights)
+                self.busy = False
+                self.lock.notify_all()
+
+    def swap(self, frame):
+        # copies the newest finished weights into the model
+        # returns the staleness (frames between the snapshot and now) or None if nothing was ready
+        with self.lock:
+            if self.ready is None:
+                return None
+            snapshot_frame, weights = self.ready
+            self.ready = None
+        params = dict(self.model.named_parameters())
+        with torch.no_grad():
+            for name, value in weights.items():
+                params[name].copy_(value)
+        self.staleness.append(frame - snapshot_frame)
+        return self.staleness[-1]
+
+    def wait(self):
+        # blocks until every submitted job is trained (not swapped)
+        with self.lock:
+            while self.pending is not None or self.busy:
+                self.lock.wait()
+
+    def flush(self, frame):
+        # waits for the submitted jobs and swaps their weights in, returns the staleness as swap()
+        self.wait()
+        return self.swap(frame)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.lock.notify_all()
+        self.thread.join()
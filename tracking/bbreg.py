@@ -1,22 +1,101 @@
 import sys
-from sklearn.linear_model import Ridge
 import numpy as np
 
+import torch
+
 from utils import *
 
 class BBRegressor():
-    def __init__(self, img_size, alpha=1000, overlap=[0.6, 1], scale=[1, 2]):
+    # ridge regression (with an unpenalized intercept, as sklearn's Ridge) of the offsets from a box to the
+    # target, (center shift / size, log size ratio), from the conv3 features of the box
+    #
+    # solved in closed form with a Cholesky factorization, in torch on the device of the features:
+    # fewer examples than features (the usual 1000 x 4608) - the dual system, examples x examples
+    # otherwise - the primal system, features x features
+    # update() adds the examples of later frames to the dual system by extending its factorization
+    # (keeping the examples of train(), the oldest of the updates are dropped beyond max_update_samples)
+    def __init__(self, img_size, alpha=1000, overlap=[0.6, 1], scale=[1, 2], max_update_samples=500):
         self.img_size = img_size
         self.alpha = alpha
         self.overlap_range = overlap
         self.scale_range = scale
-        self.model = Ridge(alpha=self.alpha)
+        self.max_update_samples = max_update_samples
 
     def train(self, X, bbox, gt):
-        X = X.cpu().numpy()
+        X, Y = self.examples(X, bbox, gt)
+        self.n_train = len(X)
+        self.fit(X, Y)
+
+    def update(self, X, bbox, gt):
+        # X - features of bbox, boxes around gt in a later frame (e.g. positive samples around the estimated target)
+        X, Y = self.examples(X, bbox, gt)
+        if len(X) == 0:
+            return
+        if self.L is None:  # primal system, solved again with every example
+            self.fit(torch.cat((self.X, X)), torch.cat((self.Y, Y)))
+            return
+
+        n_updates = len(self.X) - self.n_train + len(X)
+        if n_updates > self.max_update_samples:
+            # forget the oldest updates, down to half the limit (the factorization is then computed again)
+            n_drop = min(n_updates - self.max_update_samples // 2, len(self.X) - self.n_train)
+            keep = torch.cat((torch.arange(self.n_train), torch.arange(self.n_train + n_drop, len(self.X)))).to(X.device)
+            self.X, self.Y = self.X[keep], self.Y[keep]
+            self.G = self.G[keep][:, keep]
+            self.L = torch.linalg.cholesky(self.G + self.alpha * torch.eye(len(keep), dtype=self.G.dtype, device=X.device))
+
+        # [[M, B], [B^T, C]] = [[L, 0], [L21, L22]] [[L, 0], [L21, L22]]^T, M = G + alpha I of the kept examples
+        B = (self.X @ X.t()).double()
+        G_new = (X @ X.t()).double()
+        C = G_new + self.alpha * torch.eye(len(X), dtype=torch.float64, device=X.device)
+        L21 = torch.linalg.solve_triangular(self.L, B, upper=False).t()
+        L22 = torch.linalg.cholesky(C - L21 @ L21.t())
+        n = len(self.X)
+        L = self.L.new_zeros((n + len(X), n + len(X)))
+        L[:n, :n] = self.L
+        L[n:, :n] = L21
+        L[n:, n:] = L22
+        self.L = L
+        self.G = torch.cat((torch.cat((self.G, B), 1), torch.cat((B.t(), G_new), 1)))
+        self.X = torch.cat((self.X, X))
+        self.Y = torch.cat((self.Y, Y))
+        self.solve_dual()
+
+    def fit(self, X, Y):
+        # X - n x d features, Y - n x 4 offsets (float64)
+        self.X = X
+        self.Y = Y
+        if len(X) <= X.size(1):
+            self.G = (X @ X.t()).double()
+            self.L = torch.linalg.cholesky(self.G + self.alpha * torch.eye(len(X), dtype=torch.float64, device=X.device))
+            self.solve_dual()
+        else:
+            # centered, (Xc^T Xc + alpha I) W = Xc^T Yc, intercept from the means
+            self.G = None
+            self.L = None
+            X_mean = X.double().mean(0)
+            Y_mean = Y.mean(0)
+            Xc = X.double() - X_mean
+            L = torch.linalg.cholesky(Xc.t() @ Xc + self.alpha * torch.eye(X.size(1), dtype=torch.float64, device=X.device))
+            W = torch.cholesky_solve(Xc.t() @ (Y - Y_mean), L)
+            self.W = W.float()
+            self.b = (Y_mean - X_mean @ W).float()
+
+    def solve_dual(self):
+        # min |Y - X W - 1 b|^2 + alpha |W|^2: W = X^T a, (G + alpha I) a + 1 b = Y, 1^T a = 0
+        ones = self.Y.new_ones((len(self.Y), 1))
+        a_Y = torch.cholesky_solve(self.Y, self.L)
+        a_1 = torch.cholesky_solve(ones, self.L)
+        b = (ones.t() @ a_Y) / (ones.t() @ a_1)
+        a = a_Y - a_1 @ b
+        self.W = self.X.t() @ a.float()
+        self.b = b[0].float()
+
+    def examples(self, X, bbox, gt):
+        # features and offsets of the boxes within the overlap and scale ranges of gt
         bbox = np.copy(bbox)
         gt = np.copy(gt)
-        
+
         if gt.ndim==1:
             gt = gt[None,:]
 
@@ -25,36 +104,34 @@ class BBRegressor():
         idx = (r >= self.overlap_range[0]) * (r <= self.overlap_range[1]) * \
               (s >= self.scale_range[0]) * (s <= self.scale_range[1])
 
-        X = X[idx]
+        X = X[torch.from_numpy(np.nonzero(idx)[0]).to(X.device)]
         bbox = bbox[idx]
 
         Y = self.get_examples(bbox, gt)
-        
-        self.model.fit(X, Y)
+        return X, torch.from_numpy(Y).to(X.device, torch.float64)
 
     def predict(self, X, bbox):
-        X = X.cpu().numpy()
         bbox_ = np.copy(bbox)
 
-        Y = self.model.predict(X)
-    
+        Y = torch.addmm(self.b, X, self.W).double().cpu().numpy()
+
         bbox_[:,:2] = bbox_[:,:2] + bbox_[:,2:]/2
         bbox_[:,:2] = Y[:,:2] * bbox_[:,2:] + bbox_[:,:2]
         bbox_[:,2:] = np.exp(Y[:,2:]) * bbox_[:,2:]
         bbox_[:,:2] = bbox_[:,:2] - bbox_[:,2:]/2
-        
+
         r = overlap_ratio(bbox, bbox_)
         s = np.prod(bbox[:,2:], axis=1) / np.prod(bbox_[:,2:], axis=1)
         idx = (r >= self.overlap_range[0]) * (r <= self.overlap_range[1]) * \
               (s >= self.scale_range[0]) * (s <= self.scale_range[1])
         idx = np.logical_not(idx)
         bbox_[idx] = bbox[idx]
- 
+
         bbox_[:,:2] = np.maximum(bbox_[:,:2], 0)
         bbox_[:,2:] = np.minimum(bbox_[:,2:], self.img_size - bbox[:,:2])
 
         return bbox_
-    
+
     def get_examples(self, bbox, gt):
         bbox[:,:2] = bbox[:,:2] + bbox[:,2:]/2
         gt[:,:2] = gt[:,:2] + gt[:,2:]/2
@@ -64,4 +141,3 @@ class BBRegressor():
 
         Y = np.concatenate((dst_xy, dst_wh), axis=1)
         return Y
-
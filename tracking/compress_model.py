@@ -0,0 +1,163 @@
+import os
+import sys
+import copy
+import time
+import argparse
+import numpy as np
+from PIL import Image
+
+import torch
+import torch.nn.functional as F
+
+# needed for following usage:
+#  cd tracking
+#  python compress_model.py [-k 64 128 256] [-e 0.9 0.99] [-ft 200] [-s DragonBaby] [-n 30]
+# factorizes (truncated SVD) the fc4/fc5 layers of MDNet and the fc1-fc3 layers of RegNet, to every rank
+# (-k) or kept energy fraction (-e), optionally fine-tunes the factors briefly to reproduce the outputs of the
+# original layers on crops of a sequence (-ft iterations), and saves them next to the originals
+# (e.g. ../models/mdnet_vot-otb_r128.pth). MDNet and RegNet load the factorized files as the original ones.
+# reports for each the parameters, the latency, and the tracking IoU (MDNet) or output error (RegNet)
+sys.path.insert(0, '../modules')
+
+from quantize_model import calibration_regions
+from tracker import *
+
+seq_home = '../dataset/OTB'
+
+
+def time_forward(forward, x, repeats):
+    # mean ms of forward(x)
+    with torch.no_grad():
+        forward(x)
+        tic = time.perf_counter()
+        for _ in range(repeats):
+            forward(x)
+    return (time.perf_counter() - tic) / repeats * 1000
+
+
+def fine_tune(student, params, teacher, inputs, iters, lr=1e-4, batch_size=128):
+    # trains params of student to output what teacher outputs on inputs, mean squared error
+    if iters == 0:
+        return
+    with torch.no_grad():
+        targets = torch.cat([teacher(inputs[start:start + batch_size])
+                             for start in range(0, len(inputs), batch_size)])
+    optimizer = torch.optim.Adam(params, lr=lr)
+    for _ in range(iters):
+        batch = torch.randint(len(inputs), (batch_size,))
+        loss = F.mse_loss(student(inputs[batch]), targets[batch])
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+
+
+def track(model_path, img_list, gt):
+    # mean IoU of a Tracker of model_path over img_list
+    np.random.seed(123)
+    torch.manual_seed(456)
+    tracker = Tracker(model_path)
+    tracker.init(Image.open(img_list[0]).convert('RGB'), gt[0])
+    ious = [1.]
+    for i in range(1, len(img_list)):
+        bbox = tracker.update(Image.open(img_list[i]).convert('RGB'))
+        ious.append(overlap_ratio(bbox, gt[i])[0])
+    tracker.close()
+    return np.mean(ious)
+
+
+def compressed_path(path, tag):
+    return os.path.splitext(path)[0] + '_' + tag + '.pth'
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-k', '--ranks', nargs='*', default=[64, 128, 256], type=int)
+    parser.add_argument('-e', '--energies', nargs='*', default=[], type=float, help='kept fractions of the squared singular values')
+    parser.add_argument('-ft', '--fine_tune', default=0, type=int, help='fine-tuning iterations (0 - none)')
+    parser.add_argument('-lr', '--learning_rate', default=1e-4, type=float)
+    parser.add_argument('-s', '--seq', default='DragonBaby', help='sequence of the fine-tuning crops and of tracking')
+    parser.add_argument('-c', '--calibration_frames', default=10, type=int)
+    parser.add_argument('-n', '--n_frames', default=30, type=int, help='frames to track (0 - all, -1 - no tracking)')
+    parser.add_argument('-m', '--model_path', default=opts['model_path'])
+    parser.add_argument('-g', '--regnet_path', default='../models/regnet.pth', help='RegNet state ("" - MDNet only)')
+    parser.add_argument('-r', '--repeats', default=3, type=int)
+    parser.add_argument('-nt', '--num_threads', default=1, type=int, help='torch threads')
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.num_threads)
+    opts['use_gpu'] = False
+    np.random.seed(123)
+    torch.manual_seed(456)
+
+    img_dir = os.path.join(seq_home, args.seq, 'img')
+    img_list = [os.path.join(img_dir, x) for x in sorted(os.listdir(img_dir))]
+    gt = np.loadtxt(os.path.join(seq_home, args.seq, 'groundtruth_rect.txt'), delimiter=',')
+    img_list = img_list[:min(len(img_list), len(gt))]
+    # fine-tuning crops of frames spread over the sequence
+    frames = np.linspace(0, len(img_list) - 1, args.calibration_frames).astype(int)
+    regions = calibration_regions([img_list[i] for i in frames], gt[frames])
+    if args.n_frames > 0:
+        img_list = img_list[:args.n_frames + 1]
+
+    model = MDNet(args.model_path).eval()
+    with torch.no_grad():
+        feats = torch.cat([model(regions[start:start + 256], out_layer='conv3') for start in range(0, len(regions), 256)])
+    batch = feats[:opts['batch_test']]
+
+    settings = [('r%d' % rank, {'rank': rank}) for rank in args.ranks] + \
+               [('e%g' % energy, {'energy': energy}) for energy in args.energies]
+
+    # MDNet fc4, fc5 (fc6 is trained per sequence)
+    def fc(m):
+        return lambda x: m(x, in_layer='fc4', out_layer='fc6')
+
+    def fc5(m):
+        return lambda x: m(x, in_layer='fc4', out_layer='fc5')
+
+    fc_params = count_params(model.layers.fc4) + count_params(model.layers.fc5)
+    fc_ms = time_forward(fc(model), batch, args.repeats)
+    iou = track(args.model_path, img_list, gt) if args.n_frames >= 0 else float('nan')
+    print('MDNet  %-8s | fc4-fc5 %9d params | fc4-fc6 batch %d %8.2f ms        | IoU %.3f' %
+          ('original', fc_params, len(batch), fc_ms, iou))
+    for tag, setting in settings:
+        compressed = copy.deepcopy(model)
+        ranks = factorize_layers(compressed.layers, ['fc4', 'fc5'], **setting)
+        compressed.build_param_dict()
+        fine_tune(fc5(compressed), list(compressed.layers[3:5].parameters()), fc5(model), feats, args.fine_tune, args.learning_rate)
+        path = compressed_path(args.model_path, tag)
+        torch.save({'shared_layers': compressed.layers.state_dict()}, path)
+
+        params = count_params(compressed.layers.fc4) + count_params(compressed.layers.fc5)
+        ms = time_forward(fc(compressed), batch, args.repeats)
+        compressed_iou = track(path, img_list, gt) if args.n_frames >= 0 else float('nan')
+        print('MDNet  %-8s | fc4-fc5 %9d params | fc4-fc6 batch %d %8.2f ms x%.2f | IoU %.3f (%+.3f) | ranks %s | %s' %
+              (tag, params, len(batch), ms, fc_ms / ms, compressed_iou, compressed_iou - iou, ranks, path))
+
+    # RegNet fc1-fc3, on inputs of the form it refines: (sample features, target features, bbox)
+    if args.regnet_path and os.path.isfile(args.regnet_path):
+        regnet_state = torch.load(args.regnet_path)
+        regnet = RegNet(state=regnet_state).eval()
+        target = torch.randint(len(feats), (len(feats),))
+        boxes = torch.rand(len(feats), 4) * opts['img_size']
+        inputs = torch.cat((feats, feats[target], boxes), dim=1)
+        regnet_batch = inputs[:opts['batch_test']]
+        with torch.no_grad():
+            y = regnet.layers(regnet_batch)
+        regnet_params = count_params(regnet)
+        regnet_ms = time_forward(regnet, regnet_batch, args.repeats)
+        print('RegNet %-8s | fc1-fc3 %9d params | batch %d %8.2f ms' % ('original', regnet_params, len(regnet_batch), regnet_ms))
+        for tag, setting in settings:
+            compressed = copy.deepcopy(regnet)
+            ranks = factorize_layers(compressed.layers, ['fc1', 'fc2', 'fc3'], **setting)
+            fine_tune(compressed.layers, list(compressed.parameters()), regnet.layers, inputs, args.fine_tune, args.learning_rate)
+            state = dict(regnet_state)
+            state['RegNet_layers'] = compressed.layers.state_dict()
+            path = compressed_path(args.regnet_path, tag)
+            torch.save(state, path)
+
+            ms = time_forward(compressed, regnet_batch, args.repeats)
+            with torch.no_grad():
+                error = ((compressed.layers(regnet_batch) - y).norm() / y.norm()).item()
+            print('RegNet %-8s | fc1-fc3 %9d params | batch %d %8.2f ms x%.2f | relative error %.4f | ranks %s | %s' %
+                  (tag, count_params(compressed), len(regnet_batch), ms, regnet_ms / ms, error, ranks, path))
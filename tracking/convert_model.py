@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+import argparse
+
+import torch
+
+# needed for following usage:
+#  cd tracking
+#  python convert_model.py [-i ../models/mdnet_vot-otb.pth ../models/regnet.pth] [-r 3]
+# converts checkpoints (.pth) to flat weight files (.flat, see modules/flat_weights.py) next to them, which
+# MDNet / RegNet map instead of reading (set tracking_opts['model_path'] or bb_fc_model_path to them).
+# .mat models are converted to their content hash cache, as MDNet does on first load.
+# reports the keys that are not kept (e.g. optimizer states) and the time to load each format
+sys.path.insert(0, '../modules')
+
+from model import *
+
+
+def load_time(load, repeats):
+    # median seconds of load()
+    times = []
+    for _ in range(repeats):
+        tic = time.perf_counter()
+        load()
+        times.append(time.perf_counter() - tic)
+    return sorted(times)[len(times) // 2]
+
+
+def model_loader(checkpoint_keys, path):
+    # builds the model of a checkpoint from path
+    if 'RegNet_layers' in checkpoint_keys:
+        return lambda: RegNet(state=load_checkpoint(path))
+    return lambda: MDNet(path)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--inputs', nargs='+', default=[tracking_opts['model_path'], '../models/regnet.pth'])
+    parser.add_argument('-r', '--repeats', default=3, type=int, help='loads timed per format')
+    args = parser.parse_args()
+
+    for path in args.inputs:
+        if not os.path.isfile(path):
+            print('%s: not found, skipped' % path)
+            continue
+        if os.path.splitext(path)[1] == '.mat':
+            tic = time.perf_counter()
+            MDNet(path)  # converts and caches
+            print('%s -> %s (%.2f s)' % (path, cache_path(path), time.perf_counter() - tic))
+            continue
+
+        checkpoint = torch.load(path)
+        flat_path = os.path.splitext(path)[0] + flat_extension
+        dropped = save_flat(flat_path, checkpoint)
+        print('%s -> %s | %.1f MB -> %.1f MB | not kept: %s' %
+              (path, flat_path, os.path.getsize(path) / 1e6, os.path.getsize(flat_path) / 1e6,
+               ', '.join(dropped) if len(dropped) > 0 else 'none'))
+
+        # the same weights from both files (MDNet fc6 is not saved, it is drawn per sequence)
+        keys = list(checkpoint.keys())
+        pth_model = model_loader(keys, path)()
+        flat_model = model_loader(keys, flat_path)()
+        for (k, p), (_, q) in zip(pth_model.layers.state_dict().items(), flat_model.layers.state_dict().items()):
+            if not torch.equal(p, q):
+                raise RuntimeError('%s differs in %s' % (k, flat_path))
+        del checkpoint, pth_model, flat_model
+
+        for name, load in [('torch.load', lambda: torch.load(path)), ('load_flat', lambda: load_flat(flat_path)),
+                           ('model .pth', model_loader(keys, path)), ('model .flat', model_loader(keys, flat_path))]:
+            print('  %-11s | %8.1f ms' % (name, load_time(load, args.repeats) * 1000))
@@ -9,7 +9,7 @@ from utils import *
 
 
 class RegionExtractor():
-    def __init__(self, image, samples, crop_size, padding, batch_size, shuffle=False):
+    def __init__(self, image, samples, crop_size, padding, batch_size, shuffle=False, batched=True):
 
         self.image = np.asarray(image)
         self.samples = samples
@@ -18,6 +18,11 @@ class RegionExtractor():
         self.batch_size = batch_size
         self.shuffle = shuffle
 
+        # batched - crop the whole batch with crop_images, else crop_image per sample (reference path)
+        self.batched = batched
+        if batched:
+            self.image_tensor = image_to_tensor(self.image)
+
         self.index = np.arange(len(samples))
         self.pointer = 0
 
@@ -41,10 +46,13 @@ class RegionExtractor():
     next = __next__
 
     def extract_regions(self, index):
+        if self.batched:
+            return crop_images(self.image_tensor, self.samples[index], self.crop_size, self.padding).numpy()
+
         regions = np.zeros((len(index),self.crop_size,self.crop_size,3),dtype='uint8')
         for i, sample in enumerate(self.samples[index]):
             regions[i] = crop_image(self.image, sample, self.crop_size, self.padding)
 
-        regions = regions.transpose(0,3,1,2).astype('float32')
+        regions = np.ascontiguousarray(regions.transpose(0,3,1,2)).astype('float32')
         regions = regions - 128.
         return regions
@@ -0,0 +1,80 @@
+import numpy as np
+import torch
+
+
+class FeatureBank():
+    # preallocated circular buffer of the sample features collected per frame (and their IoUs)
+    # appending a frame is O(1) and overwrites the oldest frame once the bank is full
+    #
+    # n_frames - frames kept (e.g. n_frames_long)
+    # n_per_frame - samples kept per frame (e.g. n_pos_update). a frame with fewer samples keeps its count, and
+    #               only its samples are read back (every sample is trained on with the same weight)
+    # window - longest "last frames" range read with last(). the first window-1 frame slots are mirrored
+    #          after the end of the buffer, so that range is always one contiguous slice (i.e. a view)
+    # with_ious - also keep a per-sample IoU array (loss_index == 2)
+    def __init__(self, n_frames, n_per_frame, window=1, with_ious=False):
+        self.n_frames = n_frames
+        self.n_per_frame = n_per_frame
+        self.window = max(1, min(window, n_frames))
+        self.n_slots = n_frames + self.window - 1
+        self.with_ious = with_ious
+
+        # allocated on first append, on the device and with the size of the features
+        self.feats = None
+        self.ious = None
+
+        self.counts = np.zeros(self.n_slots, dtype=int)  # samples of the frame in each slot
+        self.head = 0  # slot of the next frame
+        self.count = 0  # valid frames
+
+    def __len__(self):
+        return self.count
+
+    def append(self, feats, ious=None):
+        if len(feats) == 0:
+            return
+        if self.feats is None:
+            self.feats = feats.new_empty((self.n_slots * self.n_per_frame, feats.size(-1)))
+            if self.with_ious:
+                self.ious = np.empty(self.n_slots * self.n_per_frame)
+
+        count = min(len(feats), self.n_per_frame)
+        slots = [self.head]
+        if self.head < self.window - 1:
+            slots.append(self.n_frames + self.head)
+        for slot in slots:
+            rows = slice(slot * self.n_per_frame, slot * self.n_per_frame + count)
+            self.feats[rows] = feats[:count]
+            if self.with_ious:
+                self.ious[rows] = np.asarray(ious)[:count]
+            self.counts[slot] = count
+
+        self.head = (self.head + 1) % self.n_frames
+        self.count = min(self.count + 1, self.n_frames)
+
+    def frames(self, start, end):
+        # the samples of the frames in slots start to end, a view if they are all full
+        if np.all(self.counts[start:end] == self.n_per_frame):
+            rows = slice(start * self.n_per_frame, end * self.n_per_frame)
+            feats = self.feats[rows]
+        else:
+            # (a copy) the first counts[slot] rows of each slot
+            rows = np.arange(start, end)[:, None] * self.n_per_frame + np.arange(self.n_per_frame)
+            rows = rows[np.arange(self.n_per_frame) < self.counts[start:end, None]]
+            feats = self.feats[torch.from_numpy(rows).to(self.feats.device)]
+        if self.with_ious:
+            return feats, self.ious[rows]
+        return feats, None
+
+    def all(self):
+        # all valid frames (not in chronological order once the bank wrapped around)
+        return self.frames(0, self.count)
+
+    def last(self, n):
+        # the n most recent frames, n <= window
+        n = min(n, self.count)
+        if n > self.window:
+            raise RuntimeError("FeatureBank window is %d frames, %d requested" % (self.window, n))
+        if self.head >= n:
+            return self.frames(self.head - n, self.head)
+        return self.frames(self.head - n + self.n_frames, self.head + self.n_frames)
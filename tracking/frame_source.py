@@ -0,0 +1,92 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+
+def load_frame(img_path):
+    # decodes one frame (PIL releases the GIL while decoding, so threads overlap with the tracker)
+    tic = time.time()
+    image = Image.open(img_path).convert('RGB')
+    return image, time.time() - tic
+
+
+class FrameSource():
+    # the frames of a sequence, decoded on background threads ahead of the tracker
+    #
+    # frames[i] returns the RGB PIL image of img_list[i]. every access schedules the decoding of the
+    # next depth frames, and frames behind the accessed one are dropped, so at most depth decoded
+    # frames are held. accesses are expected to move forward (e.g. the main loop, or a re-init after a
+    # tracking loss a few frames ahead), a jump back is decoded again on the caller thread.
+    # frames[start:] is a view that shares the decoded frames, e.g. to start a run from frame start.
+    #
+    # depth - frames decoded ahead of the consumer (0 - decode on the caller thread)
+    # workers - decoding threads
+    def __init__(self, img_list, depth=4, workers=1):
+        self.img_list = img_list
+        self.depth = depth
+        self.pool = ThreadPoolExecutor(max_workers=workers) if depth > 0 else None
+        self.pending = {}  # frame index -> future of (image, decode time)
+        self.source = self  # (as in FrameSlice)
+
+        # stats per access: decoded frames waiting in the queue, decode time of the frame
+        # and the time the caller was blocked waiting for it
+        self.queue_depths = []
+        self.decode_times = []
+        self.wait_times = []
+
+    def __len__(self):
+        return len(self.img_list)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return FrameSlice(self, range(len(self))[i])
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('frame index out of range')
+
+        tic = time.time()
+        if self.pool is None:
+            image, decode_time = load_frame(self.img_list[i])
+            self.queue_depths.append(0)
+        else:
+            # drop the frames behind (a re-init skips frames), then keep the queue full up to i + depth
+            for j in [j for j in self.pending if j < i or j > i + self.depth]:
+                self.pending.pop(j).cancel()
+            self.queue_depths.append(sum(1 for j, future in self.pending.items() if j > i and future.done()))
+            for j in range(i, min(i + self.depth + 1, len(self))):
+                if j not in self.pending:
+                    self.pending[j] = self.pool.submit(load_frame, self.img_list[j])
+            image, decode_time = self.pending.pop(i).result()
+        self.wait_times.append(time.time() - tic)
+        self.decode_times.append(decode_time)
+        return image
+
+    def stats(self, since=0):
+        # mean decode time, mean wait time (both in seconds) and mean queue depth of the accesses from
+        # access number since on (e.g. len(frames.decode_times) at the start of a run)
+        n = max(len(self.decode_times) - since, 1)
+        return sum(self.decode_times[since:]) / n, sum(self.wait_times[since:]) / n, sum(self.queue_depths[since:]) / n
+
+    def close(self):
+        if self.pool is not None:
+            for future in self.pending.values():
+                future.cancel()
+            self.pending = {}
+            self.pool.shutdown(wait=True)
+            self.pool = None
+
+
+class FrameSlice():
+    # frames[start:stop] of a FrameSource
+    def __init__(self, source, indices):
+        self.source = source
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return FrameSlice(self.source, self.indices[i])
+        return self.source[self.indices[i]]
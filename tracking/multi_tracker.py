@@ -0,0 +1,345 @@
+import sys
+import numpy as np
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+sys.path.insert(0, '../modules')
+
+from sample_generator import *
+from model import *
+from bbreg import *
+from FocalLoss import *
+from tracking_utils import *
+from feature_bank import *
+
+import options  # (the device is probed on first use, by options.use_gpu() / options.get_device())
+opts = options.tracking_opts
+
+
+class TargetHeads(nn.Module):
+    # fc4-fc6 of MDNet, one copy per target, stored as stacked weights so that all the targets
+    # (or a subset of them) are forwarded with one batched matmul per layer
+    #
+    # x - T x B x 4608 conv3 features, row t goes through the layers of targets[t]
+    def __init__(self, model, n_targets):
+        super(TargetHeads, self).__init__()
+        self.n_targets = n_targets
+        self.names = ['fc4', 'fc5', 'fc6']
+        linears = [model.layers.fc4[1], model.layers.fc5[1], model.branches[0][1]]
+        for name, linear in zip(self.names, linears):
+            weight = dense_weight(linear).detach().t().unsqueeze(0).repeat(n_targets, 1, 1)
+            bias = linear.bias.detach().unsqueeze(0).repeat(n_targets, 1)
+            self.register_parameter(name + '_weight', nn.Parameter(weight.contiguous()))
+            self.register_parameter(name + '_bias', nn.Parameter(bias.contiguous()))
+        self.reset_fc6()
+
+    def reset_fc6(self, targets=None):
+        # every target gets its own randomly initialized fc6, as a new MDNet branch
+        targets = range(self.n_targets) if targets is None else targets
+        with torch.no_grad():
+            for t in targets:
+                linear = nn.Linear(self.fc6_weight.size(1), self.fc6_weight.size(2))
+                self.fc6_weight[t].copy_(linear.weight.t())
+                self.fc6_bias[t].copy_(linear.bias)
+
+    def forward(self, x, targets=None):
+        for name in self.names:
+            weight = getattr(self, name + '_weight')
+            bias = getattr(self, name + '_bias')
+            if targets is not None:
+                weight = weight[targets]
+                bias = bias[targets]
+            x = F.dropout(x, 0.5, self.training)
+            x = torch.baddbmm(bias.unsqueeze(1), x, weight)
+            if name != 'fc6':
+                x = F.relu(x)
+        return x
+
+
+class HeadsOptimizer():
+    # SGD with momentum and weight decay, as set_optimizer, applied to a subset of the targets only
+    # (the momentum of targets that are not trained in a step is left as is)
+    def __init__(self, heads, lr_base, lr_mult=opts['lr_mult'], momentum=opts['momentum'], w_decay=opts['w_decay']):
+        self.heads = heads
+        self.momentum = momentum
+        self.w_decay = w_decay
+        self.lr = {}
+        self.buffers = {}
+        for name, p in heads.named_parameters():
+            self.lr[name] = lr_base
+            for l, m in lr_mult.items():
+                if name.startswith(l):
+                    self.lr[name] = lr_base * m
+            self.buffers[name] = torch.zeros_like(p)
+
+    def step(self, targets):
+        with torch.no_grad():
+            for name, p in self.heads.named_parameters():
+                grad = p.grad[targets] + self.w_decay * p[targets]
+                buf = self.buffers[name][targets] * self.momentum + grad
+                self.buffers[name][targets] = buf
+                p[targets] -= self.lr[name] * buf
+
+
+def clip_heads_grad_norm_(heads, targets, max_norm):
+    # clip_grad_norm_ of every target on its own
+    params = [p for p in heads.parameters() if p.grad is not None]
+    norms = sum(p.grad[targets].flatten(1).pow(2).sum(1) for p in params).sqrt()
+    coef = (max_norm / (norms + 1e-6)).clamp(max=1)
+    with torch.no_grad():
+        for p in params:
+            p.grad[targets] *= coef.view(-1, *([1] * (p.dim() - 1)))
+
+
+def train_heads(heads, criterion, optimizer, targets, pos_feats, neg_feats, maxiter):
+    # train() of several targets at once, each on its own pos/neg features
+    # pos_feats, neg_feats - lists of features, one per target in targets
+    heads.train()
+
+    batch_pos = opts['batch_pos']
+    batch_neg = opts['batch_neg']
+    batch_neg_cand = max(opts['batch_neg_cand'], batch_neg)
+    n = len(targets)
+    targets = torch.as_tensor(targets, dtype=torch.long)
+
+    pos_idx = [torch.from_numpy(train_schedule(len(feats), batch_pos, maxiter)).to(feats.device) for feats in pos_feats]
+    neg_idx = [torch.from_numpy(train_schedule(len(feats), batch_neg_cand, maxiter)).to(feats.device) for feats in neg_feats]
+
+    target = torch.cat((torch.ones(batch_pos, dtype=torch.long),
+                        torch.zeros(batch_neg, dtype=torch.long))).repeat(n).to(pos_feats[0].device)
+
+    for iter in range(maxiter):
+
+        # create batch, T x B x 4608
+        batch_pos_feats = torch.stack([feats.index_select(0, idx[iter]) for feats, idx in zip(pos_feats, pos_idx)])
+        batch_neg_feats = torch.stack([feats.index_select(0, idx[iter]) for feats, idx in zip(neg_feats, neg_idx)])
+
+        # hard negative mining, all targets and candidates in a single forward
+        if batch_neg_cand > batch_neg:
+            heads.eval()
+            with torch.no_grad():
+                neg_cand_score = heads(batch_neg_feats, targets)[:, :, 1]
+            _, top_idx = neg_cand_score.topk(batch_neg, dim=1)
+            batch_neg_feats = batch_neg_feats.gather(1, top_idx.unsqueeze(2).expand(-1, -1, batch_neg_feats.size(2)))
+            heads.train()
+
+        # forward
+        score = heads(torch.cat((batch_pos_feats, batch_neg_feats), 1), targets)
+
+        # optimize (the summed loss gives every target the gradient of its own loss)
+        loss = criterion(score.view(-1, 2), target)
+
+        heads.zero_grad()
+        loss.backward()
+        clip_heads_grad_norm_(heads, targets, opts['grad_clip'])
+        optimizer.step(targets)
+
+
+class MultiTracker():
+    # MDNet tracking of several targets in the same video
+    #
+    # the targets share the conv layers and every frame crops and forwards the candidates of all the
+    # targets in one forward_samples batch. each target has its own fc4-fc6 (TargetHeads), bbox
+    # regressor and feature banks, and the online updates of the targets updated in the same frame
+    # are trained as one batched step
+    #
+    # usage:
+    #   tracker = MultiTracker(model_path)
+    #   tracker.init(first_image, init_bboxes)
+    #   for image in images:
+    #       bboxes = tracker.update(image)  # n_targets x 4
+    #
+    # only the original focal loss (loss_index 1) is supported
+    def __init__(self, model_path=opts['model_path'], use_bbreg=True, verbose=False):
+        self.use_bbreg = use_bbreg
+        self.verbose = verbose
+
+        self.model = MDNet(model_path)
+        if options.use_gpu():
+            self.model = self.model.to(options.get_device())
+        self.model.set_learnable_params([])
+
+        self.criterion = FocalLoss(class_num=2, alpha=torch.ones(2, 1)*0.25, size_average=False)
+        self.heads = None
+        self.image = None
+        self.frame_id = None
+
+    def forward_conv3(self, samples):
+        # samples - list of sample arrays, one per target. returns the list of their conv3 features
+        counts = [len(s) for s in samples]
+        feats = forward_samples(self.model, self.image, np.concatenate(samples), out_layer='conv3')
+        return list(torch.split(feats, counts))
+
+    def scores(self, feats, targets):
+        # fc6 scores of feats[i] (conv3 features) by the head of targets[i]
+        self.heads.eval()
+        counts = [len(f) for f in feats]
+        padded = nn.utils.rnn.pad_sequence(feats, batch_first=True)
+        with torch.no_grad():
+            scores = self.heads(padded, torch.as_tensor(targets, dtype=torch.long))
+        return [scores[i, :counts[i]] for i in range(len(feats))]
+
+    def init(self, image, bboxes):
+        # image - PIL image of the first frame
+        # bboxes - n_targets x 4 target bboxes [x,y,w,h] in that frame
+        self.target_bbox = np.array(bboxes, dtype='float64').reshape(-1, 4)
+        self.bbreg_bbox = self.target_bbox.copy()
+        self.n_targets = len(self.target_bbox)
+        self.frame_id = 0
+        self.image = image
+        self.num_short_updates = 0
+        targets = range(self.n_targets)
+
+        self.heads = TargetHeads(self.model, self.n_targets)
+        init_optimizer = HeadsOptimizer(self.heads, opts['lr_init'])
+        self.update_optimizer = HeadsOptimizer(self.heads, opts['lr_update'])
+
+        # Draw bbreg and pos/neg samples of every target, each kind in one call for all the targets
+        bbreg_examples = []
+        if self.use_bbreg:
+            bbreg_examples = split_samples(*gen_samples_batch(SampleGenerator('uniform', image.size, 0.3, 1.5, 1.1),
+                                                              self.target_bbox, opts['n_bbreg'],
+                                                              opts['overlap_bbreg'], opts['scale_bbreg']), self.n_targets)
+        pos_examples = split_samples(*gen_samples_batch(SampleGenerator('gaussian', image.size, 0.1, 1.2),
+                                                        self.target_bbox, opts['n_pos_init'], opts['overlap_pos_init']),
+                                     self.n_targets)
+        neg_uniform = split_samples(*gen_samples_batch(SampleGenerator('uniform', image.size, 1, 2, 1.1),
+                                                       self.target_bbox, opts['n_neg_init'] // 2, opts['overlap_neg_init']),
+                                    self.n_targets)
+        neg_whole = split_samples(*gen_samples_batch(SampleGenerator('whole', image.size, 0, 1.2, 1.1),
+                                                     self.target_bbox, opts['n_neg_init'] // 2, opts['overlap_neg_init']),
+                                  self.n_targets)
+        neg_examples = [np.random.permutation(np.concatenate([u, w])) for u, w in zip(neg_uniform, neg_whole)]
+
+        # one forward for the samples of all the targets
+        feats = self.forward_conv3(bbreg_examples + pos_examples + neg_examples)
+        bbreg_feats = feats[:len(bbreg_examples)]
+        pos_feats = feats[len(bbreg_examples):len(bbreg_examples) + self.n_targets]
+        neg_feats = feats[len(bbreg_examples) + self.n_targets:]
+
+        # Train bbox regressors
+        if self.use_bbreg:
+            self.bbreg = []
+            for t in targets:
+                self.bbreg.append(BBRegressor(image.size))
+                self.bbreg[t].train(bbreg_feats[t], bbreg_examples[t], self.target_bbox[t])
+
+        # Initial training, all targets at once
+        if self.verbose:
+            print('       first training pass on FC layers of %d targets...' % self.n_targets)
+        train_heads(self.heads, self.criterion, init_optimizer, list(targets), pos_feats, neg_feats,
+                    opts['maxiter_init'])
+
+        # Init sample generators and feature banks
+        self.sample_generator = [SampleGenerator('gaussian', image.size, opts['trans_f'], opts['scale_f'], valid=True)
+                                 for _ in targets]
+        self.pos_generator = SampleGenerator('gaussian', image.size, 0.1, 1.2)
+        self.neg_generator = SampleGenerator('uniform', image.size, 1.5, 1.2)
+
+        self.pos_bank = []
+        self.neg_bank = []
+        for t in targets:
+            self.pos_bank.append(FeatureBank(opts['n_frames_long'], opts['n_pos_update'], window=opts['n_frames_short']))
+            self.neg_bank.append(FeatureBank(opts['n_frames_short'], opts['n_neg_update']))
+            self.pos_bank[t].append(pos_feats[t][:opts['n_pos_update']])
+            self.neg_bank[t].append(neg_feats[t][:opts['n_neg_update']])
+
+    def update(self, image):
+        # tracks the next frame, returns the n_targets x 4 (bbox regressed) target bboxes
+        self.track(image)
+        self.learn()
+        return self.bbreg_bbox.copy()
+
+    def track(self, image):
+        # as Tracker.track, the candidates of all the targets are forwarded together
+        # (targets that failed retry with an expanded search area in a second batch)
+        self.frame_id += 1
+        self.image = image
+        self.success = np.zeros(self.n_targets, dtype=bool)
+        self.target_score = np.zeros(self.n_targets)
+        self.top_samples = [None] * self.n_targets
+
+        target_bbox = self.target_bbox.copy()
+        remaining = list(range(self.n_targets))
+        while len(remaining) > 0:
+            samples = []
+            expanded = []
+            for t in remaining:
+                expanded.append(self.sample_generator[t].get_trans_f() == opts['trans_f_expand'])
+                n = 2*opts['n_samples'] if expanded[-1] else opts['n_samples']
+                samples.append(gen_samples(self.sample_generator[t], target_bbox[t], n))
+            scores = self.scores(self.forward_conv3(samples), remaining)
+
+            try_again = []
+            for t, t_samples, t_scores, t_expanded in zip(remaining, samples, scores, expanded):
+                top_scores, top_idx = t_scores[:, 1].topk(5)
+                top_idx = top_idx.cpu().numpy()
+                self.target_score[t] = top_scores.mean()
+                target_bbox[t] = t_samples[top_idx].mean(axis=0)
+                self.top_samples[t] = t_samples[top_idx]
+
+                self.success[t] = self.target_score[t] > opts['success_thr']
+                # Expand search area at failure
+                if self.success[t]:
+                    self.sample_generator[t].set_trans_f(opts['trans_f'])
+                else:
+                    self.sample_generator[t].set_trans_f(opts['trans_f_expand'])
+                    if not t_expanded:
+                        try_again.append(t)
+            remaining = try_again
+
+        # Bbox regression, one forward for the top samples of all the successful targets
+        succeeded = np.flatnonzero(self.success)
+        if len(succeeded) > 0:
+            if self.use_bbreg:
+                bbreg_samples = [self.top_samples[t] for t in succeeded]
+                bbreg_feats = self.forward_conv3(bbreg_samples)
+                for t, t_samples, t_feats in zip(succeeded, bbreg_samples, bbreg_feats):
+                    self.bbreg_bbox[t] = self.bbreg[t].predict(t_feats, t_samples).mean(axis=0)
+            else:
+                self.bbreg_bbox[succeeded] = target_bbox[succeeded]
+            # failed targets keep their previous results
+            self.target_bbox[succeeded] = target_bbox[succeeded]
+
+        return self.bbreg_bbox
+
+    def learn(self):
+        # data collection of the successful targets in one forward, then one batched
+        # short/long term update of every target that needs one
+        succeeded = np.flatnonzero(self.success)
+        if len(succeeded) > 0:
+            pos_examples = split_samples(*gen_samples_batch(self.pos_generator, self.target_bbox[succeeded],
+                                                            opts['n_pos_update'], opts['overlap_pos_update']),
+                                         len(succeeded))
+            neg_examples = split_samples(*gen_samples_batch(self.neg_generator, self.target_bbox[succeeded],
+                                                            opts['n_neg_update'], opts['overlap_neg_update']),
+                                         len(succeeded))
+            feats = self.forward_conv3(pos_examples + neg_examples)
+            for j, t in enumerate(succeeded):
+                self.pos_bank[t].append(feats[j])
+                self.neg_bank[t].append(feats[len(succeeded) + j])
+
+        targets = []
+        pos_data = []
+        neg_data = []
+        for t in range(self.n_targets):
+            if not self.success[t]:
+                # Short term update
+                targets.append(t)
+                pos_data.append(self.pos_bank[t].last(opts['n_frames_short'])[0])
+                self.num_short_updates += 1
+            elif self.frame_id % opts['long_interval'] == 0:
+                # Long term update
+                targets.append(t)
+                pos_data.append(self.pos_bank[t].all()[0])
+            else:
+                continue
+            neg_data.append(self.neg_bank[t].all()[0])
+
+        if len(targets) > 0:
+            if self.verbose:
+                print('      update of targets %s' % targets)
+            train_heads(self.heads, self.criterion, self.update_optimizer, targets, pos_data, neg_data,
+                        opts['maxiter_update'])
@@ -4,29 +4,44 @@ import torch
 
 tracking_opts = OrderedDict()
 
-if torch.cuda.is_available():
-    torch.cuda.empty_cache()
-    tracking_device = torch.device('cuda:0')
-    total_mem = torch.cuda.get_device_properties(tracking_device).total_memory
-    if total_mem > 2500000000:
-        tracking_opts['use_gpu'] = True
-        # print('tracking using gpu')
-    else:
+tracking_opts['use_gpu'] = None  # None - probed on first use (use_gpu()), True / False - forced
+
+
+def use_gpu():
+    # probes the gpu on first call, not at import (the probe creates a CUDA context), the result is kept in
+    # tracking_opts['use_gpu']
+    if tracking_opts['use_gpu'] is None:
         tracking_opts['use_gpu'] = False
-        # print('tracking using cpu')
-        tracking_device = 'cpu'
-else:
-    tracking_opts['use_gpu'] = False
-    # print('tracking using cpu')
-    tracking_device = 'cpu'
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+            total_mem = torch.cuda.get_device_properties(torch.device('cuda:0')).total_memory
+            if total_mem > 2500000000:
+                tracking_opts['use_gpu'] = True
+                # print('tracking using gpu')
+    return tracking_opts['use_gpu']
+
+
+def get_device():
+    return torch.device('cuda:0') if use_gpu() else 'cpu'
+
 
 # tracking_opts['use_gpu'] = True  ###################3 hack for debug #######################
-# tracking_device = torch.device('cuda:0') ###################3 hack for debug #######################
 
 tracking_opts['model_path'] = '../models/mdnet_vot-otb.pth'
 tracking_opts['new_model_path'] = '../models/mdnet_vot_new.pth'
 tracking_opts['img_size'] = 107
 tracking_opts['padding'] = 16
+tracking_opts['batched_crop'] = True  # False - crop samples one by one with crop_image (reference path)
+tracking_opts['prefetch_batches'] = 1  # batches cropped ahead of the forward pass (0 - no background cropping)
+tracking_opts['crop_workers'] = 1  # background cropping threads
+tracking_opts['prefetch_frames'] = 4  # frames decoded ahead of the main loop (0 - decode in the loop)
+tracking_opts['decode_workers'] = 1  # background decoding threads
+tracking_opts['compiled_inference'] = False  # True - compiled conv1-conv3 and fc4-fc6 inference forwards (see MDNet.compile_inference)
+tracking_opts['compile_backend'] = 'trace'  # 'trace' (TorchScript) or 'compile' (torch.compile)
+tracking_opts['quantized'] = False  # True - int8 CPU inference of MDNet (and RegNet), see quantize_model.py
+tracking_opts['quantized_model_path'] = '../models/mdnet_vot-otb_int8.pth'
+tracking_opts['feature_cache'] = True  # reuse features of a sample forwarded earlier in the same frame
+tracking_opts['cache_quantum'] = 0.01  # bbox coordinates closer than this (pixels) share a cache entry
 
 tracking_opts['batch_pos'] = 32
 tracking_opts['batch_neg'] = 96
@@ -34,6 +49,8 @@ tracking_opts['batch_neg_cand'] = 1024
 tracking_opts['batch_test'] = 256
 
 tracking_opts['n_samples'] = 256
+tracking_opts['roi_scoring'] = False  # True - score candidates with forward_samples_roi (shared conv over a search window)
+tracking_opts['roi_max_window'] = 1024  # larger search windows fall back to cropping every candidate
 tracking_opts['trans_f'] = 0.6
 tracking_opts['scale_f'] = 1.05
 tracking_opts['trans_f_expand'] = 1.5
@@ -41,6 +58,7 @@ tracking_opts['trans_f_expand'] = 1.5
 tracking_opts['n_bbreg'] = 1000
 tracking_opts['overlap_bbreg'] = [0.6, 1]
 tracking_opts['scale_bbreg'] = [1, 2]
+tracking_opts['bbreg_update'] = False  # True - adds the positive samples of success frames to the bbox regressor (extends its factorization)
 
 tracking_opts['lr_init'] = 0.0001
 tracking_opts['maxiter_init'] = 30
@@ -60,6 +78,7 @@ tracking_opts['success_thr'] = 0
 tracking_opts['n_frames_short'] = 20
 tracking_opts['n_frames_long'] = 100
 tracking_opts['long_interval'] = 10
+tracking_opts['async_update'] = False  # True - train the updates in a background thread, swapped in at a frame boundary
 
 tracking_opts['w_decay'] = 0.0005
 tracking_opts['momentum'] = 0.9
@@ -0,0 +1,66 @@
+import os
+import sys
+import argparse
+import numpy as np
+from PIL import Image
+
+import torch
+
+# needed for following usage:
+#  cd tracking
+#  python quantize_model.py [-s DragonBaby] [-n 10] [-m ../models/mdnet_vot-otb.pth] [-o ../models/mdnet_vot-otb_int8.pth]
+# calibrates the int8 conv layers of MDNet on crops of the first frames of a sequence and saves them,
+# tracking loads them with tracking_opts['quantized'] = True
+sys.path.insert(0, '../modules')
+
+from sample_generator import *
+from model import *
+from tracking_utils import *
+
+seq_home = '../dataset/OTB'
+
+
+def calibration_regions(img_list, bboxes, n_candidates=64, n_neg=32):
+    # crops of every frame as tracking forwards them: candidates around the target and negatives
+    regions = []
+    for img_path, bbox in zip(img_list, bboxes):
+        image = Image.open(img_path).convert('RGB')
+        samples = np.concatenate([
+            gen_samples(SampleGenerator('gaussian', image.size, opts['trans_f'], opts['scale_f'], valid=True),
+                        bbox, n_candidates),
+            gen_samples(SampleGenerator('uniform', image.size, 1.5, 1.2), bbox, n_neg, opts['overlap_neg_update'])])
+        extractor = RegionExtractor(image, samples, opts['img_size'], opts['padding'], len(samples))
+        regions.append(torch.from_numpy(extractor.extract_regions(np.arange(len(samples)))))
+    return torch.cat(regions)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--seq', default='DragonBaby', help='calibration sequence')
+    parser.add_argument('-n', '--n_frames', default=10, type=int, help='calibration frames, spread over the sequence')
+    parser.add_argument('-m', '--model_path', default=opts['model_path'])
+    parser.add_argument('-o', '--out_path', default=opts['quantized_model_path'])
+    parser.add_argument('-e', '--engine', default='x86', help='quantized engine (x86, fbgemm, qnnpack, onednn)')
+    args = parser.parse_args()
+
+    np.random.seed(123)
+    img_dir = os.path.join(seq_home, args.seq, 'img')
+    img_list = [os.path.join(img_dir, x) for x in sorted(os.listdir(img_dir))]
+    gt = np.loadtxt(os.path.join(seq_home, args.seq, 'groundtruth_rect.txt'), delimiter=',')
+    frames = np.linspace(0, min(len(img_list), len(gt)) - 1, args.n_frames).astype(int)
+
+    model = MDNet(args.model_path).eval()
+    regions = calibration_regions([img_list[i] for i in frames], gt[frames])
+    with torch.no_grad():
+        float_feats = model(regions[:256], out_layer='conv3')
+    model.quantize(regions, engine=args.engine)
+
+    # error of the int8 conv3 features on the calibration crops
+    with torch.no_grad():
+        feats = model(regions[:256], out_layer='conv3')
+    print('calibrated on %d crops of %d frames, conv3 relative error %.4f' %
+          (len(regions), len(frames), ((feats - float_feats).norm() / float_feats.norm()).item()))
+
+    model.save_quantized(args.out_path)
+    print('int8 conv layers saved to ' + args.out_path)
@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+import json
+import argparse
+import numpy as np
+from PIL import Image
+
+import torch
+
+# needed for following usage:
+#  cd tracking
+#  python run_multi_tracker.py -s DragonBaby [-b x,y,w,h x,y,w,h ...] [-n 100]
+sys.path.insert(0, '../modules')
+
+from gen_config import *
+from multi_tracker import *
+
+np.random.seed(123)
+torch.manual_seed(456)
+torch.cuda.manual_seed(789)
+
+
+def run_multi(img_list, init_bboxes, model_path=opts['model_path'], verbose=True):
+    # tracks all the init_bboxes (given in the first image) in one pass over the images
+    # returns n_images x n_targets x 4 bboxes and the seconds per frame
+    tracker = MultiTracker(model_path, verbose=verbose)
+
+    tic = time.time()
+    image = Image.open(img_list[0]).convert('RGB')
+    tracker.init(image, init_bboxes)
+    result = np.zeros((len(img_list), tracker.n_targets, 4))
+    result[0] = tracker.bbreg_bbox
+    if verbose:
+        print('    initialization of %d targets done, Time: %.3f' % (tracker.n_targets, time.time() - tic))
+
+    spf = np.zeros(len(img_list))
+    for i in range(1, len(img_list)):
+        tic = time.time()
+        image = Image.open(img_list[i]).convert('RGB')
+        result[i] = tracker.update(image)
+        spf[i] = time.time() - tic
+        if verbose:
+            print('      Frame %d/%d, Scores %s, Time %.3f' %
+                  (i, len(img_list) - 1, np.array2string(tracker.target_score, precision=3), spf[i]))
+    return result, spf[1:]
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--seq', default='', help='input seq')
+    parser.add_argument('-j', '--json', default='', help='input json')
+    parser.add_argument('-b', '--bboxes', nargs='+', default=[], help='x,y,w,h of every target (default: the init bbox)')
+    parser.add_argument('-n', '--n_frames', default=0, type=int, help='frames to track (0 - all)')
+    parser.add_argument('-m', '--model_path', default=opts['model_path'])
+    args = parser.parse_args()
+    assert (args.seq != '' or args.json != '')
+    args.savefig = False
+    args.display = False
+
+    img_list, init_bbox, gt, savefig_dir, display, result_path = gen_config(args)
+    if args.n_frames > 0:
+        img_list = img_list[:args.n_frames + 1]
+    if len(args.bboxes) > 0:
+        init_bboxes = np.array([[float(v) for v in bbox.split(',')] for bbox in args.bboxes])
+    else:
+        init_bboxes = np.array([init_bbox])
+
+    result, spf = run_multi(img_list, init_bboxes, model_path=args.model_path)
+    fps = len(spf) / spf.sum()
+    print('tracked %d targets in %d frames, %.2f fps' % (len(init_bboxes), len(spf), fps))
+
+    res = {}
+    res['type'] = 'rect'
+    res['res'] = [result[:, t].round().tolist() for t in range(len(init_bboxes))]
+    res['fps'] = fps
+    result_path = os.path.join(os.path.dirname(result_path), 'result_multi.json')
+    json.dump(res, open(result_path, 'w'), indent=2)
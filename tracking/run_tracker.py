@@ -5,8 +5,6 @@ import time
 import argparse
 import json
 from PIL import Image
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
 
 import torch
 import torch.utils.data as data
@@ -27,11 +25,15 @@ from gen_config import *
 from prin_gen_config import *
 from FocalLoss import *
 from tracking_utils import *
+from feature_bank import *
+from async_update import *
+from tracker import *
+from frame_source import *
 
 import itertools
-from cycler import cycler
 #from pynvml import *
-from shapely.geometry import Polygon
+# matplotlib, cycler (display, plots) and shapely (quadrilateral IoU) are imported where used, so that
+# tracking without them does not pay for importing them
 
 
 np.random.seed(123)
@@ -120,28 +122,34 @@ losses_strings = {1: 'original-focal', 2: 'average-with-iou'}
 models_strings = {1: 'original-git', 2: 'new-learnt'}
 models_paths = {1: opts['model_path'], 2: opts['new_model_path']}
 
-# tracking: speed-ups
-if opts['use_gpu']:
-    load_features_from_file = False
-    avg_iters_per_sequence = 1  # 3  # should be 15 per the VOT challenge
-    fewer_images = False  # default. can be overriden by command argument
-    loss_indices_for_tracking = [1]  # [1, 2]
-    models_indices_for_tracking = [1]  # [1, 2]
-else:  # minimalist - just see the code works
-    load_features_from_file = True
-    avg_iters_per_sequence = 1
-    fewer_images = True
-    loss_indices_for_tracking = [1]
-    models_indices_for_tracking = [1]  # [1, 2]
-
-# load_features_from_file = True  ############# hack for debug ###################33
+# tracking: speed-ups, by the device - set_speed_ups() (called by apply_args) sets the minimalist ones
+# without a gpu. not set at import, which would probe the gpu (creating a CUDA context)
+load_features_from_file = False
+avg_iters_per_sequence = 1  # 3  # should be 15 per the VOT challenge
+fewer_images = False  # default. can be overriden by command argument
+loss_indices_for_tracking = [1]  # [1, 2]
+models_indices_for_tracking = [1]  # [1, 2]
 
 sequence_len_limit = 10  # limit number of frame taken from each sequence
 save_features_to_file = False
 detailed_printing = True
 
-if load_features_from_file:
-    save_features_to_file = False
+
+def set_speed_ups():
+    global load_features_from_file, avg_iters_per_sequence, fewer_images, loss_indices_for_tracking, \
+        models_indices_for_tracking, save_features_to_file
+    if not options.use_gpu():  # minimalist - just see the code works
+        load_features_from_file = True
+        avg_iters_per_sequence = 1
+        fewer_images = True
+        loss_indices_for_tracking = [1]
+        models_indices_for_tracking = [1]  # [1, 2]
+
+    # load_features_from_file = True  ############# hack for debug ###################33
+
+    if load_features_from_file:
+        save_features_to_file = False
+
 
 # global variable
 init_after_loss = False  # True - VOT metrics, False - OTB metrics
@@ -154,13 +162,43 @@ display_OTB_benchmark = True
 
 
 bb_fc_model_path = '../models/regnet.pth'
-if not os.path.isfile(bb_fc_model_path):
-    raise Exception('no saved RegNet state')
-regnet_state = torch.load(bb_fc_model_path)
-if 'translate_mode' in regnet_state.keys():
-    translate_mode = regnet_state['translate_mode']  # we overide train_regnet input according to saved state
-else:
-    translate_mode = True
+regnet_state = None  # loaded on first use, by load_regnet_state()
+
+
+def load_regnet_state():
+    global regnet_state
+    if regnet_state is None:
+        if not os.path.isfile(bb_fc_model_path):
+            raise Exception('no saved RegNet state')
+        regnet_state = load_checkpoint(bb_fc_model_path)  # (.pth or .flat)
+    return regnet_state
+
+
+regnet_models = {}  # built on first use, by load_regnet(), per (gpu, int8)
+
+
+def load_regnet():
+    # the RegNet of load_regnet_state(), built (and quantized for int8 CPU inference) once and used by every run
+    # (it is only used for inference). returns the model and its translate_mode
+    regnet_state = load_regnet_state()
+    if 'translate_mode' in regnet_state.keys():
+        translate_mode = regnet_state['translate_mode']  # we overide train_regnet input according to saved state
+    else:
+        translate_mode = True
+    key = (options.use_gpu(), opts['quantized'] and not options.use_gpu())
+    if key not in regnet_models:
+        bb_fc_model = RegNet(translate_mode=translate_mode, state=regnet_state)
+        if 'best_prec' in regnet_state.keys():
+            best_prec = regnet_state['best_prec']
+            print("    regnet loaded with precision = %.4f" % best_prec)
+        if options.use_gpu():
+            bb_fc_model = bb_fc_model.to(options.get_device())
+        bb_fc_model.eval()
+        if key[1]:
+            bb_fc_model = quantize_linears(bb_fc_model)  # int8 fc1 (9220x4000) and the following layers
+        regnet_models[key] = bb_fc_model
+    return regnet_models[key], translate_mode
+
 
 perform_refinement = True  # True - use RegNet/BBregressor to refine BB, False - use mdnet tracker output as-is
 use_regnet = False
@@ -174,13 +212,26 @@ display_model_loss_details = False
 
 
 ##################
-import options
-device = options.tracking_device
+import options  # (the device is probed on first use, by options.use_gpu() / options.get_device())
 opts = options.tracking_opts
 ##################
 
 
-def run_mdnet(img_list, init_bbox, gt=None, savefig_dir='', display=False, loss_index=1, model_path=opts['model_path'], seq_name=None):
+def run_mdnet(img_list, init_bbox, gt=None, savefig_dir='', display=False, loss_index=1, model_path=opts['model_path'], seq_name=None, tracker=None):
+    # img_list - the image paths, or a FrameSource (or a slice of one) shared between runs
+    # tracker - a Tracker to reuse (its model stays loaded between runs), otherwise one is created for model_path
+
+    # the init of the run is not a part of the last frame of the previous run
+    stage_timer.begin_run()
+
+    # frames are decoded on background threads ahead of the main loop
+    if isinstance(img_list, (FrameSource, FrameSlice)):
+        frames = img_list
+        own_frames = False
+    else:
+        frames = FrameSource(img_list, opts['prefetch_frames'], opts['decode_workers'])
+        own_frames = True
+    frames_since = len(frames.source.decode_times)
 
     # num_images include frame 0
     if fewer_images:
@@ -224,26 +275,10 @@ def run_mdnet(img_list, init_bbox, gt=None, savefig_dir='', display=False, loss_
         result_regnet_ious[0] = 1.
     #################
 
-    # Init model
-    model = MDNet(model_path)
-    if opts['use_gpu']:
-        model = model.to(device)
-    model.set_learnable_params(opts['ft_layers'])
-
-    # Init criterion
-    # criterion = BinaryLoss()
-    criterion = FocalLoss(class_num=2, alpha=torch.ones(2, 1)*0.25, size_average=False)
-
-    # Init Optimizers
-    # e.g. SGD with a list of 6 parameter groups
-    # e.g. parameter group:
-    #     dampening: 0
-    #     lr: 0.0001  <--  learning rate, changing
-    #     momentum: 0.9
-    #     nesterov: False
-    #     weight_decay: 0.0005
-    init_optimizer = set_optimizer(model, opts['lr_init'])
-    update_optimizer = set_optimizer(model, opts['lr_update'])
+    # Init tracker (loads the model), unless one is reused across runs
+    if tracker is None:
+        tracker = Tracker(model_path, loss_index=loss_index, use_bbreg=perform_refinement and use_lin_reg)
+    tracker.verbose = detailed_printing
 
     # --------
     print('    initializing...')
@@ -272,111 +307,37 @@ def run_mdnet(img_list, init_bbox, gt=None, savefig_dir='', display=False, loss_
     #       loss function is FocalLoss(class_num=2, alpha=torch.ones(2, 1)*0.25, size_average=False)
 
     # Load first image
-    image = Image.open(img_list[0]).convert('RGB')
+    with stage_timer.stage('decode'):
+        image = frames[0]
 
     ######################
     # use_regnet - i.e. we can use alongside BBRegressor
     # perform_refinement - i.e. we can take mdnet trackers output as-is
     if use_regnet:
-        bb_fc_model = RegNet(translate_mode=translate_mode, state=regnet_state)
-        if 'best_prec' in regnet_state.keys():
-            best_prec = regnet_state['best_prec']
-            print("    regnet loaded with precision = %.4f" % best_prec)
-        if opts['use_gpu']:
-            bb_fc_model = bb_fc_model.to(device)
-        bb_fc_model.eval()
+        bb_fc_model, translate_mode = load_regnet()
     ######################
 
-    # Train bbox regressor
-    if perform_refinement and use_lin_reg:
-        if detailed_printing:
-            print('       training BB regressor...')
-        bbreg_examples = gen_samples(SampleGenerator('uniform', image.size, 0.3, 1.5, 1.1),
-                                     target_bbox, opts['n_bbreg'], opts['overlap_bbreg'], opts['scale_bbreg'])
-        bbreg_feats = forward_samples(model, image, bbreg_examples)
-        bbreg = BBRegressor(image.size)  # image_size is e.g. (640, 360)
-        bbreg.train(bbreg_feats, bbreg_examples, target_bbox)
-        if detailed_printing:
-            print('       finished training BB regressor.')
-
-    # Draw pos/neg samples
-    pos_examples = gen_samples(SampleGenerator('gaussian', image.size, 0.1, 1.2),
-                               target_bbox, opts['n_pos_init'], opts['overlap_pos_init'])
-
-    neg_examples = np.concatenate([
-        gen_samples(SampleGenerator('uniform', image.size, 1, 2, 1.1),
-                    target_bbox, opts['n_neg_init'] // 2, opts['overlap_neg_init']),
-        gen_samples(SampleGenerator('whole', image.size, 0, 1.2, 1.1),
-                    target_bbox, opts['n_neg_init'] // 2, opts['overlap_neg_init'])])
-    neg_examples = np.random.permutation(neg_examples)
-
     ######################
     # hacks to speed-up execution for debugging on expense of accuracy
     fw_samples = False
+    init_feats = None
     folder_name = os.path.join('../features', benchmark_dataset)
     os.makedirs(folder_name, exist_ok=True)
     pos_file_name = os.path.join(folder_name, seq_name.replace('\\', '/').replace('/', '_') + '_pos_feats.pt')
     neg_file_name = os.path.join(folder_name, seq_name.replace('\\', '/').replace('/', '_') + '_neg_feats.pt')
     if load_features_from_file:
         if os.path.isfile(pos_file_name) and os.path.isfile(neg_file_name):
-            pos_feats = torch.load(pos_file_name)
-            neg_feats = torch.load(neg_file_name)
+            init_feats = (torch.load(pos_file_name), torch.load(neg_file_name))
         else:
             fw_samples = True
-    if fw_samples or (not load_features_from_file):
-        # Extract pos/neg features
-        if detailed_printing:
-            print('       extracting features from BB samples...')
-        if fewer_images:  # shorter run in general, less accurate
-            pos_feats = forward_samples(model, image, pos_examples[:50])
-            neg_feats = forward_samples(model, image, neg_examples[:500])
-        else:
-            pos_feats = forward_samples(model, image, pos_examples)
-            neg_feats = forward_samples(model, image, neg_examples)
-        if save_features_to_file or fw_samples:
-            torch.save(pos_feats, pos_file_name)
-            torch.save(neg_feats, neg_file_name)
-        if detailed_printing:
-            print('       finished extracting features from BB samples.')
-    ######################
-    feat_dim = pos_feats.size(-1)
-
-    ######################
-    # Extract pos/neg IoUs
-    if loss_index == 2:
-        pos_ious = overlap_ratio(pos_examples, target_bbox)
-        neg_ious = overlap_ratio(neg_examples, target_bbox)
     ######################
 
-    # Initial training
-    if detailed_printing:
-        print('       first training pass on FC layers...')
-    if loss_index == 2:
-        train(model, criterion, init_optimizer, pos_feats, neg_feats, opts['maxiter_init'], \
-              pos_ious=pos_ious, neg_ious=neg_ious, loss_index=loss_index)
-    else:
-        train(model, criterion, init_optimizer, pos_feats, neg_feats, opts['maxiter_init'], \
-              loss_index=loss_index)
-    if detailed_printing:
-        print('       finished first training pass on FC layers.')
-
-    # Init sample generators
-    # sample_generator - for tracking
-    # pos_generator, neg_generator - for online re-training
-    sample_generator = SampleGenerator('gaussian', image.size, opts['trans_f'], opts['scale_f'], valid=True)
-    pos_generator = SampleGenerator('gaussian', image.size, 0.1, 1.2)
-    neg_generator = SampleGenerator('uniform', image.size, 1.5, 1.2)
-
-    # Init pos/neg features for update
-    pos_feats_all = [pos_feats[:opts['n_pos_update']]]
-    neg_feats_all = [neg_feats[:opts['n_neg_update']]]
-
-    ######################
-    # Init pos/neg ious for update
-    if loss_index == 2:
-        pos_ious_all = [pos_ious[:opts['n_pos_update']]]
-        neg_ious_all = [neg_ious[:opts['n_neg_update']]]
-    ######################
+    # bbox regressor training, first frame samples and initial training of the FC layers
+    with stage_timer.stage('init'):
+        tracker.init(image, target_bbox, init_feats=init_feats, n_init=(50, 500) if fewer_images else None)
+    if init_feats is None and (save_features_to_file or fw_samples):
+        torch.save(tracker.pos_feats, pos_file_name)
+        torch.save(tracker.neg_feats, neg_file_name)
 
     spf_total = time.time() - tic
     if detailed_printing:
@@ -385,6 +346,8 @@ def run_mdnet(img_list, init_bbox, gt=None, savefig_dir='', display=False, loss_
     # Display
     savefig = savefig_dir != ''
     if display or savefig:
+        import matplotlib.pyplot as plt
+        import matplotlib.patches as patches
         dpi = 80.0
         figsize = (image.size[0] / dpi, image.size[1] / dpi)
 
@@ -445,9 +408,12 @@ def run_mdnet(img_list, init_bbox, gt=None, savefig_dir='', display=False, loss_
         if savefig:
             fig.savefig(os.path.join(savefig_dir, '0000.jpg'), dpi=dpi)
 
+    # features of the current frame, cached by the tracker
+    frame_features = tracker.frame_features
+
+
     # Main loop
     print('    main loop...')
-    num_short_updates = 0
     spf_total = 0  # I don't want to take into account initialization
     for i in range(1, num_images):
 
@@ -478,80 +444,59 @@ def run_mdnet(img_list, init_bbox, gt=None, savefig_dir='', display=False, loss_
         # short-term - if not success, we perform similar update routine using all available negative features
         #       but limit the number of positive features
 
+        stage_timer.next_frame()
         tic = time.time()
-        # Load image
-        image = Image.open(img_list[i]).convert('RGB')
+        # Load image (decoded ahead by frames)
+        with stage_timer.stage('decode'):
+            image = frames[i]
+
+        # Estimate target bbox (and its bbox regression)
+        tracker.track(image)
+        samples = tracker.samples
+        top_idx = tracker.top_idx
+        target_score = tracker.target_score
+        success = tracker.success
+        target_bbox = samples[top_idx].mean(axis=0)
+        staleness = tracker.staleness
+
+        #########################################
+        if use_regnet and use_regnet_add_samples_else_self_track:
+            feats_samples = frame_features(samples)
+            feats_frame = frame_features(np.array([[0, 0, image.size[0], image.size[1]]]))
+            samples_std = samples.copy()
+            img_size_std = opts['img_size']
+            samples_std[:,0] = samples[:,0] * img_size_std / image.size[0]
+            samples_std[:,2] = samples[:,2] * img_size_std / image.size[0]
+            samples_std[:,1] = samples[:,1] * img_size_std / image.size[1]
+            samples_std[:,3] = samples[:,3] * img_size_std / image.size[1]
+            samples_std_as_tensor = torch.Tensor(samples_std)
+            if options.use_gpu():
+                samples_std_as_tensor = samples_std_as_tensor.to(device=options.get_device())
+
+            # perform refinement (the frame features go through fc1 once, not once per sample)
+            with torch.no_grad():
+                samples_refined_std = bb_fc_model.forward_split(feats_samples, feats_frame, samples_std_as_tensor)
+            if translate_mode:
+                samples_refined_std += samples_std_as_tensor
 
+            # cv_BB_refined_std = cv_BB_refined_std.detach().numpy()
+            samples_refined_std = samples_refined_std.cpu().numpy()
 
-        try_again = True
-        while try_again:
-            # Estimate target bbox
-            if sample_generator.get_trans_f() == opts['trans_f_expand']:
-                samples = gen_samples(sample_generator, target_bbox, 2*opts['n_samples'])
-            else:
-                samples = gen_samples(sample_generator, target_bbox, opts['n_samples'])
-            # for sample in samples:
-            #     print("iou: %.5f" % overlap_ratio(target_bbox, sample))
-            sample_scores = forward_samples(model, image, samples, out_layer='fc6')
-            top_scores, top_idx = sample_scores[:, 1].topk(5)
-            top_idx = top_idx.cpu().numpy()
-            target_score = top_scores.mean()
-            target_bbox = samples[top_idx].mean(axis=0)
-
-            #########################################
-            if use_regnet and use_regnet_add_samples_else_self_track:
-                feats_samples = forward_samples(model, image, samples)
-                feats_frame = forward_samples(model, image, np.array([[0, 0, image.size[0], image.size[1]]]))
-                samples_std = samples.copy()
-                img_size_std = opts['img_size']
-                samples_std[:,0] = samples[:,0] * img_size_std / image.size[0]
-                samples_std[:,2] = samples[:,2] * img_size_std / image.size[0]
-                samples_std[:,1] = samples[:,1] * img_size_std / image.size[1]
-                samples_std[:,3] = samples[:,3] * img_size_std / image.size[1]
-                samples_std_as_tensor = torch.Tensor(samples_std)
-                if opts['use_gpu']:
-                    samples_std_as_tensor = samples_std_as_tensor.to(device=device)
-                regnet_input = torch.cat((feats_samples, feats_frame.repeat(feats_samples.shape[0],1), samples_std_as_tensor), dim=1)
-
-                # if opts['use_gpu']:
-                #     regnet_input = regnet_input.to(device=device)
-
-                # perform refinement
-                with torch.no_grad():
-                    samples_refined_std = bb_fc_model(regnet_input)
-                if translate_mode:
-                    samples_refined_std += regnet_input[:, -4:]
-
-                # cv_BB_refined_std = cv_BB_refined_std.detach().numpy()
-                samples_refined_std = samples_refined_std.cpu().numpy()
-
-                # re-scale refined BB back to frame proportions
-                samples_refined = samples_refined_std
-                samples_refined[:,0] = samples_refined_std[:,0] * image.size[0] / img_size_std
-                samples_refined[:,2] = samples_refined_std[:,2] * image.size[0] / img_size_std
-                samples_refined[:,1] = samples_refined_std[:,1] * image.size[1] / img_size_std
-                samples_refined[:,3] = samples_refined_std[:,3] * image.size[1] / img_size_std
-
-                expanded_samples = np.concatenate((samples, samples_refined))
-                expanded_samples_score = forward_samples(model, image, expanded_samples, out_layer='fc6')
-                top_expanded_scores, top_expanded_idx = expanded_samples_score[:, 1].topk(5)
-
-                top_expanded_idx = top_expanded_idx.cpu().numpy()
-                target_expanded_score = top_expanded_scores.mean()
-                target_expanded_bbox = expanded_samples[top_expanded_idx].mean(axis=0)
-            #########################################
-
-            if sample_generator.get_trans_f() == opts['trans_f_expand']:
-                try_again = False
-
-            # target_score = 1 ################# hack for debug #################
-            success = target_score > opts['success_thr']
-            # Expand search area at failure
-            if success:
-                sample_generator.set_trans_f(opts['trans_f'])
-                try_again = False
-            else:
-                sample_generator.set_trans_f(opts['trans_f_expand'])
+            # re-scale refined BB back to frame proportions
+            samples_refined = samples_refined_std
+            samples_refined[:,0] = samples_refined_std[:,0] * image.size[0] / img_size_std
+            samples_refined[:,2] = samples_refined_std[:,2] * image.size[0] / img_size_std
+            samples_refined[:,1] = samples_refined_std[:,1] * image.size[1] / img_size_std
+            samples_refined[:,3] = samples_refined_std[:,3] * image.size[1] / img_size_std
+
+            expanded_samples = np.concatenate((samples, samples_refined))
+            expanded_samples_score = frame_features(expanded_samples, out_layer='fc6')
+            top_expanded_scores, top_expanded_idx = expanded_samples_score[:, 1].topk(5)
+
+            top_expanded_idx = top_expanded_idx.cpu().numpy()
+            target_expanded_score = top_expanded_scores.mean()
+            target_expanded_bbox = expanded_samples[top_expanded_idx].mean(axis=0)
+        #########################################
 
 
         ###########################################
@@ -561,8 +506,8 @@ def run_mdnet(img_list, init_bbox, gt=None, savefig_dir='', display=False, loss_
                 IoU = overlap_ratio(target_bbox, gt[i])[0]
                 if (IoU == 0) and init_after_loss:
                     print('    * lost track in frame %d since init*' % (i))
-                    result_distances = scipy.spatial.distance.cdist(result_centers[:i], gt_centers[:i], metric='euclidean').diagonal()
-                    result_regnet_distances = scipy.spatial.distance.cdist(result_regnet_centers[:i], gt_centers[:i], metric='euclidean').diagonal()
+                    result_distances = np.linalg.norm(result_centers[:i] - gt_centers[:i], axis=1)
+                    result_regnet_distances = np.linalg.norm(result_regnet_centers[:i] - gt_centers[:i], axis=1)
                     num_images_tracked = i - 1  # we don't count frame 0 and current frame (lost track)
 
                     # display failed frame
@@ -589,6 +534,9 @@ def run_mdnet(img_list, init_bbox, gt=None, savefig_dir='', display=False, loss_
                         plt.pause(2)  # pause longer to observe failure
                         plt.draw()
 
+                    tracker.close()
+                    if own_frames:
+                        frames.close()
                     return result[:i], result_bb[:i], num_images_tracked, spf_total, result_distances, result_ious[:i], result_regnet_distances, result_regnet_ious[:i], True
         ########################################
 
@@ -608,8 +556,8 @@ def run_mdnet(img_list, init_bbox, gt=None, savefig_dir='', display=False, loss_
                     y_max = np.max(result_regnet_bb[i - 1, [1, 3, 5, 7]], axis=1)
                     bb_to_refine = np.concatenate((x_min, y_min, x_max - x_min, y_max - y_min), axis=1)
 
-            res_regnet_feats_BB = forward_samples(model, image, bb_to_refine)
-            feats_full_frame = forward_samples(model, image, np.array([[0, 0, image.size[0], image.size[1]]]))
+            res_regnet_feats_BB = frame_features(bb_to_refine)
+            feats_full_frame = frame_features(np.array([[0, 0, image.size[0], image.size[1]]]))
 
             # result_regnet_bb_std = np.array(result_regnet_bb[i - 1])
             result_regnet_bb_std = bb_to_refine
@@ -621,19 +569,15 @@ def run_mdnet(img_list, init_bbox, gt=None, savefig_dir='', display=False, loss_
 
             # result_regnet_bb_std_as_tensor = torch.Tensor(np.array([result_regnet_bb_std]))
             result_regnet_bb_std_as_tensor = torch.Tensor(result_regnet_bb_std)
-            if opts['use_gpu']:
+            if options.use_gpu():
                 result_regnet_bb_std_as_tensor = result_regnet_bb_std_as_tensor.cuda()
 
-            bb_fc_input = torch.cat((res_regnet_feats_BB, feats_full_frame.expand(res_regnet_feats_BB.shape), result_regnet_bb_std_as_tensor), dim=1)
-
-            if opts['use_gpu']:
-                bb_fc_input = bb_fc_input.to(device=device)
-
-            # perform refinement
+            # perform refinement (the frame features go through fc1 once, not once per sample)
             with torch.no_grad():
-                result_regnet_bb_refined_std = bb_fc_model(bb_fc_input)
+                result_regnet_bb_refined_std = bb_fc_model.forward_split(res_regnet_feats_BB, feats_full_frame,
+                                                                         result_regnet_bb_std_as_tensor)
             if translate_mode:
-                input_bb = bb_fc_input[:, -4:]
+                input_bb = result_regnet_bb_std_as_tensor
                 if quadrilateral:
                     input_bb_quad = input_bb.repeat(1, 2)
                     input_bb_quad[:, 0] = input_bb[:, 0]
@@ -662,7 +606,7 @@ def run_mdnet(img_list, init_bbox, gt=None, savefig_dir='', display=False, loss_
             result_regnet_bb_refined[1] = result_regnet_bb_refined_std[1] * image.size[1] / img_size_std
             result_regnet_bb_refined[3] = result_regnet_bb_refined_std[3] * image.size[1] / img_size_std
 
-            if opts['use_gpu']:
+            if options.use_gpu():
                 bbregnet_bbox = np.array(result_regnet_bb_refined.cpu())
             else:
                 bbregnet_bbox = np.array(result_regnet_bb_refined)
@@ -671,27 +615,10 @@ def run_mdnet(img_list, init_bbox, gt=None, savefig_dir='', display=False, loss_
             bbregnet_bbox = target_expanded_bbox
         ###################################################
 
-        # Bbox regression
-        if success:
-            if perform_refinement and use_lin_reg:
-                bbreg_samples = samples[top_idx]
-                bbreg_feats = forward_samples(model, image, bbreg_samples)
-                bbreg_samples = bbreg.predict(bbreg_feats, bbreg_samples)
-                bbreg_bbox = bbreg_samples.mean(axis=0)
-            else:
-                bbreg_bbox = target_bbox
-
-        # Copy previous result at failure
-        if not success:
-            target_bbox = result[i - 1]
-            if perform_refinement and use_lin_reg:
-                bbreg_bbox = result_bb[i - 1]
-            else:
-                bbreg_bbox = target_bbox
-
         # Save result
-        result[i] = target_bbox
-        result_bb[i] = bbreg_bbox  # bbreg_box already determined dependent on 'perform_refinement'
+        # (at failure the tracker keeps its previous results)
+        result[i] = tracker.target_bbox
+        result_bb[i] = tracker.bbreg_bbox  # bbreg_box already determined dependent on 'perform_refinement'
         ###########################################
         if use_regnet:
             result_regnet_bb[i] = bbregnet_bbox
@@ -715,90 +642,21 @@ def run_mdnet(img_list, init_bbox, gt=None, savefig_dir='', display=False, loss_
         if gt_origin is not None:
             if i < gt_origin.shape[0]:
                 if quadrilateral and use_regnet and perform_refinement and not use_regnet_add_samples_else_self_track:
+                    from shapely.geometry import Polygon
                     result_regnet_bb_pol = Polygon(result_regnet_bb[i].reshape(-1, 2)).convex_hull
                     gt_origin_pol = Polygon(gt_origin[i].reshape(-1, 2)).convex_hull
                     result_regnet_ious[i] = result_regnet_bb_pol.intersection(gt_origin_pol).area / result_regnet_bb_pol.union(gt_origin_pol).area
                     result_regnet_centers[i] = np.array(result_regnet_bb_pol.centroid)
         #################
 
-        # Data collect
-        if success:
-            # Draw pos/neg samples
-            pos_examples = gen_samples(pos_generator, target_bbox,
-                                       opts['n_pos_update'],
-                                       opts['overlap_pos_update'])
-            neg_examples = gen_samples(neg_generator, target_bbox,
-                                       opts['n_neg_update'],
-                                       opts['overlap_neg_update'])
-
-            # Extract pos/neg features
-            pos_feats = forward_samples(model, image, pos_examples)
-            neg_feats = forward_samples(model, image, neg_examples)
-            pos_feats_all.append(pos_feats)
-            neg_feats_all.append(neg_feats)
-            if len(pos_feats_all) > opts['n_frames_long']:
-                del pos_feats_all[0]
-            if len(neg_feats_all) > opts['n_frames_short']:
-                del neg_feats_all[0]
-
-            ######################
-            # Extract pos/neg IoUs
-            if loss_index == 2:
-                # we could also try to use bbreg_bbox instead of target_bbox  ????????????????????????????????????????
-                pos_ious = overlap_ratio(pos_examples, target_bbox)
-                neg_ious = overlap_ratio(neg_examples, target_bbox)
-                pos_ious_all.append(pos_ious)
-                neg_ious_all.append(neg_ious)
-                if len(pos_ious_all) > opts['n_frames_long']:
-                    del pos_ious_all[0]
-                if len(neg_ious_all) > opts['n_frames_short']:
-                    del neg_ious_all[0]
-            ######################
-
-        # Short term update
-        if not success:
-            nframes = min(opts['n_frames_short'], len(pos_feats_all))
-            pos_data = torch.stack(pos_feats_all[-nframes:], 0).view(-1, feat_dim)
-            neg_data = torch.stack(neg_feats_all, 0).view(-1, feat_dim)
-            ######################
-            if loss_index == 2:
-                pos_iou_data = np.concatenate(pos_ious_all[-nframes:])
-                neg_iou_data = np.concatenate(neg_ious_all)
-            ######################
-            if detailed_printing:
-                print('      short term update')
-            num_short_updates += 1
-            if loss_index == 2:
-                train(model, criterion, update_optimizer, pos_data, neg_data, opts['maxiter_update'], \
-                      pos_ious=pos_iou_data, neg_ious=neg_iou_data, loss_index=loss_index)
-            else:
-                train(model, criterion, update_optimizer, pos_data, neg_data, opts['maxiter_update'], \
-                      loss_index=loss_index)
-
-        # Long term update
-        elif i % opts['long_interval'] == 0:
-            pos_data = torch.stack(pos_feats_all, 0).view(-1, feat_dim)
-            neg_data = torch.stack(neg_feats_all, 0).view(-1, feat_dim)
-
-            ######################
-            if loss_index == 2:
-                pos_iou_data = np.concatenate(pos_ious_all)
-                neg_iou_data = np.concatenate(neg_ious_all)
-            ######################
-
-            if detailed_printing:
-                print('      long term update')
-            if loss_index == 2:
-                train(model, criterion, update_optimizer, pos_data, neg_data, opts['maxiter_update'], \
-                      pos_ious=pos_iou_data, neg_ious=neg_iou_data, loss_index=loss_index)
-            else:
-                train(model, criterion, update_optimizer, pos_data, neg_data, opts['maxiter_update'], \
-                      loss_index=loss_index)
-
+        # Collect samples and update the FC layers (short/long term)
+        tracker.learn()
         spf = time.time() - tic
         spf_total += spf
+        stage_timer.add('frame', spf)
 
         # Display
+        display_tic = time.time()
         if display or savefig:
             im.set_data(image)
 
@@ -865,33 +723,47 @@ def run_mdnet(img_list, init_bbox, gt=None, savefig_dir='', display=False, loss_
                 # plt.draw()
             if savefig:
                 fig.savefig(os.path.join(savefig_dir, '%04d.jpg' % (i)), dpi=dpi)
+            stage_timer.add('display', time.time() - display_tic)
 
         if detailed_printing:
+            # staleness - frames between the feature banks snapshot and the swap of the update trained on it
+            update_str = ', Staleness %d' % staleness if staleness is not None else ''
             if gt is None:
-                print("      Frame %d/%d, Score %.3f, Time %.3f" % \
-                      (i, num_images-1, target_score, spf))
+                print("      Frame %d/%d, Score %.3f, Time %.3f%s" % \
+                      (i, num_images-1, target_score, spf, update_str))
             else:
                 if i<gt.shape[0]:
-                    print("      Frame %d/%d, Overlap %.3f, Score %.3f, Time %.3f" % \
-                        (i, num_images-1, overlap_ratio(gt[i], result_bb[i])[0], target_score, spf))
+                    print("      Frame %d/%d, Overlap %.3f, Score %.3f, Time %.3f%s" % \
+                        (i, num_images-1, overlap_ratio(gt[i], result_bb[i])[0], target_score, spf, update_str))
                 else:
-                    print("      Frame %d/%d, Overlap %.3f, Score %.3f, Time %.3f" % \
-                        (i, num_images-1, overlap_ratio(np.array([np.nan,np.nan,np.nan,np.nan]), result_bb[i])[0], target_score, spf))
+                    print("      Frame %d/%d, Overlap %.3f, Score %.3f, Time %.3f%s" % \
+                        (i, num_images-1, overlap_ratio(np.array([np.nan,np.nan,np.nan,np.nan]), result_bb[i])[0], target_score, spf, update_str))
 
     # plt.close()
 
-    # result_distances = np.linalg.norm(result_centers - gt_centers, ord=2)
-    result_distances = scipy.spatial.distance.cdist(result_centers, gt_centers, metric='euclidean').diagonal()
-    result_regnet_distances = scipy.spatial.distance.cdist(result_regnet_centers, gt_centers, metric='euclidean').diagonal()
+    # per frame center distances (the diagonal of cdist, without computing all the frame pairs)
+    result_distances = np.linalg.norm(result_centers - gt_centers, axis=1)
+    result_regnet_distances = np.linalg.norm(result_regnet_centers - gt_centers, axis=1)
     # fps = num_images / spf_total
     num_images_tracked = num_images-1  # I don't want to count initialization frame (i.e. frame 0)
-    print('    main loop finished, %d frames, %d short updates, accuracy %f' % (num_images, num_short_updates, np.mean(result_ious)))
+    print('    main loop finished, %d frames, %d short updates, accuracy %f' % (num_images, tracker.num_short_updates, np.mean(result_ious)))
+    if opts['feature_cache']:
+        print('    feature cache: %d hits, %d misses' % (tracker.feature_cache.hits, tracker.feature_cache.misses))
+    decode_time, wait_time, queue_depth = frames.source.stats(frames_since)
+    print('    frames: decode %.1f ms, wait %.1f ms, queue depth %.1f (per frame)' % (decode_time * 1000, wait_time * 1000, queue_depth))
+    if own_frames:
+        frames.close()
+    updater = tracker.updater
+    if updater is not None:
+        tracker.close()
+        if len(updater.staleness) > 0:
+            print('    async updates: %d swapped, %d coalesced, staleness mean %.1f max %d frames' %
+                  (len(updater.staleness), updater.coalesced, np.mean(updater.staleness), max(updater.staleness)))
 
     return result, result_bb, num_images_tracked, spf_total, result_distances, result_ious, result_regnet_distances, result_regnet_ious, False
 
 
-if __name__ == "__main__":
-
+def tracker_arg_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument('-s', '--seq', nargs='+', default='seq_list', help='input seq')
     parser.add_argument('-j', '--json', default='', help='input json')
@@ -910,13 +782,17 @@ if __name__ == "__main__":
     parser.add_argument('-p', '--plt_bnch', action='store_true')  # plot benchmark graphs from saved results
     parser.add_argument('-tr', '--perform_tracking', action='store_true')  # plot benchmark graphs from saved results
     parser.add_argument('-rsf', '--result_sub_folder', default='')
+    parser.add_argument('-ct', '--chrome_trace', action='store_true')  # save the stage timings of each run for chrome://tracing
 
     ################
+    return parser
 
-    args = parser.parse_args()
-    assert (args.seq != '' or args.json != '')
 
-    ################
+def apply_args(args):
+    # sets the module settings given on the command line (after the speed-ups of the device), returns the
+    # init-after-loss modes to run
+    global fewer_images, sequence_len_limit
+    set_speed_ups()
     if args.lmt_seq:
         fewer_images = True
         args.seq_len_lmt = int(float(args.seq_len_lmt))
@@ -931,7 +807,10 @@ if __name__ == "__main__":
         init_after_loss_selection = [True]
     else:
         init_after_loss_selection = [False]
+    return init_after_loss_selection
+
 
+def select_sequences(args):
     if args.attributes == 'selection':
         select_attributes_strings = OTB_select_attributes_strings
     elif args.attributes == 'all':
@@ -947,11 +826,11 @@ if __name__ == "__main__":
         sequence_wish_list.extend(OTB_attributes_dict[att])
     sequence_wish_list = list(set(sequence_wish_list))
     sequence_wish_list.sort()
-    my_sequence_list = list(set(my_sequence_list).intersection(set(sequence_wish_list)))
-    my_sequence_list.sort()
+    seq_list = list(set(my_sequence_list).intersection(set(sequence_wish_list)))
+    seq_list.sort()
 
     if args.seq == 'seq_list':
-        sequence_list = my_sequence_list
+        sequence_list = seq_list
     elif args.seq == ['all']:
         if seqlist_else_walk:
             with open(seqlist_path, 'r') as fp:
@@ -974,6 +853,174 @@ if __name__ == "__main__":
         ############################ hack ####################################################
     else:
         sequence_list = args.seq  # e.g. -s DragonBaby
+    return sequence_list
+
+
+def track_sequence(args, model_index, loss_index, sequence, init_mode, tracker=None):
+    # tracks a sequence avg_iters_per_sequence times (init_mode - init_after_loss of the run)
+    # and saves its result json. tracker - a Tracker to reuse, otherwise one is created
+    global gt_origin, init_after_loss
+    init_after_loss = init_mode
+
+    # ------
+    # img_list - list of (relative path) file names of the jpg images
+    #   example: '../dataset/OTB/DragonBaby/img/img####.jpg'
+    # gt - a (2-dim, N x 4) list of 4 coordinates of ground truth BB for each image
+    # init_bbox - this is gt[0]
+
+    # Generate sequence config
+    # img_list, init_bbox, gt, savefig_dir, display, result_path = gen_config(args)
+
+    # Generate sequence of princeton dataset config
+    args.seq = sequence
+    img_list, init_bbox, gt, savefig_dir, display, result_path, gt_origin = prin_gen_config(args, sub_folder=args.result_sub_folder, benchmark_dataset=benchmark_dataset,quadrilateral=quadrilateral)
+    # ------
+
+    # decoded once per run, the init-after-loss runs continue from the same frame source
+    frames = FrameSource(img_list, opts['prefetch_frames'], opts['decode_workers'])
+    # stage timings of all the iterations of the run
+    stage_timer.reset()
+
+    tracking_start = time.time()
+    print('')
+    print('tracking: | model ' + models_strings[model_index] + ' | loss ' + losses_strings[loss_index] + ' | sequence ' + sequence + ' | init-after-loss ' + str(init_after_loss))
+    if tracker is None:
+        tracker = Tracker(models_paths[model_index], loss_index=loss_index,
+                          use_bbreg=perform_refinement and use_lin_reg)
+
+    # each run is random, so we need to average before comparing
+    # each iteration starts from the finish of the offline training
+    # there is no dependency between iterations
+    # staleness of the async updates per iteration, per frame as the ious (None - no update swapped in)
+    staleness_iters = []
+    for avg_iter in np.arange(0, avg_iters_per_sequence):
+
+        print('  iteration %d / %d started' % (avg_iter+1, avg_iters_per_sequence))
+        iteration_start = time.time()
+        staleness_iters.append([])
+
+        if init_after_loss:  # loss means loss of tracking
+            init_frame_index = 0
+            while init_frame_index < len(img_list) - 1:  # we want at least one frame for tracking after init
+                result, result_bb, num_images_tracked, spf_total, result_distances, result_ious, result_regnet_distances, result_regnet_ious, lost_track = run_mdnet(frames[init_frame_index:], gt[init_frame_index], gt=gt[init_frame_index:], savefig_dir=savefig_dir, display=display, loss_index=loss_index, model_path=models_paths[model_index], seq_name=sequence, tracker=tracker)
+                staleness_iters[-1] += ([None] + tracker.frame_staleness)[:len(result_ious)]
+                if init_frame_index == 0:
+                    result_ious_tot = result_ious
+                    result_regnet_ious_tot = result_regnet_ious
+                    num_images_tracked_tot = num_images_tracked
+                    spf_total_tot = spf_total
+
+                    # init_frame_index does not include init frame nor frame where tracking was lost
+                    if lost_track:
+                        lost_track_tot = 1
+                        init_frame_index = num_images_tracked + 1 + 5
+                    else:
+                        lost_track_tot = 0
+                        init_frame_index = len(img_list)
+                else:
+                    result_ious_tot = np.concatenate((result_ious_tot, result_ious))
+                    result_regnet_ious_tot = np.concatenate((result_regnet_ious_tot, result_regnet_ious))
+                    num_images_tracked_tot += num_images_tracked
+                    spf_total_tot += spf_total
+
+                    if lost_track:
+                        lost_track_tot += 1
+                        init_frame_index += num_images_tracked + 1 + 5
+                    else:
+                        init_frame_index = len(img_list)
+            accuracy = np.mean(result_ious_tot)
+            regnet_accuracy = np.mean(result_regnet_ious_tot)
+            fps = num_images_tracked_tot / spf_total_tot
+        else:  # i.e. not init_after_loss:
+            lost_track_tot = 0
+            result, result_bb, num_images_tracked, spf_total, result_distances, result_ious, result_regnet_distances, result_regnet_ious, lost_track = run_mdnet(
+                frames, gt[0], gt=gt,
+                savefig_dir=savefig_dir, display=display, loss_index=loss_index,
+                model_path=models_paths[model_index], seq_name=sequence, tracker=tracker)
+            staleness_iters[-1] += ([None] + tracker.frame_staleness)[:len(result_ious)]
+            accuracy = np.mean(result_ious)
+            regnet_accuracy = np.mean(result_regnet_ious)
+            fps = num_images_tracked / spf_total
+
+            # compute step of running average of results over current sequence
+            # since we don't init after loss, it's always the same size of result arrays, so we can average
+            if avg_iter == 0:
+                result_distances_avg = result_distances
+                result_regnet_distances_avg = result_regnet_distances
+                result_ious_avg = result_ious
+                result_regnet_ious_avg = result_regnet_ious
+                result_bb_avg = result_bb
+            else:
+                result_distances_avg = (result_distances_avg*avg_iter + result_distances) / (avg_iter+1)
+                result_regnet_distances_avg = (result_regnet_distances_avg * avg_iter + result_regnet_distances) / (avg_iter + 1)
+                result_ious_avg = (result_ious_avg * avg_iter + result_ious) / (avg_iter + 1)
+                result_regnet_ious_avg = (result_regnet_ious_avg * avg_iter + result_regnet_ious) / (avg_iter + 1)
+                result_bb_avg = (result_bb_avg * avg_iter + result_bb) / (avg_iter + 1)
+
+        if avg_iter == 0:
+            failures_per_seq_avg = lost_track_tot
+            accuracy_avg = accuracy
+            regnet_accuracy_avg = regnet_accuracy
+        else:
+            failures_per_seq_avg = (failures_per_seq_avg * avg_iter + lost_track_tot) / (avg_iter + 1)
+            accuracy_avg = (accuracy_avg * avg_iter + accuracy) / (avg_iter + 1)
+            regnet_accuracy_avg = (regnet_accuracy_avg * avg_iter + regnet_accuracy) / (avg_iter + 1)
+
+        iteration_time = time.time() - iteration_start
+        print('  iteration time elapsed: %.3f' % (iteration_time))
+
+    frames.close()
+
+    # per frame latency percentiles (sec) and per stage times (ms per frame) of all iterations
+    stages = stage_timer.summary()
+    if detailed_printing:
+        print('  stages per frame (ms): ' + ', '.join('%s %.1f' % (name, stage['mean']) for name, stage in stages.items()))
+        stage_timer.print_histograms()
+    result_name = 'model-' + models_strings[model_index] + '_loss-' + losses_strings[loss_index] + '_init-' + str(init_after_loss)
+    if args.chrome_trace:
+        stage_timer.save_chrome_trace(os.path.join(result_path, 'trace_' + result_name + '.json'))
+
+    # Save result
+    if not args.dont_save:
+        res = {}
+        res['type'] = 'rect'
+        res['fps'] = fps
+        for q in [50, 95, 99]:
+            res['spf_p%d' % q] = stages['frame']['p%d' % q] / 1000 if 'frame' in stages else None
+        res['stages'] = stages
+        if not init_after_loss:
+            res['res'] = result_bb_avg.round().tolist()
+            res['ious'] = result_ious_avg.tolist()
+            res['regnet_ious'] = result_regnet_ious_avg.tolist()
+            res['distances'] = result_distances_avg.tolist()
+            res['regnet_distances'] = result_regnet_distances_avg.tolist()
+        # else:
+        res['fails_per_seq'] = failures_per_seq_avg
+        res['accuracy'] = accuracy_avg
+        res['regnet_accuracy'] = regnet_accuracy_avg
+        if opts['async_update']:
+            swaps = [value for staleness in staleness_iters for value in staleness if value is not None]
+            res['staleness'] = staleness_iters
+            res['staleness_mean'] = float(np.mean(swaps)) if len(swaps) > 0 else None
+        result_fullpath = os.path.join(result_path, 'result_' + result_name + '.json')
+        json.dump(res, open(result_fullpath, 'w'), indent=2)
+
+    tracking_time = time.time() - tracking_start
+    # print('tracking: | model ' + models_strings[model_index] + ' | loss ' + losses_strings[loss_index] + ' | sequence ' + sequence + ' | elapsed %.3f' % (tracking_time))
+    print('tracking: elapsed %.3f' % (tracking_time))
+
+
+if __name__ == "__main__":
+
+    parser = tracker_arg_parser()
+
+    args = parser.parse_args()
+    assert (args.seq != '' or args.json != '')
+
+    ################
+    init_after_loss_selection = apply_args(args)
+
+    sequence_list = select_sequences(args)
 
     perform_tracking = args.perform_tracking
     display_benchmark_results = args.plt_bnch
@@ -987,127 +1034,17 @@ if __name__ == "__main__":
         # for loss_index in loss_indices_for_tracking:  # we comapare several loss functions
         tracking_started = time.time()
 
+        # one tracker per (model, loss), its model is loaded once and re-initialized for every run
+        trackers = {}
+
         # model_index - iterate over different weights learnt
         # loss_index - iterate over different loss functions for online training
         # sequnce - iterate over different sequences
         for model_index, loss_index, sequence, init_after_loss in itertools.product(models_indices_for_tracking, loss_indices_for_tracking, sequence_list, init_after_loss_selection ):
-
-            # ------
-            # img_list - list of (relative path) file names of the jpg images
-            #   example: '../dataset/OTB/DragonBaby/img/img####.jpg'
-            # gt - a (2-dim, N x 4) list of 4 coordinates of ground truth BB for each image
-            # init_bbox - this is gt[0]
-
-            # Generate sequence config
-            # img_list, init_bbox, gt, savefig_dir, display, result_path = gen_config(args)
-
-            # Generate sequence of princeton dataset config
-            args.seq = sequence
-            img_list, init_bbox, gt, savefig_dir, display, result_path, gt_origin = prin_gen_config(args, sub_folder=result_sub_folder, benchmark_dataset=benchmark_dataset,quadrilateral=quadrilateral)
-            # ------
-
-            tracking_start = time.time()
-            print('')
-            print('tracking: | model ' + models_strings[model_index] + ' | loss ' + losses_strings[loss_index] + ' | sequence ' + sequence + ' | init-after-loss ' + str(init_after_loss))
-
-            # each run is random, so we need to average before comparing
-            # each iteration starts from the finish of the offline training
-            # there is no dependency between iterations
-            for avg_iter in np.arange(0, avg_iters_per_sequence):
-
-                print('  iteration %d / %d started' % (avg_iter+1, avg_iters_per_sequence))
-                iteration_start = time.time()
-
-                if init_after_loss:  # loss means loss of tracking
-                    init_frame_index = 0
-                    while init_frame_index < len(img_list) - 1:  # we want at least one frame for tracking after init
-                        result, result_bb, num_images_tracked, spf_total, result_distances, result_ious, result_regnet_distances, result_regnet_ious, lost_track = run_mdnet(img_list[init_frame_index:], gt[init_frame_index], gt=gt[init_frame_index:], savefig_dir=savefig_dir, display=display, loss_index=loss_index, model_path=models_paths[model_index], seq_name=sequence)
-                        if init_frame_index == 0:
-                            result_ious_tot = result_ious
-                            result_regnet_ious_tot = result_regnet_ious
-                            num_images_tracked_tot = num_images_tracked
-                            spf_total_tot = spf_total
-
-                            # init_frame_index does not include init frame nor frame where tracking was lost
-                            if lost_track:
-                                lost_track_tot = 1
-                                init_frame_index = num_images_tracked + 1 + 5
-                            else:
-                                lost_track_tot = 0
-                                init_frame_index = len(img_list)
-                        else:
-                            result_ious_tot = np.concatenate((result_ious_tot, result_ious))
-                            result_regnet_ious_tot = np.concatenate((result_regnet_ious_tot, result_regnet_ious))
-                            num_images_tracked_tot += num_images_tracked
-                            spf_total_tot += spf_total
-
-                            if lost_track:
-                                lost_track_tot += 1
-                                init_frame_index += num_images_tracked + 1 + 5
-                            else:
-                                init_frame_index = len(img_list)
-                    accuracy = np.mean(result_ious_tot)
-                    regnet_accuracy = np.mean(result_regnet_ious_tot)
-                    fps = num_images_tracked_tot / spf_total_tot
-                else:  # i.e. not init_after_loss:
-                    lost_track_tot = 0
-                    result, result_bb, num_images_tracked, spf_total, result_distances, result_ious, result_regnet_distances, result_regnet_ious, lost_track = run_mdnet(
-                        img_list, gt[0], gt=gt,
-                        savefig_dir=savefig_dir, display=display, loss_index=loss_index,
-                        model_path=models_paths[model_index], seq_name=sequence)
-                    accuracy = np.mean(result_ious)
-                    regnet_accuracy = np.mean(result_regnet_ious)
-                    fps = num_images_tracked / spf_total
-
-                    # compute step of running average of results over current sequence
-                    # since we don't init after loss, it's always the same size of result arrays, so we can average
-                    if avg_iter == 0:
-                        result_distances_avg = result_distances
-                        result_regnet_distances_avg = result_regnet_distances
-                        result_ious_avg = result_ious
-                        result_regnet_ious_avg = result_regnet_ious
-                        result_bb_avg = result_bb
-                    else:
-                        result_distances_avg = (result_distances_avg*avg_iter + result_distances) / (avg_iter+1)
-                        result_regnet_distances_avg = (result_regnet_distances_avg * avg_iter + result_regnet_distances) / (avg_iter + 1)
-                        result_ious_avg = (result_ious_avg * avg_iter + result_ious) / (avg_iter + 1)
-                        result_regnet_ious_avg = (result_regnet_ious_avg * avg_iter + result_regnet_ious) / (avg_iter + 1)
-                        result_bb_avg = (result_bb_avg * avg_iter + result_bb) / (avg_iter + 1)
-
-                if avg_iter == 0:
-                    failures_per_seq_avg = lost_track_tot
-                    accuracy_avg = accuracy
-                    regnet_accuracy_avg = regnet_accuracy
-                else:
-                    failures_per_seq_avg = (failures_per_seq_avg * avg_iter + lost_track_tot) / (avg_iter + 1)
-                    accuracy_avg = (accuracy_avg * avg_iter + accuracy) / (avg_iter + 1)
-                    regnet_accuracy_avg = (regnet_accuracy_avg * avg_iter + regnet_accuracy) / (avg_iter + 1)
-
-                iteration_time = time.time() - iteration_start
-                print('  iteration time elapsed: %.3f' % (iteration_time))
-
-
-            # Save result
-            if not args.dont_save:
-                res = {}
-                res['type'] = 'rect'
-                res['fps'] = fps
-                if not init_after_loss:
-                    res['res'] = result_bb_avg.round().tolist()
-                    res['ious'] = result_ious_avg.tolist()
-                    res['regnet_ious'] = result_regnet_ious_avg.tolist()
-                    res['distances'] = result_distances_avg.tolist()
-                    res['regnet_distances'] = result_regnet_distances_avg.tolist()
-                # else:
-                res['fails_per_seq'] = failures_per_seq_avg
-                res['accuracy'] = accuracy_avg
-                res['regnet_accuracy'] = regnet_accuracy_avg
-                result_fullpath = os.path.join(result_path, 'result_model-' + models_strings[model_index] + '_loss-' + losses_strings[loss_index] + '_init-' + str(init_after_loss) + '.json')
-                json.dump(res, open(result_fullpath, 'w'), indent=2)
-
-            tracking_time = time.time() - tracking_start
-            # print('tracking: | model ' + models_strings[model_index] + ' | loss ' + losses_strings[loss_index] + ' | sequence ' + sequence + ' | elapsed %.3f' % (tracking_time))
-            print('tracking: elapsed %.3f' % (tracking_time))
+            if (model_index, loss_index) not in trackers:
+                trackers[(model_index, loss_index)] = Tracker(models_paths[model_index], loss_index=loss_index,
+                                                              use_bbreg=perform_refinement and use_lin_reg)
+            track_sequence(args, model_index, loss_index, sequence, init_after_loss, trackers[(model_index, loss_index)])
 
         tracking_time = time.time() - tracking_started
         print('finished %d losses x %d models x %d sequences - elapsed %d' % (len(loss_indices_for_tracking), len(models_indices_for_tracking), len(sequence_list), tracking_time))
@@ -1118,6 +1055,8 @@ if __name__ == "__main__":
         if args.init_after_loss == 'both':
             raise Exception("init=Both not fully implemented yet (will override graphs). please select either True or False")
 
+        import matplotlib.pyplot as plt
+        from cycler import cycler
         IPython_default = plt.rcParams.copy()
 
         if use_lin_reg and perform_refinement:
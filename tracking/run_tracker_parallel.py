@@ -0,0 +1,133 @@
+import os
+import sys
+import copy
+import time
+import zlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+import torch
+import torch.multiprocessing as mp
+
+# needed for following usage:
+#  cd tracking
+#  python run_tracker_parallel.py [run_tracker.py arguments] [-w 16] [-nt 4] [-v]
+# runs the tracking grid of run_tracker.py (models x losses x sequences x init modes) on a process pool
+# and writes the same result json files. plot them with: python run_tracker.py -p ...
+sys.path.insert(0, '../modules')
+
+import run_tracker as rt
+
+# per worker process
+worker_states = None
+worker_trackers = {}
+
+
+def sequence_length(args, sequence):
+    # number of frames a run on the sequence tracks, to schedule the longest sequences first
+    args = copy.copy(args)
+    args.seq = sequence
+    img_list = rt.prin_gen_config(args, sub_folder=args.result_sub_folder, ro=True,
+                                  benchmark_dataset=rt.benchmark_dataset, quadrilateral=rt.quadrilateral)[0]
+    if rt.fewer_images:
+        return min(rt.sequence_len_limit, len(img_list))
+    return len(img_list)
+
+
+def init_worker(settings, shared_states, num_threads):
+    global worker_states
+    torch.set_num_threads(num_threads)
+    for k, v in settings.items():
+        setattr(rt, k, v)
+    worker_states = shared_states
+
+
+def schedule(jobs, lengths):
+    # indices of the jobs, longest sequence first, so the pool does not end up waiting for one long sequence
+    # (stable, jobs of the same length keep their order)
+    return sorted(range(len(jobs)), key=lambda j: -lengths[jobs[j][3]])
+
+
+def run_jobs(pool, fn, jobs, lengths, report=None):
+    # runs fn(job) of every job on pool, submitted longest first, and returns the results in the order of jobs
+    # report(n, result) - called as the jobs complete
+    futures = {pool.submit(fn, jobs[j]): j for j in schedule(jobs, lengths)}
+    results = [None] * len(jobs)
+    for n, future in enumerate(as_completed(futures)):
+        results[futures[future]] = future.result()
+        if report is not None:
+            report(n, results[futures[future]])
+    return results
+
+
+def seed_job(job):
+    # seeds the rngs from what the job runs, so its result does not depend on the worker, on the jobs it
+    # ran before or on the other jobs of the grid. returns the seed
+    args, model_index, loss_index, sequence, init_after_loss = job
+    seed = zlib.crc32(('%s|%s|%s|%s' % (model_index, loss_index, sequence, init_after_loss)).encode())
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    return seed
+
+
+def run_job(job):
+    args, model_index, loss_index, sequence, init_after_loss = job
+    key = (model_index, loss_index)
+    if key not in worker_trackers:
+        # conv weights stay in the shared memory of the parent (or in the page cache of a mapped .flat model),
+        # the fc weights are copied
+        worker_trackers[key] = rt.Tracker(rt.models_paths[model_index], loss_index=loss_index,
+                                          use_bbreg=rt.perform_refinement and rt.use_lin_reg,
+                                          shared_layers=worker_states[model_index])
+    seed_job(job)
+    tic = time.time()
+    rt.track_sequence(args, model_index, loss_index, sequence, init_after_loss, worker_trackers[key])
+    return sequence, model_index, loss_index, init_after_loss, time.time() - tic
+
+
+if __name__ == "__main__":
+
+    parser = rt.tracker_arg_parser()
+    parser.add_argument('-w', '--workers', default=os.cpu_count(), type=int, help='worker processes')
+    parser.add_argument('-nt', '--num_threads', default=0, type=int, help='torch threads per worker (0 - cores / workers)')
+    parser.add_argument('-v', '--verbose', action='store_true')  # per frame printing of every worker
+    args = parser.parse_args()
+    assert (args.seq != '' or args.json != '')
+    args.dont_display = True  # workers never display
+
+    init_after_loss_selection = rt.apply_args(args)
+    sequence_list = rt.select_sequences(args)
+    num_threads = args.num_threads if args.num_threads > 0 else max(1, os.cpu_count() // args.workers)
+
+    # offline weights of every model, loaded once and shared with all the workers
+    shared_states = {}
+    for model_index in rt.models_indices_for_tracking:
+        if rt.is_flat(rt.models_paths[model_index]):
+            shared_states[model_index] = None  # every worker maps the file, its pages are shared already
+            continue
+        shared_layers = torch.load(rt.models_paths[model_index])['shared_layers']
+        shared_states[model_index] = {k: v.share_memory_() for k, v in shared_layers.items()}
+
+    lengths = {sequence: sequence_length(args, sequence) for sequence in sequence_list}
+    jobs = [(args, model_index, loss_index, sequence, init_after_loss)
+            for model_index, loss_index, sequence, init_after_loss in itertools.product(
+                rt.models_indices_for_tracking, rt.loss_indices_for_tracking, sequence_list, init_after_loss_selection)]
+
+    settings = {'fewer_images': rt.fewer_images, 'sequence_len_limit': rt.sequence_len_limit,
+                'detailed_printing': rt.detailed_printing and args.verbose}
+
+    print('running %d jobs on %d workers x %d threads' % (len(jobs), args.workers, num_threads))
+    tracking_started = time.time()
+    # (a worker that dies, e.g. out of memory, fails the run instead of leaving it waiting)
+    with ProcessPoolExecutor(args.workers, mp_context=mp.get_context('spawn'), initializer=init_worker,
+                             initargs=(settings, shared_states, num_threads)) as pool:
+        def report(n, result):
+            sequence, model_index, loss_index, init_after_loss, elapsed = result
+            print('[%d/%d] model %s | loss %s | sequence %s | init-after-loss %s | elapsed %.3f' %
+                  (n + 1, len(jobs), rt.models_strings[model_index], rt.losses_strings[loss_index], sequence,
+                   init_after_loss, elapsed))
+        run_jobs(pool, run_job, jobs, lengths, report)
+
+    tracking_time = time.time() - tracking_started
+    print('finished %d losses x %d models x %d sequences - elapsed %d' % (len(rt.loss_indices_for_tracking), len(rt.models_indices_for_tracking), len(sequence_list), tracking_time))
@@ -0,0 +1,372 @@
+import sys
+import numpy as np
+
+import torch
+import torch.nn as nn
+
+sys.path.insert(0, '../modules')
+
+from sample_generator import *
+from model import *
+from bbreg import *
+from FocalLoss import *
+from tracking_utils import *
+from feature_bank import *
+from async_update import *
+
+import options  # (the device is probed on first use, by options.use_gpu() / options.get_device())
+opts = options.tracking_opts
+
+
+class Tracker():
+    # MDNet single target tracker
+    #
+    # the model is loaded once, and every init() starts over from the offline weights kept in memory,
+    # so a process can track many sequences (and re-initialize after a tracking loss) without
+    # reading the model from disk again
+    #
+    # usage:
+    #   tracker = Tracker(model_path)
+    #   tracker.init(first_image, init_bbox)
+    #   for image in images:
+    #       bbox = tracker.update(image)
+    #
+    # update() is track() (estimate the target, bbox regression) followed by learn() (collect
+    # samples, short/long term updates). calling them separately lets the caller use the frame
+    # (e.g. frame_features, samples, top_idx) in between, before the fc layers change
+    #
+    # shared_layers - optional state dict of model.layers (e.g. in shared memory, from another process)
+    #       used instead of model_path. the conv weights are used in place, the fc weights are copied
+    def __init__(self, model_path=opts['model_path'], loss_index=1, use_bbreg=True, verbose=False, shared_layers=None):
+        self.loss_index = loss_index
+        self.use_bbreg = use_bbreg
+        self.verbose = verbose
+
+        # Init model
+        if shared_layers is not None:
+            self.model = MDNet()
+            low_rank_like(self.model.layers, shared_layers)
+            self.model.build_param_dict()
+            for k, p in self.model.layers.state_dict(keep_vars=True).items():
+                if k.startswith('fc'):
+                    p.data.copy_(shared_layers[k])
+                else:
+                    p.data = shared_layers[k]
+        else:
+            self.model = MDNet(model_path)
+        if options.use_gpu():
+            self.model = self.model.to(options.get_device())
+        elif opts['quantized']:
+            # int8 inference, the fc layers are still trained in float
+            self.model.load_quantized(opts['quantized_model_path'])
+        self.model.set_learnable_params(opts['ft_layers'])
+
+        # offline fc4/fc5 weights, restored by reset() (fc6 is drawn again, as in a new MDNet)
+        self.offline_params = {k: p.detach().clone() for k, p in self.model.params.items()
+                               if k.startswith('fc') and not k.startswith('fc6')}
+
+        # Init criterion
+        self.criterion = FocalLoss(class_num=2, alpha=torch.ones(2, 1)*0.25, size_average=False)
+
+        # Per-frame feature cache
+        # scoring, bbox regression, RegNet and data collection often forward the same samples of a frame
+        self.feature_cache = FeatureCache(self.model)
+        self.updater = None
+        self.image = None
+        self.frame_id = None
+
+        self.warm_up()
+
+    def warm_up(self):
+        # first forwards pay for lazy allocations (and cudnn setup), and for compiling the
+        # inference forwards if enabled, not the first frame
+        if opts['compiled_inference']:
+            self.model.compile_inference(opts['compile_backend'], opts['img_size'])
+        regions = torch.zeros(1, 3, opts['img_size'], opts['img_size'])
+        if options.use_gpu():
+            regions = regions.to(options.get_device())
+        # (the TorchScript executor optimizes a graph on its second run)
+        for _ in range(2 if opts['compiled_inference'] else 1):
+            forward_regions(self.model, regions, out_layer='fc6')
+
+    def reset(self):
+        self.close()
+        with torch.no_grad():
+            for k, value in self.offline_params.items():
+                self.model.params[k].copy_(value)
+        for branch in self.model.branches:
+            for module in branch.modules():
+                if isinstance(module, nn.Linear):
+                    module.reset_parameters()
+        self.feature_cache.end_frame()
+        self.image = None
+        self.frame_id = None
+
+    def close(self):
+        # stops the background updates, if any
+        if self.updater is not None:
+            self.updater.close()
+            self.updater = None
+
+    def frame_features(self, samples, out_layer='conv3', roi=False):
+        # roi - forward_samples_roi instead of forward_samples
+        if opts['feature_cache']:
+            return self.feature_cache.get(samples, out_layer, roi)
+        if roi:
+            return forward_samples_roi(self.model, self.image, samples, out_layer=out_layer)
+        return forward_samples(self.model, self.image, samples, out_layer=out_layer)
+
+    def init(self, image, bbox, init_feats=None, n_init=None):
+        # image - PIL image of the first frame
+        # bbox - target bbox [x,y,w,h] in that frame
+        # init_feats - optional (pos_feats, neg_feats) of the first frame samples, instead of forwarding them
+        # n_init - optional (n_pos, n_neg) limits of the samples forwarded for the initial training
+        if self.frame_id is not None:  # not a fresh model
+            self.reset()
+        self.target_bbox = np.array(bbox)
+        self.bbreg_bbox = self.target_bbox
+        self.num_short_updates = 0
+        # staleness of the background update swapped in at each tracked frame (None - no swap)
+        self.frame_staleness = []
+        self.frame_id = 0
+        self.image = image
+
+        # Init Optimizers
+        init_optimizer = set_optimizer(self.model, opts['lr_init'])
+        self.update_optimizer = set_optimizer(self.model, opts['lr_update'])
+
+        # Train bbox regressor
+        if self.use_bbreg:
+            if self.verbose:
+                print('       training BB regressor...')
+            bbreg_examples = gen_samples(SampleGenerator('uniform', image.size, 0.3, 1.5, 1.1),
+                                         self.target_bbox, opts['n_bbreg'], opts['overlap_bbreg'], opts['scale_bbreg'])
+            bbreg_feats = forward_samples(self.model, image, bbreg_examples)
+            self.bbreg = BBRegressor(image.size)  # image_size is e.g. (640, 360)
+            self.bbreg.train(bbreg_feats, bbreg_examples, self.target_bbox)
+            if self.verbose:
+                print('       finished training BB regressor.')
+
+        # Draw pos/neg samples
+        pos_examples = gen_samples(SampleGenerator('gaussian', image.size, 0.1, 1.2),
+                                   self.target_bbox, opts['n_pos_init'], opts['overlap_pos_init'])
+
+        neg_examples = np.concatenate([
+            gen_samples(SampleGenerator('uniform', image.size, 1, 2, 1.1),
+                        self.target_bbox, opts['n_neg_init'] // 2, opts['overlap_neg_init']),
+            gen_samples(SampleGenerator('whole', image.size, 0, 1.2, 1.1),
+                        self.target_bbox, opts['n_neg_init'] // 2, opts['overlap_neg_init'])])
+        neg_examples = np.random.permutation(neg_examples)
+
+        # Extract pos/neg features
+        if init_feats is not None:
+            pos_feats, neg_feats = init_feats
+        else:
+            if self.verbose:
+                print('       extracting features from BB samples...')
+            if n_init is not None:  # shorter run in general, less accurate
+                pos_feats = forward_samples(self.model, image, pos_examples[:n_init[0]])
+                neg_feats = forward_samples(self.model, image, neg_examples[:n_init[1]])
+            else:
+                pos_feats = forward_samples(self.model, image, pos_examples)
+                neg_feats = forward_samples(self.model, image, neg_examples)
+            if self.verbose:
+                print('       finished extracting features from BB samples.')
+        self.pos_feats = pos_feats
+        self.neg_feats = neg_feats
+
+        ######################
+        # Extract pos/neg IoUs
+        if self.loss_index == 2:
+            pos_ious = overlap_ratio(pos_examples, self.target_bbox)
+            neg_ious = overlap_ratio(neg_examples, self.target_bbox)
+        ######################
+
+        # Initial training
+        if self.verbose:
+            print('       first training pass on FC layers...')
+        if self.loss_index == 2:
+            train(self.model, self.criterion, init_optimizer, pos_feats, neg_feats, opts['maxiter_init'], \
+                  pos_ious=pos_ious, neg_ious=neg_ious, loss_index=self.loss_index)
+        else:
+            train(self.model, self.criterion, init_optimizer, pos_feats, neg_feats, opts['maxiter_init'], \
+                  loss_index=self.loss_index)
+        if self.verbose:
+            print('       finished first training pass on FC layers.')
+
+        # Init sample generators
+        # sample_generator - for tracking
+        # pos_generator, neg_generator - for online re-training
+        self.sample_generator = SampleGenerator('gaussian', image.size, opts['trans_f'], opts['scale_f'], valid=True)
+        self.pos_generator = SampleGenerator('gaussian', image.size, 0.1, 1.2)
+        self.neg_generator = SampleGenerator('uniform', image.size, 1.5, 1.2)
+
+        # Init pos/neg feature banks for update (with pos/neg ious for loss_index == 2)
+        # positives are kept for n_frames_long frames, of which the short term update reads the last n_frames_short
+        self.pos_bank = FeatureBank(opts['n_frames_long'], opts['n_pos_update'], window=opts['n_frames_short'],
+                                    with_ious=(self.loss_index == 2))
+        self.neg_bank = FeatureBank(opts['n_frames_short'], opts['n_neg_update'], with_ious=(self.loss_index == 2))
+        if self.loss_index == 2:
+            self.pos_bank.append(pos_feats[:opts['n_pos_update']], pos_ious[:opts['n_pos_update']])
+            self.neg_bank.append(neg_feats[:opts['n_neg_update']], neg_ious[:opts['n_neg_update']])
+        else:
+            self.pos_bank.append(pos_feats[:opts['n_pos_update']])
+            self.neg_bank.append(neg_feats[:opts['n_neg_update']])
+
+        # Online updates either inline, or in a background thread (opts['async_update'])
+        if opts['async_update']:
+            self.updater = AsyncUpdater(self.model, self.criterion, lr=opts['lr_update'],
+                                        maxiter=opts['maxiter_update'], layers=opts['ft_layers'],
+                                        loss_index=self.loss_index)
+
+    def update(self, image):
+        # tracks the next frame, returns the (bbox regressed) target bbox
+        self.track(image)
+        self.learn()
+        return self.bbreg_bbox
+
+    def track(self, image):
+        # given the next frame,
+        # we take BB estimation ('target_bbox') we made in the previous frame
+        # we generate BB samples around it and forward through CNN+FC+new_head('fc6')
+        # the new 'target_bbox' is the average (per coordinate) of top 5 samples (based on 'fc6' scores[1])
+        # success is defined if the mean score[1] of those top 5 BBs passes some threshold
+        # if "success", bbox regression of those top 5 BBs gives 'bbreg_bbox'
+        # otherwise the previous results are kept
+        self.frame_id += 1
+        self.image = image
+        self.feature_cache.new_frame(self.frame_id, image)
+
+        # weights of a finished background update are used from this frame on
+        self.staleness = self.updater.swap(self.frame_id) if self.updater is not None else None
+        self.frame_staleness.append(self.staleness)
+        # (int8 fc layers of the weights trained since the previous frame)
+        self.model.refresh_quantized()
+
+        previous_bbox = self.target_bbox
+        target_bbox = self.target_bbox
+        try_again = True
+        while try_again:
+            # Estimate target bbox
+            with stage_timer.stage('gen_samples'):
+                if self.sample_generator.get_trans_f() == opts['trans_f_expand']:
+                    samples = gen_samples(self.sample_generator, target_bbox, 2*opts['n_samples'])
+                else:
+                    samples = gen_samples(self.sample_generator, target_bbox, opts['n_samples'])
+            sample_scores = self.frame_features(samples, out_layer='fc6', roi=opts['roi_scoring'])
+            with stage_timer.stage('topk'):
+                top_scores, top_idx = sample_scores[:, 1].topk(5)
+                top_idx = top_idx.cpu().numpy()
+                target_score = top_scores.mean()
+                target_bbox = samples[top_idx].mean(axis=0)
+
+            if self.sample_generator.get_trans_f() == opts['trans_f_expand']:
+                try_again = False
+
+            success = target_score > opts['success_thr']
+            # Expand search area at failure
+            if success:
+                self.sample_generator.set_trans_f(opts['trans_f'])
+                try_again = False
+            else:
+                self.sample_generator.set_trans_f(opts['trans_f_expand'])
+
+        self.samples = samples
+        self.top_idx = top_idx
+        self.target_score = target_score
+        self.success = success
+
+        if success:
+            # Bbox regression
+            self.target_bbox = target_bbox
+            if self.use_bbreg:
+                with stage_timer.stage('bbreg'):
+                    bbreg_samples = samples[top_idx]
+                    bbreg_feats = self.frame_features(bbreg_samples)
+                    bbreg_samples = self.bbreg.predict(bbreg_feats, bbreg_samples)
+                    self.bbreg_bbox = bbreg_samples.mean(axis=0)
+            else:
+                self.bbreg_bbox = target_bbox
+        else:
+            # Copy previous result at failure
+            self.target_bbox = previous_bbox
+            if not self.use_bbreg:
+                self.bbreg_bbox = previous_bbox
+
+        return self.bbreg_bbox
+
+    def learn(self):
+        # if "success", we generate new positive and negative BB samples around the new 'target_bbox'
+        # and record their output features ('conv3')
+        # the recorded history of positive samples is longer (100 frames) then of negative samples (20 frames)
+        #
+        # updates:
+        # long-term - if success happenned on a modulo 10 frame, we perform update using all available
+        #       positive and negative features recorded
+        # short-term - if not success, we perform similar update routine using all available negative features
+        #       but limit the number of positive features
+
+        # Data collect
+        if self.success:
+            with stage_timer.stage('collect'):
+                # Draw pos/neg samples
+                with stage_timer.stage('gen_samples'):
+                    pos_examples = gen_samples(self.pos_generator, self.target_bbox,
+                                               opts['n_pos_update'],
+                                               opts['overlap_pos_update'])
+                    neg_examples = gen_samples(self.neg_generator, self.target_bbox,
+                                               opts['n_neg_update'],
+                                               opts['overlap_neg_update'])
+
+                # Extract pos/neg features
+                pos_feats = self.frame_features(pos_examples)
+                neg_feats = self.frame_features(neg_examples)
+
+                ######################
+                # Extract pos/neg IoUs
+                if self.loss_index == 2:
+                    # we could also try to use bbreg_bbox instead of target_bbox  ????????????????????????????????????????
+                    pos_ious = overlap_ratio(pos_examples, self.target_bbox)
+                    neg_ious = overlap_ratio(neg_examples, self.target_bbox)
+                    self.pos_bank.append(pos_feats, pos_ious)
+                    self.neg_bank.append(neg_feats, neg_ious)
+                ######################
+                else:
+                    self.pos_bank.append(pos_feats)
+                    self.neg_bank.append(neg_feats)
+
+            if self.use_bbreg and opts['bbreg_update']:
+                with stage_timer.stage('bbreg-update'):
+                    self.bbreg.update(pos_feats, pos_examples, self.target_bbox)
+
+        # Short term update
+        if not self.success:
+            # views into the banks, no copy (unless a frame has fewer samples)
+            pos_data, pos_iou_data = self.pos_bank.last(opts['n_frames_short'])
+            neg_data, neg_iou_data = self.neg_bank.all()
+            if self.verbose:
+                print('      short term update')
+            self.num_short_updates += 1
+            with stage_timer.stage('short-update'):
+                self.train_update(pos_data, neg_data, pos_iou_data, neg_iou_data)
+
+        # Long term update
+        elif self.frame_id % opts['long_interval'] == 0:
+            pos_data, pos_iou_data = self.pos_bank.all()
+            neg_data, neg_iou_data = self.neg_bank.all()
+            if self.verbose:
+                print('      long term update')
+            with stage_timer.stage('long-update'):
+                self.train_update(pos_data, neg_data, pos_iou_data, neg_iou_data)
+
+        self.feature_cache.end_frame()
+
+    def train_update(self, pos_data, neg_data, pos_iou_data, neg_iou_data):
+        if self.updater is not None:
+            self.updater.submit(self.frame_id, pos_data, neg_data, pos_iou_data, neg_iou_data)
+        elif self.loss_index == 2:
+            train(self.model, self.criterion, self.update_optimizer, pos_data, neg_data, opts['maxiter_update'], \
+                  pos_ious=pos_iou_data, neg_ious=neg_iou_data, loss_index=self.loss_index)
+        else:
+            train(self.model, self.criterion, self.update_optimizer, pos_data, neg_data, opts['maxiter_update'], \
+                  loss_index=self.loss_index)
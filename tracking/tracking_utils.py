@@ -4,54 +4,238 @@ import torch.optim as optim
 import sys
 sys.path.append("..")
 from modules.utils import *
+from modules.stage_timer import *
 
 import torch.nn as nn
+import torch.nn.functional as F
 import numpy as np
 
 import tracking.options as options
 opts = options.tracking_opts
 
 
-def forward_regions(model, regions, out_layer='conv3', is_cuda=opts['use_gpu']):
+def forward_regions(model, regions, out_layer='conv3', is_cuda=None):
+    # is_cuda - None: options.use_gpu() (here and below)
+    if is_cuda is None:
+        is_cuda = options.use_gpu()
     model.eval()
     # regions = Variable(regions)
     if is_cuda:
         regions = regions.cuda()
-    feat = model(regions, out_layer=out_layer)
-    feats = feat.data.clone()
-
-
-    # for i, regions in enumerate(regions):
-    #     # if regions.requires_grad:
-    #     #     print('requires grad')
-    #     regions = Variable(regions)
-    #     if is_cuda:
-    #     # if opts['use_gpu']:
-    #         regions = regions.cuda()
-    #     feat = model(regions, out_layer=out_layer)
-    #     if i == 0:
-    #         feats = feat.data.clone()
-    #     else:
-    #         feats = torch.cat((feats, feat.data.clone()), 0)
+    with torch.inference_mode():
+        feat = model(regions, out_layer=out_layer)
+    # cloned outside inference mode, so callers get a regular tensor
+    feats = feat.clone()
+    return feats
+
+
+def forward_samples(model, image, samples, out_layer='conv3', is_cuda=None):
+    feats, = forward_samples_layers(model, image, samples, [out_layer], is_cuda)
     return feats
 
 
-def forward_samples(model, image, samples, out_layer='conv3', is_cuda=opts['use_gpu']):
+def forward_samples_all(model, image, samples, is_cuda=None):
+    # like forward_samples, but returns both conv3 features and fc6 scores of one pass
+    return forward_samples_layers(model, image, samples, ['conv3', 'fc6'], is_cuda)
+
+
+def forward_samples_layers(model, image, samples, out_layers, is_cuda=None):
+    # crop and forward samples batch by batch, without autograd
+    # out_layers - returned layers, in forward order (e.g. ['conv3', 'fc6'])
+    # each batch is written into one output tensor per layer, allocated once from len(samples)
+    if is_cuda is None:
+        is_cuda = options.use_gpu()
     model.eval()
-    extractor = RegionExtractor(image, samples, opts['img_size'], opts['padding'], opts['batch_test'])
-    for i, regions in enumerate(extractor):
-        # if regions.requires_grad:
-        #     print('requires grad')
-        regions = Variable(regions)
+    extractor = RegionExtractor(image, samples, opts['img_size'], opts['padding'], opts['batch_test'],
+                                batched=opts['batched_crop'])
+    if opts['prefetch_batches'] > 0 and len(samples) > opts['batch_test']:
+        # crop the next batches while the model runs on the current one
+        extractor = RegionPrefetcher(extractor, opts['prefetch_batches'], opts['crop_workers'])
+    outputs = None
+    start = 0
+    batches = iter(extractor)
+    with torch.inference_mode():
+        while True:
+            # (with prefetching, only the wait for a batch cropped in the background)
+            with stage_timer.stage('crop'):
+                regions = next(batches, None)
+            if regions is None:
+                break
+            with stage_timer.stage('forward'):
+                if is_cuda:
+                    regions = regions.cuda()
+                feats = []
+                feat, in_layer = regions, 'conv1'
+                for out_layer in out_layers:
+                    feat = model(feat, in_layer=in_layer, out_layer=out_layer)
+                    feats.append(feat)
+                    in_layer = next_layer(out_layer)
+
+                if outputs is None:
+                    # regular (not inference) tensors, so callers may train on them or modify them in-place
+                    with torch.inference_mode(False):
+                        outputs = [feat.new_empty((len(samples),) + feat.shape[1:]) for feat in feats]
+                for output, feat in zip(outputs, feats):
+                    output[start:start + len(feat)] = feat
+            start += len(regions)
+
+    if outputs is None:
+        # no samples - (0, ...) outputs of each layer, from an empty batch (the layer shapes and device of the model)
+        regions = torch.zeros((0, 3, opts['img_size'], opts['img_size']))
         if is_cuda:
-        # if opts['use_gpu']:
             regions = regions.cuda()
-        feat = model(regions, out_layer=out_layer)
-        if i == 0:
-            feats = feat.data.clone()
-        else:
-            feats = torch.cat((feats, feat.data.clone()), 0)
-    return feats
+        outputs = []
+        feat, in_layer = regions, 'conv1'
+        with torch.no_grad():
+            for out_layer in out_layers:
+                feat = model(feat, in_layer=in_layer, out_layer=out_layer)
+                outputs.append(feat)
+                in_layer = next_layer(out_layer)
+    return outputs
+
+
+def next_layer(layer):
+    # MDNet layer that follows a given layer (None after the last one)
+    layers = ['conv1', 'conv2', 'conv3', 'fc4', 'fc5', 'fc6']
+    if layer not in layers[:-1]:
+        return None
+    return layers[layers.index(layer) + 1]
+
+
+class FeatureCache():
+    # per-frame memo of forward_samples results, keyed by (frame id, quantized bbox, layer)
+    # a conv3 miss is forwarded up to conv3 only, an fc6 miss keeps both its conv3 features and fc6 scores,
+    # fc6 of a sample whose conv3 features are kept only runs the fc layers
+    # the weights must not change within a frame (the tracker trains after its last lookup of the frame)
+    #
+    # roi=True scores with forward_samples_roi, kept apart ('fc6-roi') as its pooled features differ from those
+    # of the crops
+    def __init__(self, model, quantum=opts['cache_quantum'], is_cuda=None):
+        self.model = model
+        self.quantum = quantum
+        self.is_cuda = options.use_gpu() if is_cuda is None else is_cuda
+
+        self.frame_id = None
+        self.image = None
+        self.memo = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def new_frame(self, frame_id, image):
+        self.end_frame()
+        self.frame_id = frame_id
+        self.image = image
+
+    def end_frame(self):
+        self.frame_id = None
+        self.image = None
+        self.memo = {}
+
+    def bbox_keys(self, samples):
+        quantized = np.round(np.asarray(samples, dtype='float64') / self.quantum).astype(np.int64)
+        return [(self.frame_id, tuple(bbox)) for bbox in quantized.tolist()]
+
+    def get(self, samples, layer='conv3', roi=False):
+        samples = np.asarray(samples).reshape(-1, 4)
+        keys = self.bbox_keys(samples)
+        memo_layer = layer + '-roi' if roi else layer
+
+        missing = [i for i, key in enumerate(keys) if key + (memo_layer,) not in self.memo]
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+
+        if roi:
+            if len(missing) > 0:
+                feats = forward_samples_roi(self.model, self.image, samples[missing], out_layer=layer, is_cuda=self.is_cuda)
+                for j, i in enumerate(missing):
+                    self.memo[keys[i] + (memo_layer,)] = feats[j]
+
+        elif layer == 'fc6':
+            # scores whose conv3 features are still cached only need the fc layers
+            head_only = [i for i in missing if keys[i] + ('conv3',) in self.memo]
+            if len(head_only) > 0:
+                feats = torch.stack([self.memo[keys[i] + ('conv3',)] for i in head_only])
+                self.model.eval()
+                with stage_timer.stage('forward'), torch.no_grad():
+                    scores = self.model(feats, in_layer='fc4', out_layer='fc6')
+                for j, i in enumerate(head_only):
+                    self.memo[keys[i] + ('fc6',)] = scores[j]
+                missing = [i for i in missing if keys[i] + ('fc6',) not in self.memo]
+
+            if len(missing) > 0:
+                feats, scores = forward_samples_all(self.model, self.image, samples[missing], is_cuda=self.is_cuda)
+                for j, i in enumerate(missing):
+                    self.memo[keys[i] + ('conv3',)] = feats[j]
+                    self.memo[keys[i] + ('fc6',)] = scores[j]
+
+        elif len(missing) > 0:
+            feats = forward_samples(self.model, self.image, samples[missing], out_layer=layer, is_cuda=self.is_cuda)
+            for j, i in enumerate(missing):
+                self.memo[keys[i] + (layer,)] = feats[j]
+
+        return torch.stack([self.memo[key + (memo_layer,)] for key in keys])
+
+
+# MDNet conv3: cell c of the feature map is centered on input pixel conv3_offset + conv3_stride * c
+conv3_stride = 16
+conv3_offset = 37
+
+
+def forward_samples_roi(model, image, samples, out_layer='fc6', is_cuda=None):
+    # shared-convolution alternative to forward_samples:
+    # conv1-conv3 run once over a search window covering all samples, rescaled so that a sample
+    # comes out at about img_size, then the 3x3 conv3 cells of each sample are bilinearly pooled
+    # from the window feature map (RoIAlign-style) and forwarded from fc4 onwards
+    if is_cuda is None:
+        is_cuda = options.use_gpu()
+    model.eval()
+    img_size = opts['img_size']
+    samples = np.asarray(samples, dtype='float32')
+
+    # crop windows of the samples, as crop_image would take them (padding included)
+    boxes = crop_boxes(samples, img_size, opts['padding'])
+    crop_w = np.maximum(boxes[:, 2] - boxes[:, 0], 1)
+    crop_h = np.maximum(boxes[:, 3] - boxes[:, 1], 1)
+
+    # search window - union of all crops, one scale for all (candidates vary only slightly in scale)
+    window = np.array([boxes[:, 0].min(), boxes[:, 1].min(), boxes[:, 2].max(), boxes[:, 3].max()])
+    window_w = int(round((window[2] - window[0]) * img_size / np.median(crop_w)))
+    window_h = int(round((window[3] - window[1]) * img_size / np.median(crop_h)))
+    if max(window_w, window_h) > opts['roi_max_window']:
+        return forward_samples(model, image, samples, out_layer=out_layer, is_cuda=is_cuda)
+    scale_x = window_w / (window[2] - window[0])
+    scale_y = window_h / (window[3] - window[1])
+
+    with stage_timer.stage('crop'):
+        regions = crop_windows(image_to_tensor(np.asarray(image)), window[None, :], window_w, window_h)
+    if is_cuda:
+        regions = regions.cuda()
+    with stage_timer.stage('forward'), torch.no_grad():
+        feat_map = model.forward_feature_map(regions)
+    map_h, map_w = feat_map.shape[2:]
+
+    # conv3 cell centers of every sample crop -> image coordinates -> window feature map coordinates
+    n_cells = (img_size - 2 * conv3_offset) // conv3_stride + 1
+    cells = conv3_offset + conv3_stride * np.arange(n_cells) + 0.5
+    x = boxes[:, 0, None] + cells * crop_w[:, None] / img_size - 0.5
+    y = boxes[:, 1, None] + cells * crop_h[:, None] / img_size - 0.5
+    x = ((x + 0.5 - window[0]) * scale_x - 0.5 - conv3_offset) / conv3_stride
+    y = ((y + 0.5 - window[1]) * scale_y - 0.5 - conv3_offset) / conv3_stride
+
+    # grid_sample grid, normalized to [-1,1], all samples stacked vertically (N*3 x 3)
+    grid = np.empty((len(samples), n_cells, n_cells, 2), dtype='float32')
+    grid[:, :, :, 0] = (2 * x / (map_w - 1) - 1)[:, None, :]
+    grid[:, :, :, 1] = (2 * y / (map_h - 1) - 1)[:, :, None]
+    grid = torch.from_numpy(grid).to(feat_map.device).view(1, -1, n_cells, 2)
+
+    with stage_timer.stage('forward'), torch.no_grad():
+        feats = F.grid_sample(feat_map, grid, mode='bilinear', padding_mode='border', align_corners=True)
+        feats = feats.view(feat_map.shape[1], len(samples), n_cells, n_cells).transpose(0, 1)
+        feats = feats.reshape(len(samples), -1)
+        if out_layer == 'conv3':
+            return feats
+        return model(feats, in_layer='fc4', out_layer=out_layer)
 
 
 def set_optimizer(model, lr_base, lr_mult=opts['lr_mult'], momentum=opts['momentum'], w_decay=opts['w_decay']):
@@ -67,67 +251,53 @@ def set_optimizer(model, lr_base, lr_mult=opts['lr_mult'], momentum=opts['moment
     return optimizer
 
 
+def train_schedule(n, batch_size, maxiter, rng=None):
+    # maxiter x batch_size sample indices, consecutive random permutations of range(n) as in the
+    # original trainer, drawn at once (numpy rng, so np.random.seed still controls training)
+    # rng - a np.random.Generator to draw from instead of the global rng (e.g. of a background thread)
+    reps = -(-batch_size * maxiter // n)
+    draws = np.random.rand(reps, n) if rng is None else rng.random((reps, n))
+    idx = draws.argsort(axis=1).reshape(-1)
+    return idx[:batch_size * maxiter].reshape(maxiter, batch_size)
+
+
 def train(model, criterion, optimizer, pos_feats, neg_feats, maxiter, in_layer='fc4',
-          pos_ious=[], neg_ious=[], loss_index=1):
+          pos_ious=[], neg_ious=[], loss_index=1, rng=None):
     model.train()
 
     batch_pos = opts['batch_pos']
     batch_neg = opts['batch_neg']
-    batch_test = opts['batch_test']
     batch_neg_cand = max(opts['batch_neg_cand'], batch_neg)
 
-    pos_idx = np.random.permutation(pos_feats.size(0))
-    neg_idx = np.random.permutation(neg_feats.size(0))
-    while len(pos_idx) < batch_pos * maxiter:
-        pos_idx = np.concatenate([pos_idx, np.random.permutation(pos_feats.size(0))])
-    while len(neg_idx) < batch_neg_cand * maxiter:
-        neg_idx = np.concatenate([neg_idx, np.random.permutation(neg_feats.size(0))])
-    pos_pointer = 0
-    neg_pointer = 0
-
-    for iter in range(maxiter):
+    # whole index schedule up front, moved to the device once
+    pos_idx = train_schedule(pos_feats.size(0), batch_pos, maxiter, rng)
+    neg_idx = train_schedule(neg_feats.size(0), batch_neg_cand, maxiter, rng)
+    pos_idx_t = torch.from_numpy(pos_idx).to(pos_feats.device)
+    neg_idx_t = torch.from_numpy(neg_idx).to(neg_feats.device)
 
-        # select pos idx
-        pos_next = pos_pointer + batch_pos
-        pos_cur_idx = pos_idx[pos_pointer:pos_next]
-        pos_cur_idx = pos_feats.new(pos_cur_idx).long()
-        pos_pointer = pos_next
+    # the target is the same every iteration
+    target = torch.cat((torch.ones(batch_pos, dtype=torch.long),
+                        torch.zeros(batch_neg, dtype=torch.long))).to(pos_feats.device)
 
-        # select neg idx
-        neg_next = neg_pointer + batch_neg_cand
-        neg_cur_idx = neg_idx[neg_pointer:neg_next]
-        neg_cur_idx = neg_feats.new(neg_cur_idx).long()
-        neg_pointer = neg_next
+    for iter in range(maxiter):
 
         # create batch
-        batch_pos_feats = Variable(pos_feats.index_select(0, pos_cur_idx))
-        batch_neg_feats = Variable(neg_feats.index_select(0, neg_cur_idx))
+        batch_pos_feats = pos_feats.index_select(0, pos_idx_t[iter])
+        batch_neg_feats = neg_feats.index_select(0, neg_idx_t[iter])
 
         #####################
         if loss_index == 2:
-            # print(type(pos_ious))
-            # print(pos_ious[0])
-            # print(type(pos_cur_idx.cpu()))
-            # print(pos_cur_idx.cpu()[0])
-            # print(pos_ious[pos_cur_idx.cpu()][0])
-            # print('============')
-            batch_pos_ious = pos_ious[pos_cur_idx.cpu()]
-            batch_neg_ious = neg_ious[neg_cur_idx.cpu()]
+            batch_pos_ious = pos_ious[pos_idx[iter]]
+            batch_neg_ious = neg_ious[neg_idx[iter]]
         #####################
 
-        # hard negative mining
+        # hard negative mining, all candidates in a single forward
         if batch_neg_cand > batch_neg:
             model.eval()
-            for start in range(0, batch_neg_cand, batch_test):
-                end = min(start + batch_test, batch_neg_cand)
-                score = model(batch_neg_feats[start:end], in_layer=in_layer)
-                if start == 0:
-                    neg_cand_score = score.data[:, 1].clone()
-                else:
-                    neg_cand_score = torch.cat((neg_cand_score, score.data[:, 1].clone()), 0)
-
+            with torch.no_grad():
+                neg_cand_score = model(batch_neg_feats, in_layer=in_layer)[:, 1]
             _, top_idx = neg_cand_score.topk(batch_neg)
-            batch_neg_feats = batch_neg_feats.index_select(0, Variable(top_idx))
+            batch_neg_feats = batch_neg_feats.index_select(0, top_idx)
             model.train()
 
         #####################
@@ -137,22 +307,9 @@ def train(model, criterion, optimizer, pos_feats, neg_feats, maxiter, in_layer='
         #####################
 
         # forward
-        pos_score = model(batch_pos_feats, in_layer=in_layer)
-        neg_score = model(batch_neg_feats, in_layer=in_layer)
-
-        score = torch.cat((pos_score,neg_score),dim=0)
-
-        pos_target = np.ones(pos_score.shape[0], dtype=int)
-        neg_target = np.zeros(neg_score.shape[0], dtype=int)
-        target = np.hstack((pos_target,neg_target))
-        target = torch.from_numpy(target)
-        target = Variable(target)
-
-        if opts['use_gpu']:
-            target = target.cuda()
+        score = model(torch.cat((batch_pos_feats, batch_neg_feats), 0), in_layer=in_layer)
 
         # optimize
-
         loss = criterion(score, target)
 
         ##########################
@@ -161,17 +318,12 @@ def train(model, criterion, optimizer, pos_feats, neg_feats, maxiter, in_layer='
             neg_ious_loss = -0.5 * np.power(1 - batch_neg_ious, 2) * np.log(batch_neg_ious)
             ious_loss = np.sum(pos_ious_loss) + np.sum(neg_ious_loss)
 
-            # print(ious_loss)
-            # print(loss)
-
             loss = 0.5*(loss+ious_loss)
         ##########################
 
         model.zero_grad()
         loss.backward()
-        # torch.nn.utils.clip_grad_norm(model.parameters(), opts['grad_clip'])
         torch.nn.utils.clip_grad_norm_(model.parameters(), opts['grad_clip'])
         optimizer.step()
 
         # print "Iter %d, Loss %.4f" % (iter, loss.data[0])
-